@@ -0,0 +1,284 @@
+#!/usr/bin/python3 -u
+
+"""
+Benchmarks of zebr0-script at scale, against a local zebr0.TestServer (no network needed).
+
+usage: python3 benchmarks/benchmark.py [-h] [-s <factor>] [-n <count>] [-o <path>] [-b <path>] [-t <ratio>] [<name> ...]
+
+Each benchmark is run several times on synthetic scripts and reports, and its best and median times are printed as json.
+With a baseline (a previous output), the script exits with an error if a benchmark got slower than its baseline's best time by more than the tolerance.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import zebr0
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # benchmarks the working tree, not an installed version
+import zebr0_script  # noqa: E402
+
+URL = "http://localhost:8000"
+REPEAT_DEFAULT = 5
+SCALE_DEFAULT = 1.0
+TOLERANCE_DEFAULT = 0.2
+
+BENCHMARKS: Dict[str, Callable[["Context"], Callable[[], None]]] = {}
+
+
+class Context:
+    """
+    What a benchmark needs: the test server, a client to it, a scratch directory and the scale factor.
+    """
+
+    def __init__(self, server: zebr0.TestServer, path: Path, scale: float) -> None:
+        self.server = server
+        self.client = zebr0.Client(URL, configuration_file=Path(""))
+        self.path = path
+        self.scale = scale
+
+    def size(self, size: int) -> int:
+        return max(int(size * self.scale), 1)
+
+    def directory(self, name: str) -> Path:
+        return Path(tempfile.mkdtemp(prefix=name + "-", dir=self.path))
+
+
+def benchmark(function: Callable[[Context], Callable[[], None]]) -> Callable[[Context], Callable[[], None]]:
+    """
+    Registers a benchmark: a function that prepares the data and returns the operation to time.
+    """
+
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def wide_script(ctx: Context, tasks: int) -> None:
+    ctx.server.data = {"script": [f"echo task {i}" for i in range(ctx.size(tasks))]}
+
+
+def tree_script(ctx: Context, depth: int, width: int, tasks: int) -> None:
+    """
+    A script including "width" scripts, each including "width" scripts, and so on "depth" times, each with "tasks" tasks of its own.
+    """
+
+    data = {}
+
+    def build(key: str, level: int) -> None:
+        data[key] = [f"echo {key} task {i}" for i in range(tasks)]
+        if level < depth:
+            for i in range(width):
+                child = f"{key}.{i}"
+                data[key].append({"include": child})
+                build(child, level + 1)
+
+    build("script", 1)
+    ctx.server.data = data
+
+
+def fetch(ctx: Context, reports_path: Path, prefetch: int = 1) -> Callable[[], None]:
+    return lambda: sum(1 for _ in zebr0_script.recursive_fetch_script(ctx.client, "script", reports_path, prefetch))
+
+
+def quiet(function: Callable[..., None], *args, **kwargs) -> Callable[[], None]:
+    def run() -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(*args, **kwargs)
+
+    return run
+
+
+def write_reports(reports_path: Path, count: int) -> None:
+    store = zebr0_script.open_store(reports_path)
+    for i in range(count):
+        report = {"command": f"echo task {i}", "status": zebr0_script.Status.SUCCESS if i % 10 else zebr0_script.Status.FAILURE, "output": [f"line {j}" for j in range(20)]}
+        store.write(reports_path.joinpath(f"{i:032x}"), report, "script")
+
+
+@benchmark
+def fetch_wide(ctx: Context) -> Callable[[], None]:
+    wide_script(ctx, 5000)
+    return fetch(ctx, ctx.directory("reports"))
+
+
+@benchmark
+def fetch_deep(ctx: Context) -> Callable[[], None]:
+    tree_script(ctx, ctx.size(200), 1, 10)
+    return fetch(ctx, ctx.directory("reports"))
+
+
+@benchmark
+def fetch_tree(ctx: Context) -> Callable[[], None]:
+    tree_script(ctx, 3, max(int(12 * ctx.scale ** 0.5), 1), 20)
+    return fetch(ctx, ctx.directory("reports"))
+
+
+@benchmark
+def fetch_tree_prefetch(ctx: Context) -> Callable[[], None]:
+    tree_script(ctx, 3, max(int(12 * ctx.scale ** 0.5), 1), 20)
+    return fetch(ctx, ctx.directory("reports"), 8)
+
+
+@benchmark
+def fetch_json(ctx: Context) -> Callable[[], None]:
+    ctx.server.data = {"script": json.dumps([{"command": f"echo task {i}", "attempts": 2} for i in range(ctx.size(5000))])}
+    return fetch(ctx, ctx.directory("reports"))
+
+
+@benchmark
+def status_lookup(ctx: Context) -> Callable[[], None]:
+    wide_script(ctx, 5000)
+    reports_path = ctx.directory("reports")
+    for task, _, report_path in zebr0_script.recursive_fetch_script(ctx.client, "script", reports_path):
+        zebr0_script.open_store(reports_path).write(report_path, {"command": task, "status": zebr0_script.Status.SUCCESS, "output": []}, "script")
+    return fetch(ctx, reports_path)
+
+
+@benchmark
+def show(ctx: Context) -> Callable[[], None]:
+    wide_script(ctx, 5000)
+    return quiet(zebr0_script.show, URL, [], 0, Path(""), ctx.directory("reports"), "script")
+
+
+@benchmark
+def run_noop(ctx: Context) -> Callable[[], None]:
+    ctx.server.data = {"script": [f"true {i}" for i in range(ctx.size(200))]}
+
+    def run() -> None:
+        quiet(zebr0_script.run, URL, [], 0, Path(""), ctx.directory("reports"), "script")()  # every task is pending
+
+    return run
+
+
+@benchmark
+def run_noop_persistent_shell(ctx: Context) -> Callable[[], None]:
+    ctx.server.data = {"script": [f"true {i}" for i in range(ctx.size(200))]}
+
+    def run() -> None:
+        quiet(zebr0_script.run, URL, [], 0, Path(""), ctx.directory("reports"), "script", persistent_shell=True)()
+
+    return run
+
+
+@benchmark
+def run_noop_journal(ctx: Context) -> Callable[[], None]:
+    ctx.server.data = {"script": [f"true {i}" for i in range(ctx.size(200))]}
+
+    def run() -> None:
+        reports_path = ctx.directory("reports")
+        reports_path.joinpath(".journal").touch()  # the journal backend
+        quiet(zebr0_script.run, URL, [], 0, Path(""), reports_path, "script", journal_fsync=zebr0_script.Fsync.NEVER)()
+
+    return run
+
+
+@benchmark
+def run_skip(ctx: Context) -> Callable[[], None]:
+    wide_script(ctx, 5000)
+    reports_path = ctx.directory("reports")
+    quiet(zebr0_script.run, URL, [], 0, Path(""), reports_path, "script")()
+    return quiet(zebr0_script.run, URL, [], 0, Path(""), reports_path, "script")  # every task is skipped
+
+
+@benchmark
+def execute_large_output(ctx: Context) -> Callable[[], None]:
+    return quiet(zebr0_script.execute, f"seq 1 {ctx.size(1000000)}", output_tail=100)
+
+
+@benchmark
+def fetch_to_disk_large(ctx: Context) -> Callable[[], None]:
+    ctx.server.data = {"large": ("x" * 127 + "\n") * ctx.size(160000)}  # 20 MB
+    target = ctx.directory("target").joinpath("large")
+    return lambda: zebr0_script.fetch_to_disk(ctx.client, "large", target)
+
+
+@benchmark
+def log(ctx: Context) -> Callable[[], None]:
+    reports_path = ctx.directory("reports")
+    write_reports(reports_path, ctx.size(10000))
+    zebr0_script.open_store(reports_path).load_index()  # the first load compacts the index
+    return quiet(zebr0_script.log, reports_path)
+
+
+@benchmark
+def log_filtered(ctx: Context) -> Callable[[], None]:
+    reports_path = ctx.directory("reports")
+    write_reports(reports_path, ctx.size(10000))
+    zebr0_script.open_store(reports_path).load_index()
+    return quiet(zebr0_script.log, reports_path, status=zebr0_script.Status.FAILURE, limit=10)
+
+
+def measure(operation: Callable[[], None], repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+    return {"best": round(min(times), 6), "median": round(statistics.median(times), 6), "repeat": repeat}
+
+
+def run_benchmarks(names: List[str], scale: float, repeat: int) -> Iterator[tuple]:
+    with zebr0.TestServer() as server, tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            ctx = Context(server, Path(tmp), scale)
+            yield name, measure(BENCHMARKS[name](ctx), repeat)
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    :return: the regressions, as messages
+    """
+
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            ratio = result.get("best") / baseline.get(name).get("best")
+            if ratio > 1 + tolerance:
+                regressions.append(f"{name}: {result.get('best'):.3f}s instead of {baseline.get(name).get('best'):.3f}s (x{ratio:.2f})")
+    return regressions
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    argparser = argparse.ArgumentParser(description="Benchmarks of zebr0-script at scale, against a local zebr0.TestServer.")
+    argparser.add_argument("names", nargs="*", default=list(BENCHMARKS), help="the benchmarks to run, defaults to all of them", metavar="<name>")
+    argparser.add_argument("-s", "--scale", type=float, default=SCALE_DEFAULT, help=f"factor applied to the size of the synthetic data, defaults to {SCALE_DEFAULT}", metavar="<factor>")
+    argparser.add_argument("-n", "--repeat", type=int, default=REPEAT_DEFAULT, help=f"number of runs of each benchmark, defaults to {REPEAT_DEFAULT}", metavar="<count>")
+    argparser.add_argument("-o", "--output", type=Path, help="path to the json file the results are written to, in addition to the standard output", metavar="<path>")
+    argparser.add_argument("-b", "--baseline", type=Path, help="path to the json results of a previous run to compare to", metavar="<path>")
+    argparser.add_argument("-t", "--tolerance", type=float, default=TOLERANCE_DEFAULT, help=f"slowdown ratio tolerated before reporting a regression, defaults to {TOLERANCE_DEFAULT}", metavar="<ratio>")
+    args = argparser.parse_args(args)
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        argparser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}, choose from {', '.join(BENCHMARKS)}")
+
+    results = {}
+    for name, result in run_benchmarks(args.names, args.scale, args.repeat):
+        print(f"{name}: {result.get('best'):.3f}s best, {result.get('median'):.3f}s median", file=sys.stderr)
+        results[name] = result
+
+    output = json.dumps({"python": platform.python_version(), "scale": args.scale, "results": results}, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output)
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("scale") != args.scale:
+            print(f"warning: the baseline was measured at scale {baseline.get('scale')}", file=sys.stderr)
+        regressions = compare(results, baseline.get("results"), args.tolerance)
+        if regressions:
+            print("regressions:", *regressions, sep="\n", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
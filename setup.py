@@ -28,5 +28,8 @@ setuptools.setup(
     install_requires=[
         "zebr0",
         "PyYAML"
-    ]
+    ],
+    extras_require={
+        "zstd": ["zstandard"]
+    }
 )
@@ -1,5 +1,6 @@
 import datetime
 import io
+import json
 
 import pytest
 import zebr0
@@ -17,6 +18,13 @@ def format_mtime(path):
     return datetime.datetime.fromtimestamp(path.stat().st_mtime).strftime("%c")
 
 
+def format_summary(path):
+    report = json.loads(path.read_text())
+    assert report.pop("output")
+    assert report.pop("attempts")
+    return json.dumps(report)
+
+
 OK_OUTPUT1 = """
 pending: "echo one"
 pending: "sleep 1 && echo two"
@@ -42,8 +50,8 @@ success!
 """.lstrip()
 
 OK_OUTPUT4 = """
-a885d7b3306acd60490834d5fdd234b5 {} {{"command": "echo one", "status": "success"}}
-7ab9b46af97310796a1918713345d986 {} {{"command": "sleep 1 && echo two", "status": "success"}}
+a885d7b3306acd60490834d5fdd234b5 {} {}
+7ab9b46af97310796a1918713345d986 {} {}
 """.lstrip()
 
 OK_OUTPUT5 = """
@@ -78,10 +86,33 @@ def test_ok(server, tmp_path, capsys, monkeypatch):
     assert capsys.readouterr().out == OK_OUTPUT3
 
     zebr0_script.main(f"-r {reports_path} log".split())
-    assert capsys.readouterr().out == OK_OUTPUT4.format(format_mtime(reports_path.joinpath("a885d7b3306acd60490834d5fdd234b5")), format_mtime(reports_path.joinpath("7ab9b46af97310796a1918713345d986")))
+    report1, report2 = reports_path.joinpath("a885d7b3306acd60490834d5fdd234b5"), reports_path.joinpath("7ab9b46af97310796a1918713345d986")
+    assert capsys.readouterr().out == OK_OUTPUT4.format(format_mtime(report1), format_summary(report1), format_mtime(report2), format_summary(report2))
+    assert format_summary(report1).startswith('{"command": "echo one", "status": "success", "start": ')
 
     zebr0_script.main(f"-f {configuration_file} -r {reports_path} show".split())
     assert capsys.readouterr().out == OK_OUTPUT5
 
     zebr0_script.main(f"-f {configuration_file} -r {reports_path} run".split())
     assert capsys.readouterr().out == OK_OUTPUT6
+
+
+PROFILE_OUTPUT = """
+{:.3f}s mean, {:.3f}s max, 1 executions: "sleep 1 && echo two"
+""".lstrip()
+
+
+def test_profile(server, tmp_path, capsys):
+    server.data = {"script": ["echo one", "sleep 1 && echo two", "echo three"]}
+
+    configuration_file = tmp_path.joinpath("zebr0.conf")
+    zebr0.Client("http://localhost:8000", [], 1).save_configuration(configuration_file)
+    reports_path = tmp_path.joinpath("reports")
+
+    zebr0_script.main(f"-f {configuration_file} -r {reports_path} run".split())
+    capsys.readouterr()
+
+    zebr0_script.main(f"-f {configuration_file} -r {reports_path} profile --limit 1".split())
+    duration = json.loads(reports_path.joinpath("7ab9b46af97310796a1918713345d986").read_text()).get("duration")
+    assert duration >= 1
+    assert capsys.readouterr().out == PROFILE_OUTPUT.format(duration, duration)
@@ -1,33 +1,63 @@
+import asyncio
+import gzip
 import threading
 import time
+from concurrent import futures
 
 import zebr0_script
 
 
+def without_metrics(report):
+    return {field: value for field, value in report.items() if field not in ("start", "end", "duration", "attempts")}
+
+
 def test_ok(capsys):
     command = "echo one && echo two"
-    assert zebr0_script.execute(command) == {"command": command, "status": zebr0_script.Status.SUCCESS, "output": ["one", "two"]}
+    assert without_metrics(zebr0_script.execute(command)) == {"command": command, "status": zebr0_script.Status.SUCCESS, "output": ["one", "two"]}
     assert capsys.readouterr().out == "..\n"
 
 
 def test_ko(capsys):
     command = "echo ko && false"
-    assert zebr0_script.execute(command, attempts=3, pause=0.1) == {"command": command, "status": zebr0_script.Status.FAILURE, "output": ["ko"]}
+    assert without_metrics(zebr0_script.execute(command, attempts=3, pause=0.1)) == {"command": command, "status": zebr0_script.Status.FAILURE, "output": ["ko"]}
     assert capsys.readouterr().out == ".\nerror, 2 attempts remaining, will try again in 0.1 seconds\n.\nerror, 1 attempts remaining, will try again in 0.1 seconds\n.\n"
 
 
 def test_ko_then_ok(tmp_path, capsys):
     command = f"[ -f {tmp_path}/file ] || ! touch {tmp_path}/file"
-    assert zebr0_script.execute(command, pause=0.1) == {"command": command, "status": zebr0_script.Status.SUCCESS, "output": []}
+    assert without_metrics(zebr0_script.execute(command, pause=0.1)) == {"command": command, "status": zebr0_script.Status.SUCCESS, "output": []}
     assert capsys.readouterr().out == "error, 3 attempts remaining, will try again in 0.1 seconds\n"
 
 
 def test_wrong_attempts(capsys):
     command = "echo ko && false"
-    assert zebr0_script.execute(command, attempts=0) == {"command": command, "status": zebr0_script.Status.FAILURE, "output": ["ko"]}
+    assert without_metrics(zebr0_script.execute(command, attempts=0)) == {"command": command, "status": zebr0_script.Status.FAILURE, "output": ["ko"]}
     assert capsys.readouterr().out == ".\n"
 
 
+def test_metrics():
+    report = zebr0_script.execute("sleep 0.2 && false", attempts=2, pause=0.1)
+
+    assert report.get("start") < report.get("end")
+    assert report.get("duration") >= 0.5
+    assert len(report.get("attempts")) == 2
+    for attempt in report.get("attempts"):
+        assert attempt.keys() == {"duration", "exit_code", "max_rss", "user_time", "system_time"}
+        assert attempt.get("duration") >= 0.2
+        assert attempt.get("exit_code") == 1
+        assert attempt.get("max_rss") > 0
+
+
+def test_metrics_concurrent():
+    busy = "i=0; while [ $i -lt 300000 ]; do i=$((i+1)); done"
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+        busy_report, idle_report = executor.map(zebr0_script.execute, [busy, "sleep 0.5"])
+
+    assert busy_report.get("attempts")[0].get("user_time") > 0.1
+    assert idle_report.get("attempts")[0].get("user_time") < 0.05  # each attempt's own, even with other commands executed meanwhile
+    assert idle_report.get("attempts")[0].get("max_rss") > 0
+
+
 def test_progress_bar(capsys):
     def execute():
         zebr0_script.execute("echo one && sleep 1 && echo two")
@@ -38,3 +68,211 @@ def test_progress_bar(capsys):
     assert capsys.readouterr().out == "."
     thread.join()
     assert capsys.readouterr().out == ".\n"
+
+
+def test_output_head_and_tail(capsys):
+    command = "seq 1 10"
+    assert without_metrics(zebr0_script.execute(command, output_head=2, output_tail=3)) == {"command": command, "status": zebr0_script.Status.SUCCESS, "output": ["1", "2", "[... 5 lines omitted ...]", "8", "9", "10"]}
+    assert capsys.readouterr().out == "..........\n"
+
+
+def test_output_max_bytes():
+    command = "seq 1 10"
+    assert zebr0_script.execute(command, output_max_bytes=4).get("output") == ["1", "2", "3", "4", "[... 6 lines omitted ...]"]
+    assert zebr0_script.execute(command, output_head=1, output_tail=5, output_max_bytes=4).get("output") == ["1", "[... 7 lines omitted ...]", "9", "10"]
+
+
+def test_spool(tmp_path):
+    command = "seq 1 10"
+    spool_path = tmp_path.joinpath(".spool/report.gz")
+
+    assert without_metrics(zebr0_script.execute(command, output_tail=1, spool_path=spool_path)) == {"command": command, "status": zebr0_script.Status.SUCCESS, "output": ["[... 9 lines omitted ...]", "10"], "spool": str(spool_path)}
+    with gzip.open(spool_path, "rt") as spool:
+        assert spool.read().splitlines() == [str(i) for i in range(1, 11)]
+
+
+def test_backoff(capsys):
+    policy = zebr0_script.RetryPolicy(attempts=4, pause=0.05, backoff=2, max_pause=0.15)
+    assert zebr0_script.execute("false", policy=policy).get("status") == zebr0_script.Status.FAILURE
+    assert capsys.readouterr().out == "error, 3 attempts remaining, will try again in 0.05 seconds\nerror, 2 attempts remaining, will try again in 0.1 seconds\nerror, 1 attempts remaining, will try again in 0.15 seconds\n"
+
+
+def test_jitter():
+    policy = zebr0_script.RetryPolicy(pause=10, jitter=0.2)
+    assert all(8 <= policy.get_pause(1) <= 12 for _ in range(100))
+    assert len({policy.get_pause(1) for _ in range(100)}) > 1
+
+
+def test_deadline(capsys):
+    policy = zebr0_script.RetryPolicy(attempts=10, pause=0.2, deadline=0.5)
+    assert len(zebr0_script.execute("false", policy=policy).get("attempts")) == 3
+    assert capsys.readouterr().out == "error, 9 attempts remaining, will try again in 0.2 seconds\nerror, 8 attempts remaining, will try again in 0.2 seconds\n"
+
+
+def test_retry_on_exit_codes(capsys):
+    policy = zebr0_script.RetryPolicy(attempts=3, pause=0.1, retry_on_exit_codes=[75])
+    assert len(zebr0_script.execute("exit 1", policy=policy).get("attempts")) == 1
+    assert len(zebr0_script.execute("exit 75", policy=policy).get("attempts")) == 3
+
+
+def test_retry_on_patterns(capsys):
+    policy = zebr0_script.RetryPolicy(attempts=3, pause=0.1, retry_on_patterns=["timed? ?out", "^503"])
+    assert len(zebr0_script.execute("echo permission denied && false", policy=policy).get("attempts")) == 1
+    assert len(zebr0_script.execute("echo connection timed out && false", policy=policy).get("attempts")) == 3
+
+
+def test_override():
+    policy = zebr0_script.RetryPolicy(attempts=3, pause=1).override({"command": "false", "attempts": 2, "backoff": "1.5", "retry_on_exit_codes": "75,76", "retry_on_patterns": ["timeout"]})
+    assert (policy.attempts, policy.pause, policy.backoff, policy.retry_on_exit_codes, [pattern.pattern for pattern in policy.retry_on_patterns]) == (2, 1, 1.5, {75, 76}, ["timeout"])
+
+
+def test_execute_task_override(capsys):
+    task = {"command": "false", "attempts": 2, "pause": 0.1}
+    assert len(zebr0_script.execute_task(None, task).get("attempts")) == 2
+    assert capsys.readouterr().out == "error, 1 attempts remaining, will try again in 0.1 seconds\n"
+
+    assert zebr0_script.execute_task(None, {"command": "false", "backoff": "fast"}) == {"command": "false", "status": zebr0_script.Status.FAILURE, "output": ["invalid option: could not convert string to float: 'fast'"]}
+
+
+def test_timeout(capsys):
+    start = time.perf_counter()
+    report = zebr0_script.execute("echo start && sleep 10", attempts=2, pause=0.1, timeout=0.5)
+
+    assert time.perf_counter() - start < 3
+    assert without_metrics(report) == {"command": "echo start && sleep 10", "status": zebr0_script.Status.FAILURE, "output": ["start", "[... timed out after 0.5 seconds ...]"], "reason": "timeout"}
+    assert [attempt.get("reason") for attempt in report.get("attempts")] == ["timeout", "timeout"]
+    assert [attempt.get("exit_code") for attempt in report.get("attempts")] == [-15, -15]
+    assert capsys.readouterr().out == ".\nerror, 1 attempts remaining, will try again in 0.1 seconds\n.\n"
+
+
+def test_timeout_kills_descendants(tmp_path):
+    command = f"(sleep 1 && touch {tmp_path}/orphan) & echo started && sleep 10"
+    assert zebr0_script.execute(command, attempts=1, timeout=0.3).get("reason") == "timeout"
+    time.sleep(1.5)
+    assert not tmp_path.joinpath("orphan").exists()
+
+
+def test_timeout_grace_period():
+    command = "trap '' TERM; echo start; sleep 10"  # ignores SIGTERM
+    start = time.perf_counter()
+    report = zebr0_script.execute(command, attempts=1, timeout=0.3, grace_period=0.3)
+
+    assert 0.6 <= time.perf_counter() - start < 3
+    assert report.get("attempts")[0].get("exit_code") == -9
+
+
+def test_timeout_output_held_open():
+    command = "setsid sleep 5 & sleep 10"  # a descendant out of the process group keeps the output open
+    start = time.perf_counter()
+    report = zebr0_script.execute(command, attempts=1, timeout=0.3, grace_period=0.3)
+
+    assert time.perf_counter() - start < 3
+    assert report.get("reason") == "timeout"
+
+
+def test_timeout_not_reached():
+    report = zebr0_script.execute("sleep 0.1", attempts=1, timeout=5)
+    assert report.get("status") == zebr0_script.Status.SUCCESS
+    assert "reason" not in report and "reason" not in report.get("attempts")[0]
+
+
+def test_execute_task_timeout():
+    report = zebr0_script.execute_task(None, {"command": "sleep 10", "timeout": "0.2", "attempts": 1}, timeout=60)
+    assert report.get("reason") == "timeout"
+
+
+class ListSink(zebr0_script.OutputSink):
+    def __init__(self):
+        self.lines, self.closed = [], []
+
+    def write(self, tag, line):
+        self.lines.append((tag, line))
+
+    def close(self, tag, count):
+        self.closed.append((tag, count))
+
+
+def test_execute_async(capsys):
+    sink = ListSink()
+
+    async def main():
+        return await asyncio.gather(zebr0_script.execute_async("echo one && sleep 0.5 && echo two", sink=sink, tag="a"), zebr0_script.execute_async("sleep 0.25 && echo three", sink=sink, tag="b"))
+
+    start = time.perf_counter()
+    reports = asyncio.run(main())
+
+    assert time.perf_counter() - start < 1  # executed at once
+    assert [report.get("output") for report in reports] == [["one", "two"], ["three"]]
+    assert sink.lines == [("a", "one"), ("b", "three"), ("a", "two")]  # live, in order of arrival
+    assert sink.closed == [("b", 1), ("a", 2)]
+    assert capsys.readouterr().out == ""
+
+
+def test_prefix_sink(capsys):
+    zebr0_script.execute("echo one && echo two", sink=zebr0_script.PrefixSink(), tag="task")
+    assert capsys.readouterr().out == "[task] one\n[task] two\n"
+
+
+def test_long_line():
+    assert zebr0_script.execute("head -c 200000 /dev/zero | tr '\\0' a; echo; printf end").get("output") == ["a" * 200000, "end"]
+
+
+def test_persistent_shell(tmp_path, capsys):
+    workers = zebr0_script.ShellWorkers()
+
+    command = "echo one; printf two; echo three >&2; exit 3"
+    report = zebr0_script.execute(command, attempts=2, pause=0.1, workers=workers)
+    assert without_metrics(report) == {"command": command, "status": zebr0_script.Status.FAILURE, "output": ["one", "twothree"]}
+    assert [attempt.get("exit_code") for attempt in report.get("attempts")] == [3, 3]
+    assert capsys.readouterr().out == "..\nerror, 1 attempts remaining, will try again in 0.1 seconds\n..\n"
+
+    assert zebr0_script.execute(f"cd {tmp_path} && export VARIABLE=value && echo $$ > pid", workers=workers).get("status") == zebr0_script.Status.SUCCESS
+    assert without_metrics(zebr0_script.execute('pwd && echo "[$VARIABLE]" && cat', workers=workers)) == {"command": 'pwd && echo "[$VARIABLE]" && cat', "status": zebr0_script.Status.SUCCESS, "output": [str(zebr0_script.Path.cwd()), "[]"]}  # each command in a subshell, without input
+    assert without_metrics(zebr0_script.execute("echo ')", attempts=1, workers=workers)).get("status") == zebr0_script.Status.FAILURE  # a syntax error doesn't break the worker
+    assert without_metrics(zebr0_script.execute("echo $$", workers=workers)).get("output") == [tmp_path.joinpath("pid").read_text().strip()]  # same worker
+    assert len(workers.idle) == 1
+
+    workers.close()
+
+
+def test_persistent_shell_fallback(capsys):
+    workers = zebr0_script.ShellWorkers()
+
+    assert zebr0_script.execute("kill -9 $$", attempts=1, workers=workers).get("status") == zebr0_script.Status.FAILURE  # the worker dies with the command
+    assert workers.disabled
+
+    report = zebr0_script.execute("echo $$", workers=workers)  # executed by a fresh process
+    assert report.get("status") == zebr0_script.Status.SUCCESS
+    assert workers.idle == []
+
+
+def test_execute_task_guards(tmp_path, capsys):
+    target = tmp_path.joinpath("target")
+    command = f"echo done > {target}"
+
+    def execute_task(**guards):
+        return zebr0_script.execute_task(None, {"command": command, **guards}, zebr0_script.RetryPolicy(attempts=1))
+
+    def status(**guards):
+        return execute_task(**guards).get("status")
+
+    assert status(creates=str(target), onlyif="false") == zebr0_script.Status.SATISFIED  # the cheapest guard first
+    assert not target.exists()
+    assert status(creates=[str(target), str(tmp_path)], unless="false") == zebr0_script.Status.SUCCESS
+    assert target.read_text() == "done\n"
+
+    report = execute_task(creates=[str(target), str(tmp_path)])
+    assert without_metrics(report) == {"command": command, "status": zebr0_script.Status.SATISFIED, "output": [], "reason": "creates"}
+    assert report.get("start") <= report.get("end")
+
+    sha256 = zebr0_script.file_sha256(target)
+    assert status(checksum=f"{sha256}  {target}") == zebr0_script.Status.SATISFIED
+    assert status(checksum=[f"{sha256} *{target}", f"{sha256}  {tmp_path}/other"]) == zebr0_script.Status.SUCCESS
+    assert status(unless=f"grep -q done {target}") == zebr0_script.Status.SATISFIED
+    assert status(onlyif=f"grep -q undone {target}") == zebr0_script.Status.SATISFIED
+    assert status(onlyif=f"grep -q done {target}") == zebr0_script.Status.SUCCESS
+    assert capsys.readouterr().out == ""  # the guards' output is discarded
+
+    assert execute_task(checksum="not a checksum").get("output") == ["invalid option: checksum must be in the format '<sha256>  <path>'"]
+    assert execute_task(unless=["true"]).get("output") == ["invalid option: unless must be a command"]
+    assert execute_task(creates={"a": "b"}).get("output") == ["invalid option: creates must be a string or a list of strings"]
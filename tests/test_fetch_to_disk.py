@@ -1,3 +1,8 @@
+import asyncio
+import grp
+import hashlib
+import os
+import stat
 from pathlib import Path
 
 import pytest
@@ -12,12 +17,16 @@ def server():
         yield server
 
 
+def without_metrics(report):
+    return {field: value for field, value in report.items() if field not in ("start", "end", "duration")}
+
+
 def test_ok(server, tmp_path):
     server.data = {"dummy.conf": "yin: yang\n"}
     client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
     target = tmp_path.joinpath("parent/directory/file")
 
-    assert zebr0_script.fetch_to_disk(client, "dummy.conf", target) == {"key": "dummy.conf", "target": target, "status": zebr0_script.Status.SUCCESS, "output": []}
+    assert without_metrics(zebr0_script.fetch_to_disk(client, "dummy.conf", target)) == {"key": "dummy.conf", "target": target, "status": zebr0_script.Status.SUCCESS, "output": [], "changed": True}
     assert target.read_text() == "yin: yang\n"
 
 
@@ -26,7 +35,19 @@ def test_ko_key_not_found(server, tmp_path):
     client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
     target = tmp_path.joinpath("file")
 
-    assert zebr0_script.fetch_to_disk(client, "dummy.conf", target) == {"key": "dummy.conf", "target": target, "status": zebr0_script.Status.FAILURE, "output": ["key 'dummy.conf' not found on server http://localhost:8000"]}
+    assert without_metrics(zebr0_script.fetch_to_disk(client, "dummy.conf", target)) == {"key": "dummy.conf", "target": target, "status": zebr0_script.Status.FAILURE, "output": ["key 'dummy.conf' not found on server http://localhost:8000"]}
+    assert not target.exists()
+
+
+def test_ko_unreachable(tmp_path, monkeypatch):
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+    target = tmp_path.joinpath("file")
+
+    def mock_get(*_, **__):
+        raise ConnectionError("no route to host")
+
+    monkeypatch.setattr(client, "get", mock_get)
+    assert without_metrics(zebr0_script.fetch_to_disk(client, "dummy.conf", target)) == {"key": "dummy.conf", "target": target, "status": zebr0_script.Status.FAILURE, "output": ["key-value server unreachable: no route to host"]}
     assert not target.exists()
 
 
@@ -34,4 +55,97 @@ def test_ko_oserror(server):
     server.data = {"dummy.conf": "yin: yang\n"}
     client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
 
-    assert zebr0_script.fetch_to_disk(client, "dummy.conf", "") == {"key": "dummy.conf", "target": "", "status": zebr0_script.Status.FAILURE, "output": ["[Errno 21] Is a directory: '.'"]}
+    assert without_metrics(zebr0_script.fetch_to_disk(client, "dummy.conf", "")) == {"key": "dummy.conf", "target": "", "status": zebr0_script.Status.FAILURE, "output": ["[Errno 21] Is a directory: '.'"]}
+
+
+def test_ok_unchanged(server, tmp_path):
+    server.data = {"dummy.conf": "yin: yang\n"}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+    target = tmp_path.joinpath("file")
+    target.write_text("yin: yang\n")
+    os.utime(target, ns=(0, 0))
+
+    assert without_metrics(zebr0_script.fetch_to_disk(client, "dummy.conf", target)) == {"key": "dummy.conf", "target": target, "status": zebr0_script.Status.SUCCESS, "output": [], "changed": False}
+    assert target.stat().st_mtime_ns == 0
+
+
+def test_ok_same_size(server, tmp_path):
+    server.data = {"dummy.conf": "yin: yang\n"}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+    target = tmp_path.joinpath("file")
+    target.write_text("yang: yin\n")
+
+    assert without_metrics(zebr0_script.fetch_to_disk(client, "dummy.conf", target)) == {"key": "dummy.conf", "target": target, "status": zebr0_script.Status.SUCCESS, "output": [], "changed": True}
+    assert target.read_text() == "yin: yang\n"
+
+
+def test_ok_keep_digest(server, tmp_path):
+    server.data = {"dummy.conf": "yin: yang\n"}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+    target = tmp_path.joinpath("file")
+    sha256 = hashlib.sha256(b"yin: yang\n").hexdigest()
+
+    report = without_metrics(zebr0_script.fetch_to_disk(client, "dummy.conf", target, keep_digest=True))
+    digest = {"size": 10, "mtime": target.stat().st_mtime_ns, "sha256": sha256}
+    assert report == {"key": "dummy.conf", "target": target, "status": zebr0_script.Status.SUCCESS, "output": [], "changed": True, "digest": digest}
+
+    # the previous digest is trusted as long as the target's size and mtime haven't changed
+    server.data = {"dummy.conf": "yang: yin\n"}
+    assert zebr0_script.fetch_to_disk(client, "dummy.conf", target, True, dict(digest, sha256=hashlib.sha256(b"yang: yin\n").hexdigest())).get("changed") is False
+    assert target.read_text() == "yin: yang\n"
+
+    assert zebr0_script.fetch_to_disk(client, "dummy.conf", target, True, digest).get("changed") is True
+    assert target.read_text() == "yang: yin\n"
+
+
+def test_ok_mode_and_owner(server, tmp_path):
+    server.data = {"dummy.conf": "yin: yang\n"}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+    target = tmp_path.joinpath("file")
+    group = grp.getgrgid(os.getgid()).gr_name
+
+    assert zebr0_script.fetch_to_disk(client, "dummy.conf", target, mode="0600", owner=f":{group}").get("status") == zebr0_script.Status.SUCCESS
+    assert stat.S_IMODE(target.stat().st_mode) == 0o600
+    assert target.stat().st_gid == os.getgid()
+    assert [path.name for path in tmp_path.iterdir()] == ["file"]  # no temporary file left behind
+
+    # an unchanged target still gets its mode fixed
+    assert zebr0_script.fetch_to_disk(client, "dummy.conf", target, mode="0640").get("changed") is False
+    assert stat.S_IMODE(target.stat().st_mode) == 0o640
+
+
+def test_ok_keeps_mode_and_follows_symlinks(server, tmp_path):
+    server.data = {"dummy.conf": "yin: yang\n"}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+    target = tmp_path.joinpath("file")
+    target.write_text("previous content")
+    target.chmod(0o600)
+    link = tmp_path.joinpath("link")
+    link.symlink_to(target)
+
+    assert zebr0_script.fetch_to_disk(client, "dummy.conf", link).get("changed") is True
+    assert link.is_symlink()
+    assert target.read_text() == "yin: yang\n"
+    assert stat.S_IMODE(target.stat().st_mode) == 0o600
+
+
+def test_ko_unknown_owner(server, tmp_path):
+    server.data = {"dummy.conf": "yin: yang\n"}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+    target = tmp_path.joinpath("file")
+
+    assert zebr0_script.fetch_to_disk(client, "dummy.conf", target, owner="unknown-user-xxx").get("status") == zebr0_script.Status.FAILURE
+    assert not target.exists()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_async(server, tmp_path):
+    server.data = {"one.conf": "one\n", "two.conf": "two\n"}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+
+    async def main():
+        return await asyncio.gather(*(zebr0_script.fetch_to_disk_async(client, key, tmp_path.joinpath(key)) for key in ("one.conf", "two.conf")))
+
+    assert [report.get("status") for report in asyncio.run(main())] == [zebr0_script.Status.SUCCESS] * 2
+    assert tmp_path.joinpath("one.conf").read_text() == "one\n"
+    assert tmp_path.joinpath("two.conf").read_text() == "two\n"
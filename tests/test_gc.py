@@ -0,0 +1,121 @@
+import gzip
+import json
+import time
+from pathlib import Path
+
+import pytest
+import zebr0
+
+import zebr0_script
+
+
+def write_reports(reports_path, count):
+    store = zebr0_script.open_store(reports_path)
+    for i in range(count):
+        store.write(reports_path.joinpath(f"report{i}"), {"command": f"echo {i}", "status": "success", "output": ["x" * 10]})
+        zebr0_script.os.utime(reports_path.joinpath(f"report{i}"), (1000 + i, 1000 + i))
+
+
+def gc(reports_path, monkeypatch, **kwargs):
+    def mock_recursive_fetch_script(_, key, *__):
+        if key == "unreachable":
+            raise ConnectionError("no route to host")
+        yield f"echo {key}", zebr0_script.Status.SUCCESS, reports_path.joinpath("report0")
+
+    monkeypatch.setattr(zebr0_script, "recursive_fetch_script", mock_recursive_fetch_script)
+    zebr0_script.gc("http://localhost:8001", [], 1, Path(""), reports_path, **kwargs)
+
+
+def remaining(reports_path):
+    return sorted(zebr0_script.open_store(reports_path).load_index())
+
+
+def test_gc(tmp_path, monkeypatch, capsys):
+    write_reports(tmp_path, 5)
+    tmp_path.joinpath(".spool").mkdir()
+    tmp_path.joinpath(".spool", "report1.gz").touch()
+
+    gc(tmp_path, monkeypatch, key="script", dry_run=True)
+    output = capsys.readouterr().out
+    assert output.count("would remove: report") == 4
+    assert output.endswith("4 unreferenced reports would be removed, 0 kept\n")
+    assert remaining(tmp_path) == ["report0", "report1", "report2", "report3", "report4"]
+
+    gc(tmp_path, monkeypatch, key="script", keep=1)
+    assert capsys.readouterr().out.endswith("3 unreferenced reports removed, 1 kept\n")
+    assert remaining(tmp_path) == ["report0", "report4"]  # the referenced report, and the most recent unreferenced one
+    assert not tmp_path.joinpath(".spool", "report1.gz").exists()
+
+
+def test_gc_limits(tmp_path, monkeypatch, capsys):
+    write_reports(tmp_path, 6)
+
+    gc(tmp_path, monkeypatch, key=["script", "other"], older_than=1002.5)
+    assert remaining(tmp_path) == ["report0", "report3", "report4", "report5"]
+
+    size = len(json.dumps({"command": "echo 5", "status": "success", "output": ["x" * 10]}))
+    gc(tmp_path, monkeypatch, key="script", max_size=2 * size)
+    assert remaining(tmp_path) == ["report0", "report4", "report5"]
+
+    gc(tmp_path, monkeypatch, key="script")
+    assert remaining(tmp_path) == ["report0"]
+    assert capsys.readouterr().out.endswith("2 unreferenced reports removed, 0 kept\n")
+
+
+def test_gc_archive(tmp_path, monkeypatch, capsys):
+    reports_path = tmp_path.joinpath("reports")
+    store = zebr0_script.SQLiteStore(reports_path)
+    for i in range(3):
+        store.write(reports_path.joinpath(f"report{i}"), {"command": f"echo {i}", "status": "success", "output": []}, timestamp=1000 + i)
+    archive = tmp_path.joinpath("archive.jsonl.gz")
+
+    gc(reports_path, monkeypatch, key="script", archive=archive)
+    assert capsys.readouterr().out.endswith(f"2 unreferenced reports removed, 0 kept, archived to {archive}\n")
+    assert remaining(reports_path) == ["report0"]
+    assert store.history("report1") == []
+
+    with gzip.open(archive, "rt") as file:
+        assert [json.loads(line) for line in file] == [{"md5": "report1", "time": 1001, "report": {"command": "echo 1", "status": "success", "output": []}},
+                                                      {"md5": "report2", "time": 1002, "report": {"command": "echo 2", "status": "success", "output": []}}]
+
+
+def test_gc_journal(tmp_path, monkeypatch, capsys):
+    store = zebr0_script.JournalStore(tmp_path, zebr0_script.Fsync.NEVER)
+    for i in range(3):
+        store.write(tmp_path.joinpath(f"report{i}"), {"status": "success"}, timestamp=time.time())
+
+    gc(tmp_path, monkeypatch, key="script")
+    assert remaining(tmp_path) == ["report0"]
+    assert len(tmp_path.joinpath(".journal").read_text().splitlines()) == 1
+
+
+def test_gc_unreachable(tmp_path, monkeypatch, capsys):
+    write_reports(tmp_path, 2)
+
+    gc(tmp_path, monkeypatch, key=["script", "unreachable"])
+    assert capsys.readouterr().out == "error: key-value server unreachable: no route to host\n"
+    assert remaining(tmp_path) == ["report0", "report1"]
+
+
+@pytest.fixture(scope="module")
+def server():
+    with zebr0.TestServer() as server:
+        yield server
+
+
+def test_gc_key_not_found(server, tmp_path, capsys):
+    server.data = {"other": ["echo 0"]}
+    write_reports(tmp_path, 2)
+
+    zebr0_script.gc("http://localhost:8000", [], 1, Path(""), tmp_path, ["other", "script"])
+    assert capsys.readouterr().out == "key 'script' not found on server http://localhost:8000\nerror: incomplete scripts, nothing removed: script\n"
+    assert remaining(tmp_path) == ["report0", "report1"]
+
+
+def test_gc_include_not_found(server, tmp_path, capsys):
+    server.data = {"script": ["echo 0", {"include": "included"}]}
+    write_reports(tmp_path, 2)
+
+    zebr0_script.gc("http://localhost:8000", [], 1, Path(""), tmp_path, "script")
+    assert capsys.readouterr().out == "key 'included' not found on server http://localhost:8000\nerror: incomplete scripts, nothing removed: included\n"
+    assert remaining(tmp_path) == ["report0", "report1"]
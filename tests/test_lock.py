@@ -0,0 +1,45 @@
+import threading
+import time
+
+import zebr0_script
+
+
+def test_file_lock(tmp_path):
+    path = tmp_path.joinpath(".locks", "lock")
+
+    with zebr0_script.FileLock(path, shared=True):
+        shared = zebr0_script.FileLock(path, shared=True)
+        assert shared.acquire(blocking=False)
+        assert not zebr0_script.FileLock(path).acquire(blocking=False)
+        shared.release()
+
+    exclusive = zebr0_script.FileLock(path)
+    assert exclusive.acquire(blocking=False)
+    assert not zebr0_script.FileLock(path, shared=True).acquire(blocking=False)
+    exclusive.release()
+    assert zebr0_script.FileLock(path).acquire(blocking=False)
+
+
+def test_lock_reports(tmp_path, capsys):
+    execution = zebr0_script.lock_reports(tmp_path)
+    zebr0_script.lock_reports(tmp_path).release()  # executions overlap
+    assert capsys.readouterr().out == ""
+
+    threading.Timer(0.2, execution.release).start()
+    start = time.perf_counter()
+    zebr0_script.lock_reports(tmp_path, shared=False).release()  # maintenance waits for the executions
+    assert time.perf_counter() - start >= 0.2
+    assert capsys.readouterr().out == "waiting for the executions in progress to end...\n"
+
+
+def test_journal_compaction_does_not_wait(tmp_path):
+    store = zebr0_script.JournalStore(tmp_path, zebr0_script.Fsync.NEVER)
+    for timestamp in range(1, 4):
+        store.write(tmp_path.joinpath("e60305c56524b749c03a2c648d33e791"), {"status": "success"}, timestamp=timestamp)
+
+    with zebr0_script.FileLock(tmp_path.joinpath(".journal"), shared=True):  # as held by a writer
+        assert len(store.load_index()) == 1
+        assert len(tmp_path.joinpath(".journal").read_text().splitlines()) == 3  # compaction skipped
+
+    store.load_index()
+    assert len(tmp_path.joinpath(".journal").read_text().splitlines()) == 1
@@ -1,4 +1,5 @@
 import datetime
+import os
 import time
 
 import zebr0_script
@@ -47,3 +48,26 @@ def test_ok(tmp_path, capsys):
 
     zebr0_script.log(tmp_path)
     assert capsys.readouterr().out == OK_OUTPUT.format(format_mtime(report1), format_mtime(report2))
+
+
+FILTERS_OUTPUT = """
+report2 {} {{"command": "two", "status": "failure"}}
+""".lstrip()
+
+
+def test_filters(tmp_path, capsys):
+    for name, command, status, key, mtime in [("report1", "one", "failure", "script", 1000), ("report2", "two", "failure", "script", 2000), ("report3", "three", "success", "script", 3000), ("report4", "four", "failure", "other", 4000)]:
+        report_path = tmp_path.joinpath(name)
+        zebr0_script.write_report(report_path, {"command": command, "status": status, "output": ["lorem ipsum"]}, key)
+        os.utime(report_path, (mtime, mtime))  # the index is refreshed on load, but keeps the script keys
+
+    zebr0_script.log(tmp_path, since=1500, status="failure", key="script")
+    assert capsys.readouterr().out == FILTERS_OUTPUT.format(datetime.datetime.fromtimestamp(2000).strftime("%c"))
+
+    zebr0_script.log(tmp_path, until=3500, limit=2)
+    assert [line.split()[0] for line in capsys.readouterr().out.splitlines()] == ["report2", "report3"]
+
+
+def test_parse_time():
+    assert zebr0_script.parse_time("2021-01-09T11:00") == datetime.datetime(2021, 1, 9, 11).timestamp()
+    assert time.time() - 3600 - 1 < zebr0_script.parse_time("1h") <= time.time() - 3600
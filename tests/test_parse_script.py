@@ -0,0 +1,70 @@
+import json
+
+import yaml
+
+import zebr0_script
+
+SCRIPT = [
+    "install package xxx",
+    {"key": "configuration-file", "target": "/etc/xxx/conf.ini", "mode": "0644"},
+    {"command": "restart xxx", "attempts": 2, "pause": 1.5, "jitter": 1e-1, "group": None, "enabled": True, "disabled": False},
+    {"include": "second-script"}
+]
+
+
+def test_json_same_as_yaml():
+    value = json.dumps(SCRIPT)
+    assert zebr0_script.parse_script(value) == yaml.load(value, Loader=yaml.BaseLoader)
+    assert zebr0_script.parse_script(value)[2] == {"command": "restart xxx", "attempts": "2", "pause": "1.5", "jitter": "0.1", "group": "null", "enabled": "true", "disabled": "false"}
+
+
+def test_yaml():
+    value = "- install package xxx\n- key: configuration-file\n  target: /etc/xxx/conf.ini\n- {include: second-script}\n"
+    assert zebr0_script.parse_script(value) == ["install package xxx", {"key": "configuration-file", "target": "/etc/xxx/conf.ini"}, {"include": "second-script"}]
+    assert zebr0_script.parse_script("[install package xxx, {include: second-script}]") == ["install package xxx", {"include": "second-script"}]  # flow-style, not json
+
+
+def test_cache(tmp_path, monkeypatch):
+    value = "- install package xxx\n- restart xxx\n"
+    parsed = []
+
+    def mock_parse_script(value):
+        parsed.append(value)
+        return yaml.load(value, Loader=yaml.BaseLoader)
+
+    monkeypatch.setattr(zebr0_script, "parse_script", mock_parse_script)
+    monkeypatch.setattr(zebr0_script.ParsedScriptCache, "memory", zebr0_script.OrderedDict())
+
+    cache = zebr0_script.ParsedScriptCache(tmp_path)
+    assert cache.parse(value) == ["install package xxx", "restart xxx"]
+    assert cache.parse(value) == ["install package xxx", "restart xxx"]
+    assert len(parsed) == 1
+    assert len(list(tmp_path.iterdir())) == 1
+
+    zebr0_script.ParsedScriptCache.memory.clear()  # as in a new process
+    assert zebr0_script.ParsedScriptCache(tmp_path).parse(value) == ["install package xxx", "restart xxx"]
+    assert len(parsed) == 1  # loaded from disk
+
+
+def test_cache_eviction(tmp_path, monkeypatch):
+    monkeypatch.setattr(zebr0_script, "PARSED_SCRIPTS_SIZE", 2)
+    monkeypatch.setattr(zebr0_script.ParsedScriptCache, "memory", zebr0_script.OrderedDict())
+
+    cache = zebr0_script.ParsedScriptCache(tmp_path)
+    for i in range(4):
+        cache.parse(f"- command {i}\n")
+
+    assert len(zebr0_script.ParsedScriptCache.memory) == 2
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_cache_read_only(tmp_path, monkeypatch):
+    value = "- install package xxx\n"
+    monkeypatch.setattr(zebr0_script.ParsedScriptCache, "memory", zebr0_script.OrderedDict())
+
+    zebr0_script.ParsedScriptCache(tmp_path.joinpath("cache"), read_only=True).parse(value)
+    assert not tmp_path.joinpath("cache").exists()
+
+    zebr0_script.ParsedScriptCache(tmp_path).parse(value)
+    zebr0_script.ParsedScriptCache.memory.clear()
+    assert zebr0_script.ParsedScriptCache(tmp_path, read_only=True).parse(value) == ["install package xxx"]  # still read from disk
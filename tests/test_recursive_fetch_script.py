@@ -33,6 +33,8 @@ def test_ok(server, tmp_path, capsys):
                               {"key": "configuration-file", "target": "/etc/xxx/conf.ini"},
                               "chmod 400 /etc/xxx/conf.ini",
                               {"include": "second-script"},
+                              {"command": "restart xxx", "group": "services"},
+                              {"command": ["not", "a", "string"]},
                               {"make-coffee": "black"}],
                    "second-script": ["install package yyy",
                                      "yyy configure network"]}
@@ -43,8 +45,9 @@ def test_ok(server, tmp_path, capsys):
                             ({"key": "configuration-file", "target": "/etc/xxx/conf.ini"}, zebr0_script.Status.PENDING, tmp_path.joinpath("c065878911c6b3beee171d12fed19aa2")),
                             ("chmod 400 /etc/xxx/conf.ini", zebr0_script.Status.PENDING, tmp_path.joinpath("8b982863e398cfbe84dc334c3b02164a")),
                             ("install package yyy", zebr0_script.Status.PENDING, tmp_path.joinpath("a71c44f4d35f54f68fe8930a1c29148f")),
-                            ("yyy configure network", zebr0_script.Status.PENDING, tmp_path.joinpath("f55c297fd62c279cf13b0e2e40aac570"))]
-    assert capsys.readouterr().out == 'malformed task, ignored: {"make-coffee": "black"}\n'
+                            ("yyy configure network", zebr0_script.Status.PENDING, tmp_path.joinpath("f55c297fd62c279cf13b0e2e40aac570")),
+                            ({"command": "restart xxx", "group": "services"}, zebr0_script.Status.PENDING, tmp_path.joinpath("ae62c828e3d8d8d1fd5040ee3b9e7571"))]
+    assert capsys.readouterr().out == 'malformed task, ignored: {"command": ["not", "a", "string"]}\nmalformed task, ignored: {"make-coffee": "black"}\n'
 
 
 def test_ok_include_key_not_found(server, tmp_path, capsys):
@@ -102,3 +105,72 @@ def test_ok_status_unknown(server, tmp_path, capsys):
     result = zebr0_script.recursive_fetch_script(client, "script", tmp_path)
     assert list(result) == [("install package yyy", "unknown", report_path)]
     assert capsys.readouterr().out == ""
+
+
+def test_ok_prefetch(server, tmp_path, capsys):
+    server.data = {"script": ["install package xxx",
+                              {"include": "second-script"},
+                              {"include": "missing-script"},
+                              {"include": "third-script"},
+                              "chmod 400 /etc/xxx/conf.ini"],
+                   "second-script": [{"include": "third-script"},
+                                     "install package yyy"],
+                   "third-script": ["yyy configure network"]}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+
+    result = zebr0_script.recursive_fetch_script(client, "script", tmp_path, 4)
+    assert list(result) == [("install package xxx", zebr0_script.Status.PENDING, tmp_path.joinpath("e60305c56524b749c03a2c648d33e791")),
+                            ("yyy configure network", zebr0_script.Status.PENDING, tmp_path.joinpath("f55c297fd62c279cf13b0e2e40aac570")),
+                            ("install package yyy", zebr0_script.Status.PENDING, tmp_path.joinpath("a71c44f4d35f54f68fe8930a1c29148f")),
+                            ("chmod 400 /etc/xxx/conf.ini", zebr0_script.Status.PENDING, tmp_path.joinpath("8b982863e398cfbe84dc334c3b02164a"))]
+    assert capsys.readouterr().out == "key 'missing-script' not found on server http://localhost:8000\n"
+
+
+def test_ok_include_graph(server, tmp_path, capsys, monkeypatch):
+    server.data = {"script": [{"include": "a"}, {"include": "b"}, "last"],
+                   "a": [{"include": "common"}, "a"],
+                   "b": [{"include": "common"}, "b", "first"],
+                   "common": ["first", "second"]}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+
+    fetched = []
+    fetch_script = zebr0_script.fetch_script
+    monkeypatch.setattr(zebr0_script, "fetch_script", lambda client, key, *args: fetched.append(key) or fetch_script(client, key, *args))
+
+    for prefetch in (1, 4):
+        fetched.clear()
+        assert [task for task, _, _ in zebr0_script.recursive_fetch_script(client, "script", tmp_path, prefetch)] == ["first", "second", "a", "b", "last"]
+        assert sorted(fetched) == ["a", "b", "common", "script"]  # each key fetched once
+    assert capsys.readouterr().out == ""
+
+
+def test_ko_include_cycle(server, tmp_path, capsys):
+    server.data = {"script": ["one", {"include": "a"}, "four"],
+                   "a": ["two", {"include": "b"}],
+                   "b": ["three", {"include": "script"}]}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+
+    for prefetch in (1, 4):
+        assert [task for task, _, _ in zebr0_script.recursive_fetch_script(client, "script", tmp_path, prefetch)] == ["one", "two", "three", "four"]
+        assert capsys.readouterr().out == "include cycle, ignored: script -> a -> b -> script\n"
+
+
+def test_ok_write_cache(server, tmp_path, monkeypatch):
+    server.data = {"script": "- install package xxx\n"}
+    client = zebr0.Client("http://localhost:8000", configuration_file=Path(""))
+    reports_path = tmp_path.joinpath("reports")
+
+    def fetch(*args):
+        monkeypatch.setattr(zebr0_script.ParsedScriptCache, "memory", zebr0_script.OrderedDict())  # as in a new process
+        assert list(zebr0_script.recursive_fetch_script(client, "script", reports_path, *args))
+
+    fetch()
+    fetch(zebr0_script.PREFETCH_DEFAULT, None, True)
+    assert not reports_path.exists()  # e.g. show, or run before the reports' directory is created
+
+    reports_path.mkdir()
+    fetch()
+    assert not reports_path.joinpath(zebr0_script.CACHE_DIRECTORY).exists()
+
+    fetch(zebr0_script.PREFETCH_DEFAULT, None, True)
+    assert len(list(reports_path.joinpath(zebr0_script.CACHE_DIRECTORY, zebr0_script.PARSED_DIRECTORY).iterdir())) == 1
@@ -0,0 +1,69 @@
+import json
+import os
+
+import zebr0_script
+
+
+def read_index(reports_path):
+    return [json.loads(line) for line in reports_path.joinpath(".index").read_text().splitlines()]
+
+
+def test_reports_path_doesnt_exist(tmp_path):
+    assert zebr0_script.load_index(tmp_path.joinpath("reports")) == {}
+    assert not tmp_path.joinpath("reports").exists()
+
+
+def test_write_report(tmp_path):
+    report_path = tmp_path.joinpath("a71c44f4d35f54f68fe8930a1c29148f")
+
+    zebr0_script.write_report(report_path, {"command": "one", "status": "failure", "output": []})
+    first_mtime = report_path.stat().st_mtime_ns
+    zebr0_script.write_report(report_path, {"command": "one", "status": "success", "output": [], "duration": 1.5}, "script")
+    mtime = report_path.stat().st_mtime_ns
+
+    assert json.loads(report_path.read_text()) == {"command": "one", "status": "success", "output": [], "duration": 1.5}
+    entry = {"md5": report_path.name, "status": "success", "mtime": mtime, "duration": 1.5, "script": "script", "summary": {"command": "one", "status": "success", "duration": 1.5}}
+    assert read_index(tmp_path) == [{"md5": report_path.name, "status": "failure", "mtime": first_mtime, "duration": None, "script": None, "summary": {"command": "one", "status": "failure"}}, entry]
+    assert zebr0_script.load_index(tmp_path) == {report_path.name: entry}
+
+
+def test_rebuild(tmp_path):
+    report1 = tmp_path.joinpath("report1")
+    report1.write_text('{"status": "success"}')
+    report2 = tmp_path.joinpath("report2")
+    report2.write_text('{"status": "failure"}')
+
+    index = zebr0_script.load_index(tmp_path)
+    assert {md5: entry.get("status") for md5, entry in index.items()} == {"report1": "success", "report2": "failure"}
+    assert len(read_index(tmp_path)) == 2
+
+    # reports modified or removed behind the index' back
+    report1.write_text('{"status": "failure"}')
+    os.utime(report1, ns=(0, 0))
+    report2.unlink()
+
+    index = zebr0_script.load_index(tmp_path)
+    entry = {"md5": "report1", "status": "failure", "mtime": 0, "duration": None, "script": None, "summary": {"status": "failure"}}
+    assert index == {"report1": entry}
+    assert read_index(tmp_path) == [entry]
+
+
+def test_compaction(tmp_path):
+    report_path = tmp_path.joinpath("report")
+    for _ in range(3):
+        zebr0_script.write_report(report_path, {"status": "failure"})
+    assert len(read_index(tmp_path)) == 3
+
+    zebr0_script.load_index(tmp_path)
+    assert len(read_index(tmp_path)) == 1
+
+
+def test_read_only(tmp_path, monkeypatch):
+    tmp_path.joinpath("report").write_text('{"status": "success"}')
+
+    def mock_write_atomically(*_, **__):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(zebr0_script, "write_atomically", mock_write_atomically)
+    assert zebr0_script.load_index(tmp_path) == {"report": {"md5": "report", "status": "success", "mtime": tmp_path.joinpath("report").stat().st_mtime_ns, "duration": None, "script": None, "summary": {"status": "success"}}}
+    assert not tmp_path.joinpath(".index").exists()
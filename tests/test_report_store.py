@@ -0,0 +1,246 @@
+import datetime
+import json
+import sqlite3
+
+import pytest
+
+import zebr0_script
+
+
+def test_open_store(tmp_path):
+    assert isinstance(zebr0_script.open_store(tmp_path), zebr0_script.DirectoryStore)
+
+    tmp_path.joinpath(".journal").touch()
+    assert isinstance(zebr0_script.open_store(tmp_path), zebr0_script.JournalStore)
+
+    tmp_path.joinpath(".reports.sqlite").touch()
+    assert isinstance(zebr0_script.open_store(tmp_path), zebr0_script.SQLiteStore)
+
+    with pytest.raises(TypeError):
+        zebr0_script.ReportStore(tmp_path)  # abstract
+
+
+def test_sqlite_store(tmp_path):
+    store = zebr0_script.SQLiteStore(tmp_path)
+    report_path = tmp_path.joinpath("e60305c56524b749c03a2c648d33e791")
+
+    assert store.load_index() == {}
+    assert store.read(report_path.name) is None
+    assert list(store.reports()) == []
+
+    store.write(report_path, {"command": "install package xxx", "status": "failure", "output": ["error"]}, "script", timestamp=1)
+    store.write(report_path, {"command": "install package xxx", "status": "success", "output": [], "duration": 2.5}, "other-script", timestamp=2)
+
+    assert not report_path.exists()
+    assert store.load_index() == {report_path.name: {"md5": report_path.name, "status": "success", "mtime": 2000000000, "duration": 2.5}}
+    assert store.read(report_path.name) == {"command": "install package xxx", "status": "success", "output": [], "duration": 2.5}
+    assert list(store.reports()) == [(report_path.name, 2, {"command": "install package xxx", "status": "success", "output": [], "duration": 2.5})]
+    assert store.history(report_path.name) == [("script", 1, {"command": "install package xxx", "status": "failure", "output": ["error"]}),
+                                               ("other-script", 2, {"command": "install package xxx", "status": "success", "output": [], "duration": 2.5})]
+
+
+def test_sqlite_store_read_only(tmp_path, monkeypatch):
+    store = zebr0_script.SQLiteStore(tmp_path)
+    store.write(tmp_path.joinpath("report"), {"command": "one", "status": "success", "output": []}, "script", timestamp=1)
+    connect = sqlite3.connect
+
+    def mock_connect(database, *args, uri=False, **kwargs):  # e.g. a database owned by another user
+        if not uri or not database.endswith("?mode=ro"):
+            raise sqlite3.OperationalError("attempt to write a readonly database")
+        return connect(database, *args, uri=uri, **kwargs)
+
+    monkeypatch.setattr(sqlite3, "connect", mock_connect)
+    assert list(store.load_index()) == ["report"]
+    assert store.read("report") == {"command": "one", "status": "success", "output": []}
+    assert [md5 for md5, _, _ in store.summaries()] == ["report"]
+    assert [md5 for md5, _, _ in store.reports()] == ["report"]
+    assert len(store.history("report")) == 1
+
+
+def test_journal_store(tmp_path):
+    store = zebr0_script.JournalStore(tmp_path)
+    report_path = tmp_path.joinpath("e60305c56524b749c03a2c648d33e791")
+    other_path = tmp_path.joinpath("c065878911c6b3beee171d12fed19aa2")
+
+    assert store.load_index() == {}
+    assert store.read(report_path.name) is None
+    assert list(store.reports()) == []
+
+    store.write(report_path, {"command": "install package xxx", "status": "failure", "output": ["error"]}, "script", timestamp=1)
+    store.write(other_path, {"key": "configuration-file", "target": "/etc/xxx/conf.ini", "status": "success"}, "script", timestamp=2)
+    with tmp_path.joinpath(".journal").open("a") as journal:
+        journal.write('{"md5":"e60305c56524b749c03a2c648d33e791","scr')  # a record torn by a crash
+    store.write(report_path, {"command": "install package xxx", "status": "success", "output": [], "duration": 2.5}, "other-script", timestamp=3)
+
+    assert not report_path.exists()
+    assert len(tmp_path.joinpath(".journal").read_text().splitlines()) == 4
+    assert store.load_index() == {other_path.name: {"md5": other_path.name, "status": "success", "mtime": 2000000000, "duration": None, "script": "script", "summary": {"key": "configuration-file", "target": "/etc/xxx/conf.ini", "status": "success"}},
+                                  report_path.name: {"md5": report_path.name, "status": "success", "mtime": 3000000000, "duration": 2.5, "script": "other-script", "summary": {"command": "install package xxx", "status": "success", "duration": 2.5}}}
+    assert store.read(report_path.name) == {"command": "install package xxx", "status": "success", "output": [], "duration": 2.5}
+    assert [(md5, timestamp) for md5, timestamp, _ in store.reports()] == [(other_path.name, 2), (report_path.name, 3)]
+    assert [md5 for md5, _, _ in store.summaries(status=zebr0_script.Status.SUCCESS, limit=1)] == [report_path.name]
+    assert store.history(report_path.name) == [("script", 1, {"command": "install package xxx", "status": "failure", "output": ["error"]}),
+                                               ("other-script", 3, {"command": "install package xxx", "status": "success", "output": [], "duration": 2.5})]
+
+    for timestamp in range(4, 8):
+        store.write(other_path, {"key": "configuration-file", "target": "/etc/xxx/conf.ini", "status": "success"}, "script", timestamp=timestamp)
+    store.load_index()  # 8 records for 2 tasks, the journal gets compacted
+    assert len(tmp_path.joinpath(".journal").read_text().splitlines()) == 2
+    assert store.history(report_path.name) == [("other-script", 3, {"command": "install package xxx", "status": "success", "output": [], "duration": 2.5})]
+
+    store.write(report_path, {"command": "install package xxx", "status": "failure", "output": []}, "script", timestamp=8)  # appended to the compacted journal
+    assert store.read(report_path.name).get("status") == "failure"
+    assert len(tmp_path.joinpath(".journal").read_text().splitlines()) == 3
+
+
+def test_journal_store_read(tmp_path):
+    store = zebr0_script.JournalStore(tmp_path, zebr0_script.Fsync.NEVER)
+    store.write(tmp_path.joinpath("report"), {"status": "failure"}, timestamp=1)
+    assert store.read("report") == {"status": "failure"}
+
+    with tmp_path.joinpath(".journal").open("ab") as journal:
+        record = zebr0_script.encode_record({"md5": "report", "script": None, "time": 2, "report": {"status": "success"}})
+        journal.write(record[:10])  # a record being appended by another process
+        journal.flush()
+        assert store.read("report") == {"status": "failure"}
+        journal.write(record[10:])
+    assert store.read("report") == {"status": "success"}
+
+    store.delete(["report"])  # the journal is replaced
+    assert store.read("report") is None
+    store.clear()
+    assert store.read("report") is None
+
+
+def test_journal_store_fsync(tmp_path, monkeypatch):
+    zebr0_script.JournalWriter.sync_all()  # the journals of the other tests
+
+    fsyncs = []
+    fsync = zebr0_script.os.fsync
+    monkeypatch.setattr(zebr0_script.os, "fsync", lambda fd: fsyncs.append(fd) or fsync(fd))
+    report_path = tmp_path.joinpath("e60305c56524b749c03a2c648d33e791")
+
+    zebr0_script.JournalStore(tmp_path, zebr0_script.Fsync.NEVER).write(report_path, {"status": "success"})
+    assert len(fsyncs) == 0
+
+    zebr0_script.JournalStore(tmp_path).write(report_path, {"status": "success"})
+    assert len(fsyncs) == 1
+
+    store = zebr0_script.JournalStore(tmp_path, zebr0_script.Fsync.INTERVAL, 3600)
+    store.write(report_path, {"status": "success"})
+    store.write(report_path, {"status": "success"})
+    assert len(fsyncs) == 1  # within the commit interval
+
+    zebr0_script.JournalWriter.sync_all()  # at exit
+    assert len(fsyncs) == 2
+
+
+LOG_OUTPUT = """
+e60305c56524b749c03a2c648d33e791 {} {{"command": "install package xxx", "status": "success"}}
+c065878911c6b3beee171d12fed19aa2 {} {{"key": "configuration-file", "target": "/etc/xxx/conf.ini", "status": "failure"}}
+""".lstrip()
+
+
+def test_migrate(tmp_path, capsys):
+    report1 = tmp_path.joinpath("e60305c56524b749c03a2c648d33e791")
+    zebr0_script.write_report(report1, {"command": "install package xxx", "status": "success", "output": []})
+    report2 = tmp_path.joinpath("c065878911c6b3beee171d12fed19aa2")
+    zebr0_script.write_report(report2, {"key": "configuration-file", "target": "/etc/xxx/conf.ini", "status": "failure", "output": ["error"]})
+    mtime1, mtime2 = report1.stat().st_mtime, report2.stat().st_mtime
+    expected_log = LOG_OUTPUT.format(datetime.datetime.fromtimestamp(mtime1).strftime("%c"), datetime.datetime.fromtimestamp(mtime2).strftime("%c"))
+
+    zebr0_script.main(f"-r {tmp_path} migrate sqlite".split())
+    assert capsys.readouterr().out == "2 reports migrated to the sqlite backend\n"
+    assert sorted(path.name for path in tmp_path.iterdir() if not path.name.startswith(".reports.sqlite")) == [".locks"]
+
+    zebr0_script.main(f"-r {tmp_path} migrate sqlite".split())
+    assert capsys.readouterr().out == "reports are already stored in the sqlite backend\n"
+
+    zebr0_script.main(f"-r {tmp_path} log".split())
+    assert capsys.readouterr().out == expected_log
+
+    zebr0_script.main(f"-r {tmp_path} migrate directory".split())
+    assert capsys.readouterr().out == "2 reports migrated to the directory backend\n"
+    assert not tmp_path.joinpath(".reports.sqlite").exists()
+    assert json.loads(report2.read_text()) == {"key": "configuration-file", "target": "/etc/xxx/conf.ini", "status": "failure", "output": ["error"]}
+    assert report1.stat().st_mtime == mtime1
+
+    zebr0_script.main(f"-r {tmp_path} log".split())
+    assert capsys.readouterr().out == expected_log
+
+
+def test_migrate_journal(tmp_path, capsys):
+    report1 = tmp_path.joinpath("e60305c56524b749c03a2c648d33e791")
+    zebr0_script.write_report(report1, {"command": "install package xxx", "status": "success", "output": []})
+    report2 = tmp_path.joinpath("c065878911c6b3beee171d12fed19aa2")
+    zebr0_script.write_report(report2, {"key": "configuration-file", "target": "/etc/xxx/conf.ini", "status": "failure", "output": ["error"]})
+    mtime1, mtime2 = report1.stat().st_mtime, report2.stat().st_mtime
+    expected_log = LOG_OUTPUT.format(datetime.datetime.fromtimestamp(mtime1).strftime("%c"), datetime.datetime.fromtimestamp(mtime2).strftime("%c"))
+
+    zebr0_script.main(f"-r {tmp_path} --journal-fsync never migrate journal".split())
+    assert capsys.readouterr().out == "2 reports migrated to the journal backend\n"
+    assert sorted(path.name for path in tmp_path.iterdir()) == [".journal", ".locks"]
+
+    zebr0_script.main(f"-r {tmp_path} migrate journal".split())
+    assert capsys.readouterr().out == "reports are already stored in the journal backend\n"
+
+    zebr0_script.main(f"-r {tmp_path} log".split())
+    assert capsys.readouterr().out == expected_log
+
+    zebr0_script.main(f"-r {tmp_path} migrate directory".split())
+    assert capsys.readouterr().out == "2 reports migrated to the directory backend\n"
+    assert not tmp_path.joinpath(".journal").exists()
+    assert report1.stat().st_mtime == mtime1
+
+
+def test_migrate_empty(tmp_path, capsys):
+    for backend, store in (("sqlite", zebr0_script.SQLiteStore), ("journal", zebr0_script.JournalStore), ("directory", zebr0_script.DirectoryStore)):
+        zebr0_script.main(f"-r {tmp_path} migrate {backend}".split())
+        assert capsys.readouterr().out == f"0 reports migrated to the {backend} backend\n"
+        assert type(zebr0_script.open_store(tmp_path)) is store
+
+
+def test_compression(tmp_path, capsys):
+    report = {"command": "install package xxx", "status": "success", "output": ["line"] * 1000}
+
+    directory = zebr0_script.DirectoryStore(tmp_path.joinpath("directory"), zebr0_script.Compression.GZIP)
+    report_path = tmp_path.joinpath("directory", "e60305c56524b749c03a2c648d33e791")
+    directory.write(report_path, report, "script")
+    assert report_path.read_bytes().startswith(b"\x1f\x8b")
+    assert report_path.stat().st_size < len(json.dumps(report)) / 10
+    assert directory.read(report_path.name) == report
+
+    tmp_path.joinpath("directory", ".index").unlink()  # stale reports are read again
+    assert directory.load_index().get(report_path.name).get("summary") == {"command": "install package xxx", "status": "success"}
+    zebr0_script.main(f"-r {tmp_path.joinpath('directory')} log".split())
+    assert capsys.readouterr().out.endswith(' {"command": "install package xxx", "status": "success"}\n')
+
+    zebr0_script.DirectoryStore(tmp_path.joinpath("directory")).write(report_path, report)  # the compression can change at any time
+    assert report_path.read_text().startswith("{\n")
+    assert directory.read(report_path.name) == report
+
+    sqlite = zebr0_script.SQLiteStore(tmp_path.joinpath("sqlite"), zebr0_script.Compression.GZIP)
+    sqlite.write(report_path, {"status": "failure"}, "script")
+    zebr0_script.SQLiteStore(tmp_path.joinpath("sqlite")).write(report_path, report, "script")
+    assert [report for _, _, report in sqlite.history(report_path.name)] == [{"status": "failure"}, report]
+    assert list(sqlite.reports()) == [(report_path.name, sqlite.load_index().get(report_path.name).get("mtime") / 1e9, report)]
+
+
+def test_compression_corrupted(tmp_path):
+    report_path = tmp_path.joinpath("e60305c56524b749c03a2c648d33e791")
+    report_path.write_bytes(zebr0_script.encode_report({"status": "success"}, zebr0_script.Compression.GZIP)[:10])
+
+    assert zebr0_script.load_index(tmp_path).get(report_path.name).get("status") is None  # not a report
+
+
+def test_journal_store_read_only(tmp_path, monkeypatch):
+    store = zebr0_script.JournalStore(tmp_path, zebr0_script.Fsync.NEVER)
+    for timestamp in range(3):
+        store.write(tmp_path.joinpath("report"), {"status": "success"}, timestamp=timestamp)
+
+    def mock_write_atomically(*_, **__):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(zebr0_script, "write_atomically", mock_write_atomically)
+    assert list(store.load_index()) == ["report"]  # the compaction is skipped
+    assert len(tmp_path.joinpath(".journal").read_text().splitlines()) == 3
@@ -1,5 +1,12 @@
+import json
+import os
+import signal
+import threading
+import time
 from pathlib import Path
 
+import pytest
+
 import zebr0_script
 
 OK_OUTPUT = """
@@ -90,3 +97,214 @@ def test_ko(tmp_path, monkeypatch, capsys):
     assert capsys.readouterr().out == KO_OUTPUT
     assert report1.read_text() == KO_REPORT1
     assert not report2.exists()
+
+
+JOBS_OUTPUT = """
+executing: {"command": "one", "group": "packages"}
+executing: {"command": "two", "group": "packages"}
+success: {"command": "one", "group": "packages"}
+failure: {"command": "two", "group": "packages"}
+error: [
+  "error"
+]
+""".lstrip()
+
+
+def test_jobs(tmp_path, monkeypatch, capsys):
+    report1 = tmp_path.joinpath("report1")
+    report2 = tmp_path.joinpath("report2")
+    report3 = tmp_path.joinpath("report3")
+
+    def mock_recursive_fetch_script(*_):
+        yield {"command": "one", "group": "packages"}, zebr0_script.Status.PENDING, report1
+        yield {"command": "two", "group": "packages"}, zebr0_script.Status.PENDING, report2
+        yield "three", zebr0_script.Status.PENDING, report3
+
+    def mock_execute(command, *_):
+        time.sleep(0.5)
+        return {"command": command, "status": zebr0_script.Status.SUCCESS if command == "one" else zebr0_script.Status.FAILURE, "output": ["error"]}
+
+    monkeypatch.setattr(zebr0_script, "recursive_fetch_script", mock_recursive_fetch_script)
+    monkeypatch.setattr(zebr0_script, "execute", mock_execute)
+
+    start = time.time()
+    zebr0_script.run("http://localhost:8001", [], 1, Path(""), tmp_path, "script", jobs=2)
+    assert time.time() - start < 0.9  # both tasks of the group were executed concurrently
+    assert capsys.readouterr().out == JOBS_OUTPUT
+    assert report1.exists()
+    assert report2.exists()
+    assert not report3.exists()
+
+
+def test_group_tasks():
+    tasks = [({"command": "one", "group": "a"}, zebr0_script.Status.PENDING, Path("1")),
+             ({"command": "two", "group": "a"}, zebr0_script.Status.PENDING, Path("2")),
+             ("three", zebr0_script.Status.PENDING, Path("3")),
+             ({"command": "four", "group": "a"}, zebr0_script.Status.PENDING, Path("4")),
+             ({"command": "five", "group": "b"}, zebr0_script.Status.PENDING, Path("5"))]
+
+    assert list(zebr0_script.group_tasks(iter(tasks))) == [tasks[0:2], tasks[2:3], tasks[3:4], tasks[4:5]]
+
+
+def test_group_tasks_fetch_to_disk():
+    tasks = [({"key": "one", "target": "/etc/one"}, zebr0_script.Status.PENDING, Path("1")),
+             ({"key": "two", "target": "/etc/two"}, zebr0_script.Status.PENDING, Path("2")),
+             ({"key": "three", "target": "/etc/one"}, zebr0_script.Status.PENDING, Path("3")),
+             ({"key": "four", "target": "/etc/four", "group": "a"}, zebr0_script.Status.PENDING, Path("4")),
+             ({"command": "five", "group": "a"}, zebr0_script.Status.PENDING, Path("5")),
+             ({"key": "six", "target": "/etc/six"}, zebr0_script.Status.PENDING, Path("6")),
+             ("seven", zebr0_script.Status.PENDING, Path("7"))]
+
+    assert list(zebr0_script.group_tasks(iter(tasks))) == [tasks[0:2], tasks[2:3], tasks[3:5], tasks[5:6], tasks[6:7]]
+
+
+def test_multiple_keys(tmp_path, monkeypatch, capsys):
+    scripts = {"base": ["common", "base"], "app": ["common", "app", "broken", "never"]}
+    executions = []
+
+    def mock_recursive_fetch_script(_, key, *__):
+        for command in scripts.get(key):
+            yield command, zebr0_script.Status.PENDING, tmp_path.joinpath(command)
+
+    def mock_execute(command, *_):
+        executions.append(command)
+        time.sleep(0.5)
+        return {"command": command, "status": zebr0_script.Status.FAILURE if command == "broken" else zebr0_script.Status.SUCCESS, "output": []}
+
+    monkeypatch.setattr(zebr0_script, "recursive_fetch_script", mock_recursive_fetch_script)
+    monkeypatch.setattr(zebr0_script, "execute", mock_execute)
+
+    start = time.time()
+    zebr0_script.run("http://localhost:8001", [], 1, Path(""), tmp_path, ["base", "app"])
+    assert time.time() - start < 1.9  # the scripts were executed concurrently, and "common" only once
+    assert sorted(executions) == ["app", "base", "broken", "common"]
+
+    output = capsys.readouterr().out
+    assert '[base] executing: "base"\n' in output
+    assert '[app] executing: "app"\n' in output
+    assert '[app] failure' not in output and '[app] error: []\n' in output
+    assert output.endswith('summary:\nbase: success, 2 executed, 0 skipped\napp: failure, 2 executed, 1 skipped, failed on "broken"\n') \
+           or output.endswith('summary:\nbase: success, 1 executed, 1 skipped\napp: failure, 3 executed, 0 skipped, failed on "broken"\n')  # whoever executes "common" first
+    assert not tmp_path.joinpath("never").exists()
+
+
+SATISFIED_OUTPUT = """
+executing: {{"command": "false", "creates": "{0}"}}
+satisfied!
+executing: {{"command": "echo two", "unless": "false"}}
+.
+success!
+""".lstrip()
+
+SATISFIED_AGAIN_OUTPUT = """
+skipping: {{"command": "false", "creates": "{0}"}}
+skipping: {{"command": "echo two", "unless": "false"}}
+""".lstrip()
+
+
+def test_satisfied(tmp_path, monkeypatch, capsys):
+    reports_path = tmp_path.joinpath("reports")
+
+    def mock_recursive_fetch_script(*_):
+        index = zebr0_script.open_store(reports_path).load_index()
+        for md5, task in (("report1", {"command": "false", "creates": str(tmp_path)}), ("report2", {"command": "echo two", "unless": "false"})):
+            yield task, index.get(md5, {}).get("status", zebr0_script.Status.PENDING), reports_path.joinpath(md5)
+
+    monkeypatch.setattr(zebr0_script, "recursive_fetch_script", mock_recursive_fetch_script)
+
+    zebr0_script.run("http://localhost:8001", [], 1, Path(""), reports_path, "script")
+    assert capsys.readouterr().out == SATISFIED_OUTPUT.format(tmp_path)
+
+    zebr0_script.run("http://localhost:8001", [], 1, Path(""), reports_path, "script")
+    assert capsys.readouterr().out == SATISFIED_AGAIN_OUTPUT.format(tmp_path)
+
+
+LOCKED_OUTPUT = """
+executing: "one"
+waiting for another process executing: "one"
+success!
+executing: "echo two"
+waiting for another process executing: "echo two"
+.
+success!
+""".lstrip()
+
+
+def test_task_lock(tmp_path, monkeypatch, capsys):
+    reports_path = tmp_path.joinpath("reports")
+    report1 = reports_path.joinpath("report1")
+    report2 = reports_path.joinpath("report2")
+
+    def mock_recursive_fetch_script(*_):
+        yield "one", zebr0_script.Status.PENDING, report1
+        yield "echo two", zebr0_script.Status.PENDING, report2
+
+    monkeypatch.setattr(zebr0_script, "recursive_fetch_script", mock_recursive_fetch_script)
+
+    waiting = {}
+    acquire = zebr0_script.FileLock.acquire
+
+    def mock_acquire(self, blocking=True):
+        if blocking and self.path.name in waiting:
+            waiting.pop(self.path.name).set()
+        return acquire(self, blocking)
+
+    monkeypatch.setattr(zebr0_script.FileLock, "acquire", mock_acquire)
+
+    def other_process(report_path, status):  # holds the task's lock until it is waited for, then writes its report
+        lock = zebr0_script.FileLock(reports_path.joinpath(".locks", report_path.name))
+        lock.acquire()
+        waited = waiting[report_path.name] = threading.Event()
+
+        def release():
+            waited.wait()
+            zebr0_script.write_report(report_path, {"command": "other", "status": status, "output": []})
+            lock.release()
+
+        threading.Thread(target=release).start()
+
+    other_process(report1, zebr0_script.Status.SUCCESS)
+    other_process(report2, zebr0_script.Status.FAILURE)
+
+    zebr0_script.run("http://localhost:8001", [], 1, Path(""), reports_path, "script", attempts=1)
+    assert capsys.readouterr().out == LOCKED_OUTPUT
+    assert json.loads(report1.read_text()).get("command") == "other"  # skipped once the other process succeeded
+    assert json.loads(report2.read_text()).get("command") == "echo two"  # executed after the other process failed
+
+
+def test_task_executed_meanwhile(tmp_path, monkeypatch, capsys):
+    reports_path = tmp_path.joinpath("reports")
+    report1 = reports_path.joinpath("report1")
+
+    def mock_recursive_fetch_script(*_):
+        zebr0_script.write_report(report1, {"command": "other", "status": zebr0_script.Status.SUCCESS, "output": []})  # executed by another process, which released the lock
+        yield "echo one", zebr0_script.Status.PENDING, report1  # but still pending when the script was fetched
+
+    monkeypatch.setattr(zebr0_script, "recursive_fetch_script", mock_recursive_fetch_script)
+
+    zebr0_script.run("http://localhost:8001", [], 1, Path(""), reports_path, "script")
+    assert capsys.readouterr().out == 'executing: "echo one"\nsuccess!\n'
+    assert json.loads(report1.read_text()).get("command") == "other"  # not executed again
+
+
+@pytest.mark.parametrize("persistent_shell", [False, True])
+def test_interrupt(tmp_path, monkeypatch, persistent_shell):
+    reports_path = tmp_path.joinpath("reports")
+    pid_path = tmp_path.joinpath("pid")
+
+    def mock_recursive_fetch_script(*_):
+        yield f"echo $$ > {pid_path}; sleep 30", zebr0_script.Status.PENDING, reports_path.joinpath("report1")
+        yield "echo two", zebr0_script.Status.PENDING, reports_path.joinpath("report2")
+
+    monkeypatch.setattr(zebr0_script, "recursive_fetch_script", mock_recursive_fetch_script)
+
+    threading.Timer(1, signal.pthread_kill, (threading.main_thread().ident, signal.SIGINT)).start()  # Ctrl-C
+    start = time.perf_counter()
+    with pytest.raises(KeyboardInterrupt):
+        zebr0_script.run("http://localhost:8001", [], 1, Path(""), reports_path, "script", persistent_shell=persistent_shell)
+    assert time.perf_counter() - start < 10
+
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_path.read_text()), 0)  # the command was killed
+    assert not reports_path.joinpath("report2").exists()  # and the script stopped
+    assert zebr0_script.execute("true").get("status") == zebr0_script.Status.SUCCESS  # commands can be executed again
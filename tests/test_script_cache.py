@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import pytest
+import zebr0
+
+import zebr0_script
+
+
+@pytest.fixture(scope="module")
+def server():
+    with zebr0.TestServer() as server:
+        yield server
+
+
+def test_ttl(server, tmp_path):
+    server.data = {"script": "one"}
+    client = zebr0_script.ScriptCache(zebr0.Client("http://localhost:8000", configuration_file=Path("")), tmp_path, ttl=60)
+    assert client.get("script") == "one"
+
+    server.data = {"script": "two"}
+    assert client.get("script") == "one"
+
+    client.ttl = 0
+    assert client.get("script") == "two"
+
+
+def test_not_found(server, tmp_path):
+    server.data = {}
+    client = zebr0_script.ScriptCache(zebr0.Client("http://localhost:8000", configuration_file=Path("")), tmp_path, ttl=60)
+
+    assert client.get("script") == ""
+    assert not tmp_path.joinpath("entries").exists()
+
+
+def test_offline(server, tmp_path):
+    server.data = {"script": "one", "file": "yin: yang\n"}
+    client = zebr0_script.ScriptCache(zebr0.Client("http://localhost:8000", configuration_file=Path("")), tmp_path, ttl=0)
+    assert client.get("script") == "one"
+    assert client.get("file", strip=False) == "yin: yang\n"
+
+    server.data = {}
+    offline_client = zebr0_script.ScriptCache(zebr0.Client("http://localhost:8000", configuration_file=Path("")), tmp_path, offline=True)
+    assert offline_client.get("script") == "one"
+    assert offline_client.get("file", strip=False) == "yin: yang\n"
+    assert offline_client.get("unknown") == ""
+
+    offline_client.max_stale = -1
+    assert offline_client.get("script") == ""
+
+
+def test_server_unreachable(server, tmp_path):
+    server.data = {"script": "one"}
+    client = zebr0_script.ScriptCache(zebr0.Client("http://localhost:8000", configuration_file=Path("")), tmp_path)
+    assert client.get("script") == "one"
+
+    unreachable_client = zebr0_script.ScriptCache(zebr0.Client("http://localhost:8001", configuration_file=Path("")), tmp_path)
+    unreachable_client.url = client.url  # same cache entries, but the server can't be reached
+    assert unreachable_client.get("script") == "one"
+
+
+def test_lru_eviction(server, tmp_path):
+    server.data = {"one": "1" * 10, "two": "2" * 10, "three": "3" * 10}
+    client = zebr0_script.ScriptCache(zebr0.Client("http://localhost:8000", configuration_file=Path("")), tmp_path, ttl=60, max_size=25)
+
+    client.get("one")
+    client.get("two")
+    client.get("one")  # "one" is now more recently used than "two"
+    client.get("three")
+
+    server.data = {}
+    assert client.get("one") == "1" * 10
+    assert client.get("two") == ""
+    assert client.get("three") == "3" * 10
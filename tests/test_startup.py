@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+BUDGET = 0.25  # in seconds, on top of the interpreter's own startup
+HEAVY_MODULES = ["asyncio", "concurrent.futures", "sqlite3", "subprocess", "yaml", "zebr0"]
+
+SCRIPT = """
+import sys
+import zebr0_script
+
+try:
+    zebr0_script.main(sys.argv[1:])
+except SystemExit:
+    pass
+sys.stderr.write(__import__("json").dumps([module for module in {} if module in sys.modules]))
+""".format(HEAVY_MODULES)
+
+
+def startup(*args):
+    """
+    :return: the best time out of 3 runs, and the heavy modules that were imported
+    """
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", SCRIPT, *args] if args else [sys.executable, "-c", "pass"], env=env, capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times), json.loads(result.stderr) if args else []
+
+
+def test_log(tmp_path):
+    baseline, _ = startup()
+    duration, modules = startup("-r", str(tmp_path), "log")
+
+    assert modules == []
+    assert duration - baseline < BUDGET
+
+
+def test_help():
+    baseline, _ = startup()
+    duration, modules = startup("--help")
+
+    assert modules == []
+    assert duration - baseline < BUDGET
@@ -0,0 +1,82 @@
+import os
+import signal
+import threading
+from pathlib import Path
+
+import pytest
+import zebr0
+
+import zebr0_script
+
+
+@pytest.fixture(scope="module")
+def server():
+    with zebr0.TestServer() as server:
+        yield server
+
+
+def later(delay, function):
+    timer = threading.Timer(delay, function)
+    timer.start()
+    return timer
+
+
+def test_ok(server, tmp_path, capsys):
+    file = tmp_path.joinpath("file")
+    server.data = {"script": [f"echo a >> {file}"]}
+
+    def change():
+        server.data = {"script": [f"echo a >> {file}", {"include": "second"}],
+                       "second": [f"echo b >> {file}"]}
+
+    later(0.7, change)
+    later(1.4, lambda: os.kill(os.getpid(), signal.SIGTERM))
+    zebr0_script.watch("http://localhost:8000", [], 0, Path(""), tmp_path.joinpath("reports"), "script", interval=0.2, attempts=1)
+
+    assert file.read_text() == "a\nb\n"  # each task executed once
+    output = capsys.readouterr().out
+    assert output.count("executing script: script\n") == 2  # only when the script changed
+    assert output.count("skipping:") == 1
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL  # handlers restored
+
+
+def test_ko_then_ok(server, tmp_path, capsys):
+    flag = tmp_path.joinpath("flag")
+    server.data = {"script": [f"[ -f {flag} ] || ! touch {flag}"]}
+
+    later(0.5, lambda: os.kill(os.getpid(), signal.SIGTERM))
+    zebr0_script.watch("http://localhost:8000", [], 0, Path(""), tmp_path.joinpath("reports"), "script", interval=0.1, attempts=1)
+
+    output = capsys.readouterr().out
+    assert output.count("executing script: script\n") == 2  # executed again after the failure, though unchanged
+    assert output.count("success!") == 1
+
+
+def test_stop_between_tasks(server, tmp_path, capsys):
+    file = tmp_path.joinpath("file")
+    server.data = {"script": [f"sleep 0.5 && echo a >> {file}", f"echo b >> {file}"]}
+
+    later(0.2, lambda: os.kill(os.getpid(), signal.SIGTERM))
+    zebr0_script.watch("http://localhost:8000", [], 0, Path(""), tmp_path.joinpath("reports"), "script", interval=0.1)
+
+    assert file.read_text() == "a\n"  # the current task was completed, not the next one
+
+
+def test_error_then_ok(server, tmp_path, monkeypatch, capsys):
+    target = tmp_path.joinpath("target")
+    server.data = {"script": [{"key": "value", "target": str(target)}], "value": "a"}
+    fetch_to_disk, calls = zebr0_script.fetch_to_disk, []
+
+    def mock_fetch_to_disk(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ConnectionError("connection reset by peer")
+        return fetch_to_disk(*args, **kwargs)
+
+    monkeypatch.setattr(zebr0_script, "fetch_to_disk", mock_fetch_to_disk)
+
+    later(0.5, lambda: os.kill(os.getpid(), signal.SIGTERM))
+    zebr0_script.watch("http://localhost:8000", [], 0, Path(""), tmp_path.joinpath("reports"), "script", interval=0.1)
+
+    assert target.read_text() == "a"  # executed again at the next poll
+    assert "error: connection reset by peer\n" in capsys.readouterr().out
@@ -1,211 +1,2559 @@
-import datetime
+from __future__ import annotations  # annotations are not evaluated, so that they can refer to the lazily imported modules
+
+import abc
+import argparse
+import atexit
 import enum
-import hashlib
+import errno
+import functools
+import importlib
 import json
-import subprocess
+import os
+import re
 import sys
+import threading
 import time
+from collections import OrderedDict, deque
+from contextlib import closing, contextmanager, nullcontext, suppress
 from pathlib import Path
-from typing import Tuple, Iterator, Any, Optional, List
+from typing import Tuple, Iterator, Any, Optional, List, Iterable, Dict, AsyncIterator, Callable, Union
+
+
+class LazyModule:
+    """
+    Proxy to a module that is only imported on first use.
+    The heavier modules are imported this way, to keep the startup fast for the commands that don't need them (e.g. "log", which is called often by health checks).
+    """
+
+    def __init__(self, name: str) -> None:
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attribute: str) -> Any:
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, attribute)
+
+
+asyncio = LazyModule("asyncio")
+codecs = LazyModule("codecs")
+datetime = LazyModule("datetime")
+fcntl = LazyModule("fcntl")
+futures = LazyModule("concurrent.futures")
+gzip = LazyModule("gzip")
+hashlib = LazyModule("hashlib")
+random = LazyModule("random")
+resource = LazyModule("resource")
+shlex = LazyModule("shlex")
+shutil = LazyModule("shutil")
+signal = LazyModule("signal")
+sqlite3 = LazyModule("sqlite3")
+subprocess = LazyModule("subprocess")
+yaml = LazyModule("yaml")
+zstandard = LazyModule("zstandard")  # optional, for the zstd compression of the reports
+zebr0 = LazyModule("zebr0")
+
+ATTEMPTS_DEFAULT = 4
+PAUSE_DEFAULT = 10
+PREFETCH_DEFAULT = 1
+JOBS_DEFAULT = 1
+INTERVAL_DEFAULT = 60
+GRACE_PERIOD_DEFAULT = 10
+PERSISTENT_CACHE_DEFAULT = 0
+PERSISTENT_CACHE_SIZE_DEFAULT = 64 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+ENCODING = "utf-8"  # same as zebr0's
+CONFIGURATION_FILE_DEFAULT = Path("/etc/zebr0.conf")  # same as zebr0's
+REPORTS_PATH_DEFAULT = Path("/var/zebr0/script/reports")
+PARSED_SCRIPTS_SIZE = 256
+COMMIT_INTERVAL_DEFAULT = 1
+
+
+CACHE_DIRECTORY = ".cache"
+PARSED_DIRECTORY = "parsed"
+SPOOL_DIRECTORY = ".spool"
+INDEX_FILE = ".index"
+DATABASE_FILE = ".reports.sqlite"
+JOURNAL_FILE = ".journal"
+LOCKS_DIRECTORY = ".locks"
+RUN_LOCK_FILE = "run"
+
+INCLUDE = "include"
+KEY = "key"
+TARGET = "target"
+COMMAND = "command"
+STATUS = "status"
+OUTPUT = "output"
+GROUP = "group"
+CHANGED = "changed"
+DIGEST = "digest"
+MODE = "mode"
+OWNER = "owner"
+SPOOL = "spool"
+DURATION = "duration"
+MD5 = "md5"
+MTIME = "mtime"
+SCRIPT = "script"
+TIME = "time"
+REPORT = "report"
+SUMMARY = "summary"
+START = "start"
+END = "end"
+ATTEMPTS = "attempts"
+EXIT_CODE = "exit_code"
+PAUSE = "pause"
+BACKOFF = "backoff"
+MAX_PAUSE = "max_pause"
+JITTER = "jitter"
+DEADLINE = "deadline"
+RETRY_ON_EXIT_CODES = "retry_on_exit_codes"
+RETRY_ON_PATTERNS = "retry_on_patterns"
+TIMEOUT = "timeout"
+REASON = "reason"
+CREATES = "creates"
+CHECKSUM = "checksum"
+ONLYIF = "onlyif"
+UNLESS = "unless"
+RETRY_OPTIONS = {ATTEMPTS, PAUSE, BACKOFF, MAX_PAUSE, JITTER, DEADLINE, RETRY_ON_EXIT_CODES, RETRY_ON_PATTERNS}
+
+GUARD_OPTIONS = {CREATES, CHECKSUM, ONLYIF, UNLESS}  # in order of cost
+
+COMMAND_OPTIONS = {GROUP, TIMEOUT} | RETRY_OPTIONS | GUARD_OPTIONS
+FETCH_TO_DISK_OPTIONS = {GROUP, MODE, OWNER}
+
+FETCH_TO_DISK_BATCH = object()  # implicit group of consecutive fetches to disk
+
+
+class Backend(str, enum.Enum):
+    DIRECTORY = "directory"
+    SQLITE = "sqlite"
+    JOURNAL = "journal"
+
+
+class Compression(str, enum.Enum):
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+
+class Fsync(str, enum.Enum):
+    ALWAYS = "always"
+    INTERVAL = "interval"
+    NEVER = "never"
+
+
+class Status(str, enum.Enum):
+    PENDING = "pending"
+    SUCCESS = "success"
+    SATISFIED = "satisfied"  # not executed, its guards telling that its effect is already there
+    FAILURE = "failure"
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+DONE = {Status.SUCCESS, Status.SATISFIED}  # the statuses of the tasks skipped by later executions
+
+
+def encode_chunks(text: str) -> Iterator[bytes]:
+    """
+    Encodes a string chunk by chunk, to spare a full-size encoded copy.
+
+    :param text: the string to encode
+    :return: the encoded chunks
+    """
+
+    for i in range(0, len(text), CHUNK_SIZE):
+        yield text[i:i + CHUNK_SIZE].encode(ENCODING)
+
+
+def write_atomically(path: Path, chunks: Iterable[bytes], mode: Optional[int] = None, owner: Optional[str] = None, fsync: bool = True) -> None:
+    """
+    Writes a file atomically: the chunks are streamed into a temporary file in the same directory, which then replaces the file.
+    Readers and crashes never see a partially written file.
+    Without explicit mode and owner, those of the replaced file are kept, if any.
+
+    :param path: Path to the file
+    :param chunks: the content to write, chunk by chunk
+    :param mode: optional permissions of the file (e.g. 0o644)
+    :param owner: optional owner of the file, either "user", "user:group" or ":group"
+    :param fsync: whether to flush the file and its directory to the disk before returning
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)  # make sure the parent directory exists
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+
+    try:
+        with temporary_path.open("wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+
+        if path.exists() and (mode is None or owner is None):
+            stat = path.stat()
+            if mode is None:
+                os.chmod(temporary_path, stat.st_mode & 0o7777)
+            if owner is None:
+                try:
+                    os.chown(temporary_path, stat.st_uid, stat.st_gid)
+                except PermissionError:
+                    pass  # best effort, only privileged users can give away files
+        if mode is not None:
+            os.chmod(temporary_path, mode)
+        if owner is not None:
+            user, _, group = owner.partition(":")
+            shutil.chown(temporary_path, user or None, group or None)
+
+        os.replace(temporary_path, path)
+    finally:
+        if temporary_path.exists():
+            temporary_path.unlink()
+
+    if fsync:
+        directory = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+class ScriptCache:
+    """
+    Persistent cache of the values fetched from the key-value server, wrapping a zebr0 Client.
+
+    Values are stored by content hash in an "objects" directory, and each key points to its current value's hash and fetch time in an "entries" directory.
+    A fresh entry (younger than the ttl) is served without any round-trip, an expired one is fetched again: an identical value only refreshes the entry.
+    When the server is unreachable, or in offline mode, expired entries can still be served if they are not older than ttl + max_stale.
+    The least recently used values are evicted when the total size of the objects exceeds max_size.
+    """
+
+    def __init__(self, client: zebr0.Client, path: Path, ttl: int = PERSISTENT_CACHE_DEFAULT, max_size: int = PERSISTENT_CACHE_SIZE_DEFAULT, offline: bool = False, max_stale: Optional[int] = None) -> None:
+        """
+        :param client: zebr0 Client to the key-value server
+        :param path: Path to the cache's directory
+        :param ttl: in seconds, the duration during which a cached value is served without revalidation
+        :param max_size: in bytes, the maximum total size of the cached values
+        :param offline: if True, values are only ever served from the cache
+        :param max_stale: in seconds, how long after its expiry a cached value can still be served when the server can't be reached, None for no limit
+        """
+
+        self.client = client
+        self.url = client.url
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.max_stale = max_stale
+
+        self.entries_path = path.joinpath("entries")
+        self.objects_path = path.joinpath("objects")
+        self.lock = threading.Lock()
+
+    def get(self, key: str, default: str = "", strip: bool = True) -> str:
+        """
+        Same as zebr0.Client.get, through the cache.
+
+        :param key: key to look for
+        :param default: value to return if the key is not found
+        :param strip: whether to strip the value of its leading and trailing whitespaces
+        :return: the value, or default if it wasn't found
+        """
+
+        entry_path = self.entries_path.joinpath(hashlib.md5(json.dumps([self.url, self.client.levels, key]).encode(ENCODING)).hexdigest())
+        entry = self._read_entry(entry_path)
+        age = time.time() - entry.get("time") if entry else None
+
+        if entry and age <= self.ttl:
+            value = entry.get("value")
+        elif self.offline:
+            value = entry.get("value") if entry and self._is_usable(age) else None
+        else:
+            try:
+                value = self.client.get(key, strip=False)
+            except OSError:
+                if not entry or not self._is_usable(age):
+                    raise
+                value = entry.get("value")
+            else:
+                if value:
+                    self._write_entry(entry_path, key, value)
+                elif entry:
+                    entry_path.unlink()
+
+        if not value:
+            return default
+        return value.strip() if strip else value
+
+    def _is_usable(self, age: float) -> bool:
+        return self.max_stale is None or age <= self.ttl + self.max_stale
+
+    def _read_entry(self, entry_path: Path) -> Optional[dict]:
+        try:
+            entry = json.loads(entry_path.read_text(encoding=ENCODING))
+            object_path = self.objects_path.joinpath(entry.get("sha256"))
+            entry["value"] = object_path.read_text(encoding=ENCODING)
+            os.utime(object_path)  # the objects' mtime is their last use, for the lru eviction
+            return entry
+        except (OSError, ValueError):
+            return None  # missing, corrupted or evicted
+
+    def _write_entry(self, entry_path: Path, key: str, value: str) -> None:
+        sha256 = hashlib.sha256(value.encode(ENCODING)).hexdigest()
+        object_path = self.objects_path.joinpath(sha256)
+        if object_path.exists():
+            os.utime(object_path)
+        else:
+            write_atomically(object_path, encode_chunks(value), fsync=False)
+        write_atomically(entry_path, encode_chunks(json.dumps({"key": key, "sha256": sha256, "time": time.time()})), fsync=False)
+
+        self._evict()
+
+    def _evict(self) -> None:
+        with self.lock:
+            objects = []
+            for path in self.objects_path.iterdir():
+                if path.name.startswith("."):
+                    continue  # temporary file of a write in progress
+                try:
+                    objects.append((path.stat(), path))
+                except FileNotFoundError:
+                    pass  # evicted in the meantime by another process
+
+            total_size = sum(stat.st_size for stat, _ in objects)
+            for stat, path in sorted(objects, key=lambda o: o[0].st_mtime):
+                if total_size <= self.max_size:
+                    break
+                path.unlink(missing_ok=True)
+                total_size -= stat.st_size
+
+
+class FileLock:
+    """
+    An advisory lock (flock) on a file, either shared or exclusive, which is released when the process ends, however it ends.
+    Lock files are never deleted, as another process could be waiting on them.
+    """
+
+    def __init__(self, path: Path, shared: bool = False) -> None:
+        """
+        :param path: Path to the lock file, created if missing
+        :param shared: whether the lock is shared, exclusive otherwise
+        """
+
+        self.path = path
+        self.shared = shared
+        self.fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        :param blocking: whether to wait for the lock if it's held by another process
+        :return: whether the lock was acquired
+        """
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)  # make sure the parent directory exists
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self.fd, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            os.close(self.fd)
+            self.fd = None
+            return False
+
+    def release(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)  # also releases the lock
+            self.fd = None
+
+    def __enter__(self) -> "FileLock":
+        if self.fd is None:
+            self.acquire()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.release()
+
+
+def lock_reports(reports_path: Path, shared: bool = True, say: Callable[..., None] = print) -> FileLock:
+    """
+    Locks a reports' directory as a whole: shared by the executions, which can then overlap, and exclusive for the maintenance operations (e.g. migrate).
+    Reading the reports (e.g. show, log) requires no lock.
+
+    :param reports_path: Path to the reports' directory
+    :param shared: whether the lock is shared, exclusive otherwise
+    :param say: the function used to print a message if the lock must be waited for
+    :return: the acquired FileLock
+    """
+
+    lock = FileLock(reports_path.joinpath(LOCKS_DIRECTORY, RUN_LOCK_FILE), shared)
+    if not lock.acquire(blocking=False):
+        say("waiting for a maintenance operation to end..." if shared else "waiting for the executions in progress to end...")
+        lock.acquire()
+    return lock
+
+
+INDEX_LOCK = threading.Lock()
+
+
+def is_report(entry: os.DirEntry) -> bool:
+    return entry.is_file() and not entry.name.startswith(".")  # hidden files and directories are internal (index, cache, spool...)
+
+
+def get_summary(report: dict) -> dict:
+    return {field: value for field, value in report.items() if field not in (OUTPUT, ATTEMPTS)}
+
+
+def get_index_entry(md5: str, report: dict, mtime: int, key: Optional[str] = None) -> dict:
+    return {MD5: md5, STATUS: report.get(STATUS), MTIME: mtime, DURATION: report.get(DURATION), SCRIPT: key, SUMMARY: get_summary(report)}
+
+
+def compress(data: bytes, compression: Compression) -> bytes:
+    if compression == Compression.GZIP:
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if compression == Compression.ZSTD:
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def decompress(data: bytes) -> bytes:
+    """
+    :param data: data compressed with any Compression, told apart by their magic number, or plain json
+    :return: the decompressed data
+    """
+
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    if data.startswith(ZSTD_MAGIC):
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def encode_report(report: dict, compression: Compression = Compression.NONE) -> bytes:
+    """
+    :param report: an execution report
+    :param compression: the Compression of the result, without which the json is indented for human readers
+    :return: the report as (possibly compressed) json
+    """
+
+    if compression == Compression.NONE:
+        return json.dumps(report, indent=2).encode(ENCODING)
+    return compress(json.dumps(report, separators=(",", ":")).encode(ENCODING), compression)
+
+
+def decode_report(data: Union[str, bytes]) -> Any:
+    return json.loads(decompress(data) if isinstance(data, bytes) else data)
+
+
+def read_report(report_path: Path) -> Any:
+    """
+    :param report_path: Path to a report file, compressed or not
+    :return: the report
+    :raises ValueError: if the file isn't a report
+    """
+
+    data = report_path.read_bytes()
+    try:
+        return decode_report(data)
+    except (OSError, EOFError) as error:  # e.g. truncated compressed data (gzip.BadGzipFile is an OSError)
+        raise ValueError(f"corrupted report: {error}")
+
+
+def write_report(report_path: Path, report: dict, key: Optional[str] = None, compression: Compression = Compression.NONE) -> None:
+    """
+    Writes an execution report, and appends its status and summary to the index of the reports' directory.
+
+    :param report_path: Path to the report
+    :param report: the execution report
+    :param key: the key of the script being executed
+    :param compression: the Compression of the report
+    """
+
+    write_atomically(report_path, [encode_report(report, compression)], fsync=False)  # readers and concurrent writers never see a partial report
+
+    entry = get_index_entry(report_path.name, report, report_path.stat().st_mtime_ns, key)
+    with INDEX_LOCK, report_path.parent.joinpath(INDEX_FILE).open("ab") as index:
+        index.write((json.dumps(entry) + "\n").encode(ENCODING))  # a single append, not interleaved with those of other processes
+
+
+def load_index(reports_path: Path) -> Dict[str, dict]:
+    """
+    Loads the index of the reports' directory, which gives the status, mtime, duration, script key and summary (i.e. all but the output) of each report without parsing it.
+    The index is an append-only file of json lines, the last line of a report being the current one.
+    Stale entries (reports added, removed or modified behind the index' back) are refreshed, in which case, or if the index has grown too much, it is rewritten.
+
+    :param reports_path: Path to the reports' directory
+    :return: the index entries, by md5
+    """
+
+    if not reports_path.is_dir():
+        return {}
+
+    index_path = reports_path.joinpath(INDEX_FILE)
+    index, lines = {}, 0
+    try:
+        with index_path.open(encoding=ENCODING) as file:
+            for line in file:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                    index[entry[MD5]] = entry
+                except (ValueError, KeyError, TypeError):
+                    pass  # e.g. a line truncated by a crash
+    except FileNotFoundError:
+        pass
+
+    mtimes = {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(reports_path) if is_report(entry)}
+    stale = [md5 for md5, mtime in mtimes.items() if index.get(md5, {}).get(MTIME) != mtime or SUMMARY not in index.get(md5)]
+    if not stale and index.keys() == mtimes.keys() and lines <= 2 * len(index):
+        return index
+
+    index = {md5: entry for md5, entry in index.items() if md5 in mtimes}
+    for md5 in stale:
+        try:
+            report = read_report(reports_path.joinpath(md5))
+        except ValueError:
+            report = {}  # not a report
+        index[md5] = get_index_entry(md5, report if isinstance(report, dict) else {}, mtimes[md5], index.get(md5, {}).get(SCRIPT))
+
+    with INDEX_LOCK, suppress(OSError):  # e.g. "show" or "log" on a read-only reports' directory, the refreshed index is still returned
+        write_atomically(index_path, encode_chunks("".join(json.dumps(entry) + "\n" for entry in index.values())), fsync=False)
+    return index
+
+
+class ReportStore(abc.ABC):
+    """
+    Where the execution reports of a reports' directory are kept.
+    Reports are identified by their Path in the reports' directory, whose name is the md5 of the task.
+    """
+
+    def __init__(self, reports_path: Path, compression: Compression = Compression.NONE) -> None:
+        """
+        :param reports_path: Path to the reports' directory
+        :param compression: the Compression of the reports written, those already written being read whatever their compression
+        """
+
+        self.reports_path = reports_path
+        self.compression = compression
+
+    @abc.abstractmethod
+    def load_index(self) -> Dict[str, dict]:
+        """
+        :return: the status, mtime and duration of the current report of each task, by md5
+        """
+
+    @abc.abstractmethod
+    def read(self, md5: str) -> Optional[dict]:
+        """
+        :param md5: the task's md5
+        :return: the task's current report, None if there is none
+        """
+
+    @abc.abstractmethod
+    def write(self, report_path: Path, report: dict, key: Optional[str] = None) -> None:
+        """
+        :param report_path: Path to the report
+        :param report: the execution report
+        :param key: the key of the script being executed
+        """
+
+    @abc.abstractmethod
+    def reports(self) -> Iterator[Tuple[str, float, dict]]:
+        """
+        :return: the md5, timestamp and content of the current report of each task, in chronological order
+        """
+
+    @abc.abstractmethod
+    def summaries(self, since: Optional[float] = None, until: Optional[float] = None, status: Optional[Status] = None, key: Optional[str] = None, limit: Optional[int] = None) -> Iterator[Tuple[str, float, dict]]:
+        """
+        :param since: if set, only the reports written since this timestamp
+        :param until: if set, only the reports written until this timestamp
+        :param status: if set, only the reports with this status
+        :param key: if set, only the reports written while executing the script with this key
+        :param limit: if set, only this number of the most recent reports
+        :return: the md5, timestamp and summary (i.e. all but the output) of the current report of each task, in chronological order
+        """
+
+    @abc.abstractmethod
+    def history(self, md5: str) -> List[Tuple[Optional[str], float, dict]]:
+        """
+        :param md5: the task's md5
+        :return: the script key, timestamp and content of every known report of the task, in chronological order
+        """
+
+    @abc.abstractmethod
+    def delete(self, md5s: Iterable[str]) -> None:
+        """
+        Deletes the reports of some tasks, along with their history.
+
+        :param md5s: the md5 of the tasks
+        """
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """
+        Deletes all the reports.
+        """
+
+
+class DirectoryStore(ReportStore):
+    """
+    One json file per task, named after its md5, plus an index file.
+    """
+
+    def load_index(self) -> Dict[str, dict]:
+        return load_index(self.reports_path)
+
+    def read(self, md5: str) -> Optional[dict]:
+        report_path = self.reports_path.joinpath(md5)
+        return read_report(report_path) if report_path.is_file() else None
+
+    def write(self, report_path: Path, report: dict, key: Optional[str] = None) -> None:
+        write_report(report_path, report, key, self.compression)
+
+    def reports(self) -> Iterator[Tuple[str, float, dict]]:
+        if not self.reports_path.exists():
+            return
+
+        def get_mtime(path):
+            return path.stat().st_mtime
+
+        for file in filter(lambda p: p.is_file() and not p.name.startswith("."), sorted(self.reports_path.iterdir(), key=get_mtime)):
+            yield file.name, get_mtime(file), read_report(file)
+
+    def summaries(self, since: Optional[float] = None, until: Optional[float] = None, status: Optional[Status] = None, key: Optional[str] = None, limit: Optional[int] = None) -> Iterator[Tuple[str, float, dict]]:
+        entries = [entry for entry in sorted(self.load_index().values(), key=lambda e: e.get(MTIME))  # only the stale reports are parsed
+                   if (since is None or entry.get(MTIME) >= since * 1e9) and (until is None or entry.get(MTIME) <= until * 1e9) and (status is None or entry.get(STATUS) == status) and (key is None or entry.get(SCRIPT) == key)]
+
+        for entry in entries[-limit:] if limit else entries:
+            yield entry.get(MD5), entry.get(MTIME) / 1e9, entry.get(SUMMARY)
+
+    def history(self, md5: str) -> List[Tuple[Optional[str], float, dict]]:
+        entry = self.load_index().get(md5)  # only the current report is kept
+        return [(entry.get(SCRIPT), entry.get(MTIME) / 1e9, self.read(md5))] if entry else []
+
+    def delete(self, md5s: Iterable[str]) -> None:
+        for md5 in md5s:
+            self.reports_path.joinpath(md5).unlink(missing_ok=True)  # the index catches up on its next load
+
+    def clear(self) -> None:
+        if not self.reports_path.exists():
+            return
+
+        for entry in os.scandir(self.reports_path):
+            if is_report(entry) or entry.name == INDEX_FILE:
+                os.unlink(entry.path)
+
+
+class SQLiteStore(ReportStore):
+    """
+    A local SQLite database, keeping every execution of every task along with the key of the script being executed.
+    """
+
+    def __init__(self, reports_path: Path, compression: Compression = Compression.NONE) -> None:
+        super().__init__(reports_path, compression)
+        self.database_path = reports_path.joinpath(DATABASE_FILE)
+
+    def connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """
+        :param read_only: whether the connection only reads the database, in which case the database isn't created nor altered, and can be in a read-only directory
+        :return: a connection to the database
+        """
+
+        if read_only:
+            return sqlite3.connect(f"{self.database_path.absolute().as_uri()}?mode=ro", timeout=30, uri=True)
+
+        self.reports_path.mkdir(parents=True, exist_ok=True)  # make sure the parent directory exists
+        connection = sqlite3.connect(self.database_path, timeout=30)  # a connection per operation, so that it can be used from several threads
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS executions (id INTEGER PRIMARY KEY AUTOINCREMENT, md5 TEXT NOT NULL, script TEXT, status TEXT, time REAL NOT NULL, duration REAL, summary TEXT NOT NULL, report TEXT NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS executions_md5 ON executions (md5, id)")
+        connection.execute("CREATE INDEX IF NOT EXISTS executions_time ON executions (time)")
+        return connection
+
+    def load_index(self) -> Dict[str, dict]:
+        if not self.database_path.exists():
+            return {}
+
+        with closing(self.connect(read_only=True)) as connection:
+            rows = connection.execute("SELECT md5, status, time, duration FROM executions WHERE id IN (SELECT MAX(id) FROM executions GROUP BY md5)")
+            return {md5: {MD5: md5, STATUS: status, MTIME: int(timestamp * 1e9), DURATION: duration} for md5, status, timestamp, duration in rows}
+
+    def read(self, md5: str) -> Optional[dict]:
+        if not self.database_path.exists():
+            return None
+
+        with closing(self.connect(read_only=True)) as connection:
+            row = connection.execute("SELECT report FROM executions WHERE md5 = ? ORDER BY id DESC LIMIT 1", (md5,)).fetchone()
+            return decode_report(row[0]) if row else None
+
+    def write(self, report_path: Path, report: dict, key: Optional[str] = None, timestamp: Optional[float] = None) -> None:
+        with closing(self.connect()) as connection, connection:
+            connection.execute("INSERT INTO executions (md5, script, status, time, duration, summary, report) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (report_path.name, key, report.get(STATUS), timestamp or time.time(), report.get(DURATION), json.dumps(get_summary(report)), json.dumps(report) if self.compression == Compression.NONE else compress(json.dumps(report).encode(ENCODING), self.compression)))  # compressed as a blob
+
+    def reports(self) -> Iterator[Tuple[str, float, dict]]:
+        if not self.database_path.exists():
+            return
+
+        with closing(self.connect(read_only=True)) as connection:
+            for md5, timestamp, report in connection.execute("SELECT md5, time, report FROM executions WHERE id IN (SELECT MAX(id) FROM executions GROUP BY md5) ORDER BY time"):
+                yield md5, timestamp, decode_report(report)
+
+    def summaries(self, since: Optional[float] = None, until: Optional[float] = None, status: Optional[Status] = None, key: Optional[str] = None, limit: Optional[int] = None) -> Iterator[Tuple[str, float, dict]]:
+        if not self.database_path.exists():
+            return
+
+        conditions, parameters = ["id IN (SELECT MAX(id) FROM executions GROUP BY md5)"], []
+        for condition, parameter in (("time >= ?", since), ("time <= ?", until), ("status = ?", status), ("script = ?", key)):
+            if parameter is not None:
+                conditions.append(condition)
+                parameters.append(parameter)
+
+        query = f"SELECT md5, time, summary FROM executions WHERE {' AND '.join(conditions)} ORDER BY time DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+
+        with closing(self.connect(read_only=True)) as connection:
+            rows = connection.execute(query, parameters).fetchall()
+        for md5, timestamp, summary in reversed(rows):
+            yield md5, timestamp, json.loads(summary)
+
+    def history(self, md5: str) -> List[Tuple[Optional[str], float, dict]]:
+        if not self.database_path.exists():
+            return []
+
+        with closing(self.connect(read_only=True)) as connection:
+            return [(script, timestamp, decode_report(report)) for script, timestamp, report in connection.execute("SELECT script, time, report FROM executions WHERE md5 = ? ORDER BY id", (md5,))]
+
+    def delete(self, md5s: Iterable[str]) -> None:
+        if not self.database_path.exists():
+            return
+
+        with closing(self.connect()) as connection, connection:
+            connection.executemany("DELETE FROM executions WHERE md5 = ?", ((md5,) for md5 in md5s))
+
+    def clear(self) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            self.reports_path.joinpath(DATABASE_FILE + suffix).unlink(missing_ok=True)
+
+
+def encode_record(record: dict) -> bytes:
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode(ENCODING)
+
+
+def get_last_records(records: Iterable[dict]) -> Tuple[List[dict], int]:
+    """
+    :param records: the records of a journal
+    :return: the last record of each task in chronological order, and the total number of records
+    """
+
+    last, count = {}, 0
+    for record in records:
+        last.pop(record.get(MD5), None)  # so that the dict's order is the order of the last records
+        last[record.get(MD5)] = record
+        count += 1
+    return list(last.values()), count
+
+
+class JournalWriter:
+    """
+    Appends records to a journal file, shared by all the JournalStores of a same journal in the process.
+
+    Each record is a single line, appended with a single write: records of concurrent writers, even from other processes, are never interleaved.
+    Compaction replaces the file under an exclusive lock, after which the writers reopen it.
+
+    Durability is up to the fsync policy:
+    - ALWAYS, a record is synced to disk before write() returns, concurrent writers sharing their fsyncs (group commit)
+    - INTERVAL, records are synced at most every "commit interval" seconds, and at exit
+    - NEVER, syncing is left to the operating system
+    In any case, records are handed to the operating system straight away, so that they survive a crash of the process.
+    """
+
+    writers: Dict[Path, "JournalWriter"] = {}
+    writers_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, journal_path: Path) -> "JournalWriter":
+        with cls.writers_lock:
+            return cls.writers.setdefault(journal_path, JournalWriter(journal_path))
+
+    @classmethod
+    def sync_all(cls) -> None:
+        with cls.writers_lock:
+            for writer in cls.writers.values():
+                writer.sync(writer.written)
+
+    def __init__(self, journal_path: Path) -> None:
+        self.journal_path = journal_path
+        self.fd = None
+        self.lock = threading.Lock()  # serializes the appends
+        self.sync_lock = threading.Lock()  # serializes the fsyncs, while the appends go on
+        self.written, self.synced, self.sync_time = 0, 0, time.monotonic()
+
+    def open(self) -> None:
+        """
+        (Re)opens the journal if it's not opened yet or if it has been replaced by a compaction, and locks it in shared mode.
+        """
+
+        while True:
+            if self.fd is None:
+                self.journal_path.parent.mkdir(parents=True, exist_ok=True)  # make sure the parent directory exists
+                self.fd = os.open(self.journal_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_SH)
+            with suppress(FileNotFoundError):
+                if os.stat(self.journal_path).st_ino == os.fstat(self.fd).st_ino:
+                    return
+            os.close(self.fd)  # also releases the lock, the records written to the replaced file are in the compacted one
+            self.fd = None
+
+    def write(self, record: dict, fsync: Fsync = Fsync.ALWAYS, commit_interval: float = COMMIT_INTERVAL_DEFAULT) -> None:
+        """
+        :param record: the record to append
+        :param fsync: the fsync policy
+        :param commit_interval: in seconds, the maximum delay between two fsyncs with the INTERVAL policy
+        """
+
+        line = encode_record(record)
+        with self.lock:
+            self.open()
+            try:
+                end = os.lseek(self.fd, 0, os.SEEK_END)
+                if end and os.pread(self.fd, 1, end - 1) != b"\n":
+                    line = b"\n" + line  # the last record was torn by a crash, it must not swallow this one
+                os.write(self.fd, line)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.written += 1
+            sequence = self.written
+
+        if fsync == Fsync.ALWAYS or fsync == Fsync.INTERVAL and time.monotonic() - self.sync_time >= commit_interval:
+            self.sync(sequence)
+
+    def sync(self, sequence: int) -> None:
+        """
+        Makes sure the records up to a given one are on the disk.
+        A single fsync covers all the records appended meanwhile by the other threads, which then don't need one of their own (group commit).
+
+        :param sequence: number of the record
+        """
+
+        with self.sync_lock:
+            if self.synced >= sequence:
+                return  # already synced along with another record
+
+            with self.lock:
+                if self.fd is None:
+                    return
+                written, fd = self.written, os.dup(self.fd)  # the original may be closed by a reopening meanwhile
+
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.synced, self.sync_time = written, time.monotonic()
+
+
+atexit.register(JournalWriter.sync_all)  # the records pending with the INTERVAL policy
+
+
+class JournalReader:
+    """
+    Keeps the last record of each task of a journal file, shared by all the JournalStores of a same journal in the process.
+    Each lookup only reads the records appended since the previous one: the journal is read again from the start only once it has been replaced (by a compaction or a deletion).
+    The journal is kept open, so that its inode can't be reused by its replacement.
+    """
+
+    readers: Dict[Path, "JournalReader"] = {}
+    readers_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, journal_path: Path) -> "JournalReader":
+        with cls.readers_lock:
+            return cls.readers.setdefault(journal_path, JournalReader(journal_path))
+
+    def __init__(self, journal_path: Path) -> None:
+        self.journal_path = journal_path
+        self.file = None
+        self.lock = threading.Lock()
+        self.last: Dict[str, dict] = {}
+
+    def read(self, md5: str) -> Optional[dict]:
+        """
+        :param md5: the task's md5
+        :return: the task's last record, None if there is none
+        """
+
+        with self.lock:
+            try:
+                if self.file is None or os.stat(self.journal_path).st_ino != os.fstat(self.file.fileno()).st_ino:
+                    self.close()
+                    self.file = self.journal_path.open("rb")
+            except FileNotFoundError:
+                self.close()
+                return None
+
+            while True:
+                position = self.file.tell()
+                line = self.file.readline()
+                if not line.endswith(b"\n"):
+                    self.file.seek(position)  # the end of the journal, or a record being appended: read again next time
+                    break
+                with suppress(ValueError):  # a record torn by a crash
+                    record = json.loads(line)
+                    self.last[record.get(MD5)] = record
+            return self.last.get(md5)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+        self.file, self.last = None, {}
+
+
+class JournalStore(ReportStore):
+    """
+    A single append-only journal file, with one compact json record per execution of a task, the last record of a task being its current report.
+    Writing a report is a single append instead of a file creation, and a record torn by a crash is ignored.
+    The journal is compacted into the last record of each task when it holds more than twice as many records as tasks.
+    """
+
+    def __init__(self, reports_path: Path, fsync: Fsync = Fsync.ALWAYS, commit_interval: float = COMMIT_INTERVAL_DEFAULT) -> None:
+        """
+        :param reports_path: Path to the reports' directory
+        :param fsync: the fsync policy of the writes, see JournalWriter
+        :param commit_interval: in seconds, the maximum delay between two fsyncs with the INTERVAL policy
+        """
+
+        super().__init__(reports_path)
+        self.journal_path = reports_path.joinpath(JOURNAL_FILE)
+        self.fsync = fsync
+        self.commit_interval = commit_interval
+
+    def records(self) -> Iterator[dict]:
+        try:
+            with self.journal_path.open("rb") as journal:
+                for line in journal:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        pass  # a record torn by a crash
+        except FileNotFoundError:
+            return
+
+    def current_records(self) -> List[dict]:
+        """
+        :return: the last record of each task, in chronological order
+        """
+
+        current, count = get_last_records(self.records())
+        if count > 2 * len(current):
+            self.compact()
+        return current
+
+    def compact(self) -> None:
+        """
+        Rewrites the journal with only the last record of each task, under an exclusive lock so that no record written meanwhile is lost.
+        Readers never wait for the lock: if it's not available at once, the compaction is skipped, as it is if the reports' directory is not writable.
+        """
+
+        try:
+            fd = os.open(self.journal_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if os.stat(self.journal_path).st_ino == os.fstat(fd).st_ino:  # not compacted meanwhile by another process
+                current, _ = get_last_records(self.records())
+                write_atomically(self.journal_path, (encode_record(record) for record in current))
+        except OSError:
+            pass  # e.g. a record is being appended: the compaction is left to a later load rather than waited for
+        finally:
+            os.close(fd)
+
+    def load_index(self) -> Dict[str, dict]:
+        return {record.get(MD5): get_index_entry(record.get(MD5), record.get(REPORT), int(record.get(TIME) * 1e9), record.get(SCRIPT)) for record in self.current_records()}
+
+    def read(self, md5: str) -> Optional[dict]:
+        record = JournalReader.get(self.journal_path).read(md5)
+        return record.get(REPORT) if record else None
+
+    def write(self, report_path: Path, report: dict, key: Optional[str] = None, timestamp: Optional[float] = None) -> None:
+        JournalWriter.get(self.journal_path).write({MD5: report_path.name, SCRIPT: key, TIME: timestamp or time.time(), REPORT: report}, self.fsync, self.commit_interval)
+
+    def reports(self) -> Iterator[Tuple[str, float, dict]]:
+        for record in sorted(self.current_records(), key=lambda r: r.get(TIME)):
+            yield record.get(MD5), record.get(TIME), record.get(REPORT)
+
+    def summaries(self, since: Optional[float] = None, until: Optional[float] = None, status: Optional[Status] = None, key: Optional[str] = None, limit: Optional[int] = None) -> Iterator[Tuple[str, float, dict]]:
+        entries = [entry for entry in sorted(self.load_index().values(), key=lambda e: e.get(MTIME))
+                   if (since is None or entry.get(MTIME) >= since * 1e9) and (until is None or entry.get(MTIME) <= until * 1e9) and (status is None or entry.get(STATUS) == status) and (key is None or entry.get(SCRIPT) == key)]
+
+        for entry in entries[-limit:] if limit else entries:
+            yield entry.get(MD5), entry.get(MTIME) / 1e9, entry.get(SUMMARY)
+
+    def history(self, md5: str) -> List[Tuple[Optional[str], float, dict]]:
+        return [(record.get(SCRIPT), record.get(TIME), record.get(REPORT)) for record in self.records() if record.get(MD5) == md5]
+
+    def delete(self, md5s: Iterable[str]) -> None:
+        md5s = set(md5s)
+        try:
+            fd = os.open(self.journal_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            write_atomically(self.journal_path, (encode_record(record) for record in self.records() if record.get(MD5) not in md5s))
+        finally:
+            os.close(fd)
+
+    def clear(self) -> None:
+        self.journal_path.unlink(missing_ok=True)
+
+
+STORES = {Backend.DIRECTORY: DirectoryStore, Backend.SQLITE: SQLiteStore, Backend.JOURNAL: JournalStore}
+
+
+def open_store(reports_path: Path, fsync: Fsync = Fsync.ALWAYS, commit_interval: float = COMMIT_INTERVAL_DEFAULT, compression: Compression = Compression.NONE) -> ReportStore:
+    """
+    Opens the ReportStore of a reports' directory: a SQLite database or a journal if the directory contains one, plain json files otherwise.
+
+    :param reports_path: Path to the reports' directory
+    :param fsync: the fsync policy of the writes, for a journal
+    :param commit_interval: in seconds, the maximum delay between two fsyncs with the INTERVAL policy, for a journal
+    :param compression: the Compression of the reports written, for a SQLite database or plain json files
+    :return: the ReportStore
+    """
+
+    if reports_path.joinpath(DATABASE_FILE).exists():
+        return SQLiteStore(reports_path, compression)
+    if reports_path.joinpath(JOURNAL_FILE).exists():
+        return JournalStore(reports_path, fsync, commit_interval)
+    return DirectoryStore(reports_path, compression)
+
+
+def migrate(reports_path: Path, backend: Backend, journal_fsync: Fsync = Fsync.ALWAYS, journal_commit_interval: float = COMMIT_INTERVAL_DEFAULT, compress_reports: Compression = Compression.NONE, **_) -> None:
+    """
+    Moves the reports of a reports' directory to another backend: a SQLite database, a journal, or plain json files (the default).
+    Only the current report of each task is exported, with the report's time as mtime for plain json files.
+
+    :param reports_path: Path to the reports' directory
+    :param backend: the target backend
+    :param journal_fsync: the fsync policy of the writes to a journal of reports
+    :param journal_commit_interval: in seconds, the maximum delay between two fsyncs of a journal with the "interval" policy
+    :param compress_reports: the Compression of the reports written
+    """
+
+    with lock_reports(reports_path, shared=False):  # no execution meanwhile
+        source = open_store(reports_path)
+        if type(source) is STORES.get(backend):
+            print(f"reports are already stored in the {backend.value} backend")
+            return
+
+        target = JournalStore(reports_path, journal_fsync, journal_commit_interval) if backend == Backend.JOURNAL else STORES.get(backend)(reports_path, compress_reports)
+        if isinstance(target, SQLiteStore):  # created first, so that the backend is switched even without any report
+            target.connect().close()
+        elif isinstance(target, JournalStore):
+            target.journal_path.touch()
+
+        count = 0
+        for md5, timestamp, report in source.reports():
+            report_path = reports_path.joinpath(md5)
+            if isinstance(target, DirectoryStore):
+                report_path.write_bytes(encode_report(report, compress_reports))
+                os.utime(report_path, (timestamp, timestamp))
+            else:
+                target.write(report_path, report, timestamp=timestamp)
+            count += 1
+
+        source.clear()
+    print(f"{count} reports migrated to the {backend.value} backend")
+
+
+def gc(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, key: Union[str, List[str]], older_than: Optional[float] = None, keep: Optional[int] = None, max_size: Optional[int] = None, archive: Optional[Path] = None, dry_run: bool = False, prefetch: int = PREFETCH_DEFAULT, persistent_cache: int = PERSISTENT_CACHE_DEFAULT, persistent_cache_size: int = PERSISTENT_CACHE_SIZE_DEFAULT, offline: bool = False, max_stale: Optional[int] = None, **_) -> None:
+    """
+    Removes the reports of the tasks that don't appear anymore in the given scripts, nor in the scripts they include.
+    Nothing is removed if a script or an included script can't be fetched, isn't found or isn't a proper list.
+    Without limits, every unreferenced report is removed, otherwise only those written before a given time, those beyond a number of the most recent ones, and those beyond a total size of the most recent ones.
+    Removed reports can be archived first, as gzip-compressed json lines.
+
+    :param url: (zebr0) URL of the key-value server, defaults to https://hub.zebr0.io
+    :param levels: (zebr0) levels of specialization (e.g. ["mattermost", "production"] for a <project>/<environment>/<key> structure), defaults to []
+    :param cache: (zebr0) in seconds, the duration of the cache of http responses, defaults to 300 seconds
+    :param configuration_file: (zebr0) path to the configuration file, defaults to /etc/zebr0.conf for a system-wide configuration
+    :param reports_path: Path to the reports' directory
+    :param key: the script's key, or a list of keys, whose tasks' reports are kept
+    :param older_than: if set, only the unreferenced reports written before this timestamp are removed
+    :param keep: if set, this number of the most recent unreferenced reports are kept
+    :param max_size: if set, the most recent unreferenced reports are kept up to this total size in bytes (as json)
+    :param archive: optional Path to a file the removed reports are appended to
+    :param dry_run: if True, the reports that would be removed are only displayed
+    :param prefetch: maximum number of scripts fetched concurrently, 1 disables prefetching
+    :param persistent_cache: in seconds, the duration of the persistent cache of fetched values, 0 disables it
+    :param persistent_cache_size: in bytes, the maximum total size of the persistent cache
+    :param offline: if True, values are only ever served from the persistent cache
+    :param max_stale: in seconds, how long after its expiry a cached value can still be served when the server can't be reached, None for no limit
+    """
+
+    client = build_client(url, levels, cache, configuration_file, reports_path, persistent_cache, persistent_cache_size, offline, max_stale)
+    referenced, unresolved = set(), []
+    try:
+        for script_key in [key] if isinstance(key, str) else key:
+            referenced.update(report_path.name for _, _, report_path in recursive_fetch_script(client, script_key, reports_path, prefetch, unresolved, True))
+    except OSError as error:  # nothing is removed from an incomplete picture
+        print("error: key-value server unreachable:", error)
+        return
+    if unresolved:
+        print("error: incomplete scripts, nothing removed:", ", ".join(unresolved))
+        return
+
+    with lock_reports(reports_path, shared=False):  # no execution meanwhile
+        store = open_store(reports_path)
+        candidates = [(md5, timestamp, summary) for md5, timestamp, summary in store.summaries() if md5 not in referenced]
+
+        def is_removed(rank: int, timestamp: float, size: int) -> bool:
+            if older_than is None and keep is None and max_size is None:
+                return True
+            return older_than is not None and timestamp < older_than or keep is not None and rank >= keep or max_size is not None and size > max_size
+
+        removed, size = [], 0
+        for rank, (md5, timestamp, summary) in enumerate(reversed(candidates)):  # from the most recent
+            if max_size is not None:
+                size += len(json.dumps(store.read(md5)).encode(ENCODING))
+            if is_removed(rank, timestamp, size):
+                removed.append((md5, timestamp, summary))
+        removed.reverse()  # back to chronological order
+
+        for md5, timestamp, summary in removed:
+            print("would remove:" if dry_run else "removing:", md5, datetime.datetime.fromtimestamp(timestamp).strftime("%c"), json.dumps(summary))
+
+        if removed and not dry_run:
+            if archive:
+                with gzip.open(archive, "at", encoding=ENCODING) as file:  # a new gzip member per run
+                    for md5, timestamp, _ in removed:
+                        file.write(json.dumps({MD5: md5, TIME: timestamp, REPORT: store.read(md5)}) + "\n")
+
+            store.delete(md5 for md5, _, _ in removed)
+            for md5, _, _ in removed:
+                reports_path.joinpath(SPOOL_DIRECTORY, f"{md5}.gz").unlink(missing_ok=True)
+                reports_path.joinpath(LOCKS_DIRECTORY, md5).unlink(missing_ok=True)  # safe, as no execution is waiting on it
+
+    print(f"{len(removed)} unreferenced reports {'would be removed' if dry_run else 'removed'}, {len(candidates) - len(removed)} kept" + (f", archived to {archive}" if archive and removed and not dry_run else ""))
+
+
+def is_include(task: Any) -> bool:
+    return isinstance(task, dict) and task.keys() == {INCLUDE}
+
+
+def is_command(task: Any) -> bool:
+    return isinstance(task, str) or isinstance(task, dict) and isinstance(task.get(COMMAND), str) and task.keys() <= {COMMAND} | COMMAND_OPTIONS
+
+
+def is_fetch_to_disk(task: Any) -> bool:
+    return isinstance(task, dict) and {KEY, TARGET} <= task.keys() <= {KEY, TARGET} | FETCH_TO_DISK_OPTIONS
+
+
+def stringify(data: Any) -> Any:
+    """
+    :param data: data parsed from json
+    :return: the same data as yaml's BaseLoader would have parsed it, with every scalar as a string
+    """
+
+    if isinstance(data, list):
+        return [stringify(item) for item in data]
+    if isinstance(data, dict):
+        return {key: stringify(value) for key, value in data.items()}
+    if isinstance(data, bool):
+        return "true" if data else "false"
+    if data is None:
+        return "null"
+    return data
+
+
+def parse_script(value: str) -> Any:
+    """
+    Parses a script, yaml being a superset of json.
+    Json is tried first as it is much faster to parse, then yaml with libyaml's loader if available.
+    Either way, every scalar is parsed as a string.
+
+    :param value: the raw script
+    :return: the parsed script
+    """
+
+    if value.startswith(("[", "{")):
+        try:
+            return stringify(json.loads(value, parse_int=str, parse_float=str, parse_constant=str))
+        except ValueError:
+            pass  # flow-style yaml, most probably
+    return yaml.load(value, Loader=getattr(yaml, "CBaseLoader", yaml.BaseLoader))  # libyaml's loader is much faster, when available
+
+
+class ParsedScriptCache:
+    """
+    Cache of the parsed scripts, by content hash, so that an unchanged script isn't parsed again.
+    Parsed scripts are kept in memory, shared by all the instances, and if a Path is given, on disk as json, which is much faster to load than yaml.
+    The least recently used ones are evicted beyond PARSED_SCRIPTS_SIZE.
+    """
+
+    memory: "OrderedDict[str, Any]" = OrderedDict()
+    lock = threading.Lock()
+
+    def __init__(self, path: Optional[Path] = None, read_only: bool = False) -> None:
+        """
+        :param path: optional Path to the cache's directory on disk
+        :param read_only: whether the cache on disk is only read, e.g. by the commands that don't write into the reports' directory
+        """
+
+        self.path = path
+        self.read_only = read_only
+
+    def parse(self, value: str) -> Any:
+        """
+        :param value: the raw script
+        :return: the parsed script, see parse_script()
+        """
+
+        if value.startswith(("[", "{")):
+            return parse_script(value)  # json is fast enough already
+
+        sha256 = hashlib.sha256(value.encode(ENCODING)).hexdigest()
+        with self.lock:
+            if sha256 in self.memory:
+                self.memory.move_to_end(sha256)
+                return self.memory.get(sha256)
+
+        script = self._read(sha256)
+        if script is None:
+            script = parse_script(value)
+            self._write(sha256, script)
+
+        with self.lock:
+            self.memory[sha256] = script
+            while len(self.memory) > PARSED_SCRIPTS_SIZE:
+                self.memory.popitem(last=False)
+        return script
+
+    def _read(self, sha256: str) -> Any:
+        if not self.path:
+            return None
+        try:
+            script_path = self.path.joinpath(sha256)
+            script = json.loads(script_path.read_text(encoding=ENCODING))
+            os.utime(script_path)  # the files' mtime is their last use, for the lru eviction
+            return script
+        except (OSError, ValueError):
+            return None  # missing, corrupted or evicted
+
+    def _write(self, sha256: str, script: Any) -> None:
+        if not self.path or self.read_only:
+            return
+        try:
+            write_atomically(self.path.joinpath(sha256), encode_chunks(json.dumps(script)), fsync=False)
+
+            paths = []
+            for path in self.path.iterdir():
+                if not path.name.startswith("."):  # skips the temporary files of writes in progress
+                    with suppress(FileNotFoundError):  # evicted in the meantime by another process
+                        paths.append((path.stat().st_mtime, path))
+            for _, path in sorted(paths)[:-PARSED_SCRIPTS_SIZE]:
+                path.unlink(missing_ok=True)
+        except OSError:
+            pass  # e.g. a read-only reports' directory: it's only a cache
+
+
+def fetch_script(client: zebr0.Client, key: str, parsed_scripts: Optional[ParsedScriptCache] = None) -> Tuple[str, Any]:
+    """
+    Fetches a script from the key-value server and parses it.
+
+    :param client: zebr0 Client to the key-value server
+    :param key: the script's key
+    :param parsed_scripts: optional ParsedScriptCache
+    :return: the raw value and the parsed tasks
+    """
+
+    value = client.get(key)
+    return value, (parsed_scripts or ParsedScriptCache()).parse(value) if value else None
+
+
+class ScriptGraph:
+    """
+    Resolves the include graph of a script: each key is fetched and parsed only once, however many times it is included.
+    If an Executor is given, the fetching of the included scripts is submitted to it as soon as their parent is parsed, which recursively prefetches the whole include graph.
+    """
+
+    def __init__(self, client: zebr0.Client, executor: Optional[futures.Executor] = None, parsed_scripts: Optional[ParsedScriptCache] = None) -> None:
+        """
+        :param client: zebr0 Client to the key-value server
+        :param executor: optional Executor used to prefetch the included scripts
+        :param parsed_scripts: optional ParsedScriptCache
+        """
+
+        self.client = client
+        self.executor = executor
+        self.parsed_scripts = parsed_scripts
+        self.lock = threading.Lock()
+        self.scripts: Dict[str, futures.Future] = {}
+
+    def get(self, key: str) -> Tuple[str, Any]:
+        """
+        :param key: the script's key
+        :return: the raw value and the parsed tasks, see fetch_script()
+        """
+
+        return self.submit(key).result()
+
+    def submit(self, key: str) -> futures.Future:
+        with self.lock:
+            future, new = self.scripts.get(key), key not in self.scripts
+            if new:
+                future = self.scripts[key] = futures.Future()
+
+        if new:
+            if self.executor:
+                self.executor.submit(self.resolve, key, future)
+            else:
+                self.resolve(key, future)
+        return future
+
+    def resolve(self, key: str, future: futures.Future) -> None:
+        try:
+            value, tasks = fetch_script(self.client, key, self.parsed_scripts)
+            if self.executor and isinstance(tasks, list):
+                for task in tasks:
+                    if is_include(task):
+                        self.submit(task.get(INCLUDE))  # a cycle ends here, as the keys are only submitted once
+            future.set_result((value, tasks))
+        except BaseException as error:
+            future.set_exception(error)
+
+
+def recursive_fetch_script(client: zebr0.Client, key: str, reports_path: Path, prefetch: int = PREFETCH_DEFAULT, unresolved: Optional[List[str]] = None, write_cache: bool = False) -> Iterator[Tuple[Any, Status, Path]]:
+    """
+    Fetches a script from the key-value server and yields its tasks, their Status and report Path.
+    Included scripts are fetched recursively, only once however many times they are included: a task is yielded only once too.
+    Malformed tasks and cyclic includes are ignored, as are the scripts not found or not proper lists, whose keys can be collected in the "unresolved" list.
+
+    With prefetch > 1, included scripts are fetched concurrently as soon as their parent is parsed, but the tasks are still yielded in the same depth-first order.
+
+    :param client: zebr0 Client to the key-value server
+    :param key: the script's key
+    :param reports_path: Path to the reports' directory
+    :param prefetch: maximum number of scripts fetched concurrently, 1 disables prefetching
+    :param unresolved: optional list the keys of the scripts not found or not proper lists are appended to
+    :param write_cache: whether the parsed scripts can be cached on disk, in the reports' directory if it exists (for the commands writing into it), otherwise they are only read from there
+    :return: the script's tasks, their Status and report Path
+    """
+
+    index = open_store(reports_path).load_index()
+    parsed_scripts = ParsedScriptCache(reports_path.joinpath(CACHE_DIRECTORY, PARSED_DIRECTORY), read_only=not (write_cache and reports_path.is_dir()))
+    unresolved = [] if unresolved is None else unresolved
+
+    if prefetch > 1:
+        with futures.ThreadPoolExecutor(max_workers=prefetch) as executor:
+            yield from _recursive_fetch_script(ScriptGraph(client, executor, parsed_scripts), key, reports_path, index, (), set(), set(), unresolved)
+    else:
+        yield from _recursive_fetch_script(ScriptGraph(client, parsed_scripts=parsed_scripts), key, reports_path, index, (), set(), set(), unresolved)
+
+
+def _recursive_fetch_script(graph: ScriptGraph, key: str, reports_path: Path, index: Dict[str, dict], path: Tuple[str, ...], expanded: set, yielded: set, unresolved: List[str]) -> Iterator[Tuple[Any, Status, Path]]:
+    if key in path:
+        print("include cycle, ignored:", " -> ".join(path + (key,)))
+        return
+    if key in expanded:
+        return  # already included elsewhere
+    expanded.add(key)
+
+    value, tasks = graph.get(key)
+    if not value:
+        print(f"key '{key}' not found on server {graph.client.url}")
+        unresolved.append(key)
+        return
+
+    if not isinstance(tasks, list):
+        print(f"key '{key}' on server {graph.client.url} is not a proper yaml or json list")
+        unresolved.append(key)
+        return
+
+    for task in tasks:
+        if is_include(task):
+            yield from _recursive_fetch_script(graph, task.get(INCLUDE), reports_path, index, path + (key,), expanded, yielded, unresolved)
+        elif is_command(task) or is_fetch_to_disk(task):
+            md5 = hashlib.md5(json.dumps(task).encode(ENCODING)).hexdigest()
+            if md5 in yielded:
+                continue  # the same task, through another include path
+            yielded.add(md5)
+            status = index[md5].get(STATUS) if md5 in index else Status.PENDING
+
+            yield task, status, reports_path.joinpath(md5)
+        else:
+            print("malformed task, ignored:", json.dumps(task))
+
+
+def fetch_include_graph(client: zebr0.Client, key: str, prefetch: int = PREFETCH_DEFAULT, parsed_scripts: Optional[ParsedScriptCache] = None) -> Dict[str, str]:
+    """
+    :param client: zebr0 Client to the key-value server
+    :param key: the script's key
+    :param prefetch: maximum number of scripts fetched concurrently, 1 disables prefetching
+    :param parsed_scripts: optional ParsedScriptCache
+    :return: the raw values of the script and of all the scripts it includes, recursively, by key
+    """
+
+    with futures.ThreadPoolExecutor(max_workers=prefetch) if prefetch > 1 else nullcontext() as executor:
+        graph, values, keys = ScriptGraph(client, executor, parsed_scripts), {}, [key]
+        while keys:
+            key = keys.pop()
+            if key not in values:
+                values[key], tasks = graph.get(key)
+                if isinstance(tasks, list):
+                    keys.extend(task.get(INCLUDE) for task in tasks if is_include(task))
+        return values
+
+
+class SnapshotClient:
+    """
+    Serves the values of a snapshot of scripts, so that a script is executed exactly as it was when its changes were detected, without fetching it again.
+    The other values (e.g. those fetched to disk) are fetched through the wrapped client.
+    """
+
+    def __init__(self, client: zebr0.Client, values: Dict[str, str]) -> None:
+        """
+        :param client: zebr0 Client to the key-value server
+        :param values: the scripts' raw values, by key, as fetched with strip=True
+        """
+
+        self.client = client
+        self.url = client.url
+        self.values = values
+
+    def get(self, key: str, default: str = "", strip: bool = True) -> str:
+        if strip and key in self.values:
+            return self.values.get(key) or default
+        return self.client.get(key, default, strip)
+
+
+def build_client(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, persistent_cache: int = PERSISTENT_CACHE_DEFAULT, persistent_cache_size: int = PERSISTENT_CACHE_SIZE_DEFAULT, offline: bool = False, max_stale: Optional[int] = None) -> zebr0.Client:
+    """
+    Builds the zebr0 Client to the key-value server, wrapped in a persistent ScriptCache if required.
+
+    :param url: (zebr0) URL of the key-value server, defaults to https://hub.zebr0.io
+    :param levels: (zebr0) levels of specialization (e.g. ["mattermost", "production"] for a <project>/<environment>/<key> structure), defaults to []
+    :param cache: (zebr0) in seconds, the duration of the cache of http responses, defaults to 300 seconds
+    :param configuration_file: (zebr0) path to the configuration file, defaults to /etc/zebr0.conf for a system-wide configuration
+    :param reports_path: Path to the reports' directory, the persistent cache is stored in its ".cache" subdirectory
+    :param persistent_cache: in seconds, the duration of the persistent cache of fetched values, 0 disables it
+    :param persistent_cache_size: in bytes, the maximum total size of the persistent cache
+    :param offline: if True, values are only ever served from the persistent cache
+    :param max_stale: in seconds, how long after its expiry a cached value can still be served when the server can't be reached, None for no limit
+    :return: the client
+    """
+
+    client = zebr0.Client(url, levels, cache, configuration_file)
+    if persistent_cache or offline:
+        client = ScriptCache(client, reports_path.joinpath(CACHE_DIRECTORY), persistent_cache, persistent_cache_size, offline, max_stale)
+    return client
+
+
+def show(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, key: str, prefetch: int = PREFETCH_DEFAULT, persistent_cache: int = PERSISTENT_CACHE_DEFAULT, persistent_cache_size: int = PERSISTENT_CACHE_SIZE_DEFAULT, offline: bool = False, max_stale: Optional[int] = None, **_) -> None:
+    """
+    Fetches a script from the key-value server and displays its tasks along with their current status.
+
+    :param url: (zebr0) URL of the key-value server, defaults to https://hub.zebr0.io
+    :param levels: (zebr0) levels of specialization (e.g. ["mattermost", "production"] for a <project>/<environment>/<key> structure), defaults to []
+    :param cache: (zebr0) in seconds, the duration of the cache of http responses, defaults to 300 seconds
+    :param configuration_file: (zebr0) path to the configuration file, defaults to /etc/zebr0.conf for a system-wide configuration
+    :param reports_path: Path to the reports' directory
+    :param key: the script's key
+    :param prefetch: maximum number of scripts fetched concurrently, 1 disables prefetching
+    :param persistent_cache: in seconds, the duration of the persistent cache of fetched values, 0 disables it
+    :param persistent_cache_size: in bytes, the maximum total size of the persistent cache
+    :param offline: if True, values are only ever served from the persistent cache
+    :param max_stale: in seconds, how long after its expiry a cached value can still be served when the server can't be reached, None for no limit
+    """
+
+    client = build_client(url, levels, cache, configuration_file, reports_path, persistent_cache, persistent_cache_size, offline, max_stale)
+    for task, status, _ in recursive_fetch_script(client, key, reports_path, prefetch):
+        print(f"{status}: {json.dumps(task)}")
+
+
+class OutputBuffer:
+    """
+    Retains the output of a command, line by line.
+    Without limits every line is kept, otherwise only the first "head" and last "tail" lines are, within "max_bytes" bytes, the omitted lines being replaced by a marker.
+    The whole output can also be spooled into a gzip-compressed file.
+    """
+
+    def __init__(self, head: Optional[int] = None, tail: Optional[int] = None, max_bytes: Optional[int] = None, spool_path: Optional[Path] = None) -> None:
+        """
+        :param head: maximum number of lines kept at the beginning of the output, None for no limit unless tail is set
+        :param tail: maximum number of lines kept at the end of the output, None for no limit unless head is set
+        :param max_bytes: maximum number of bytes kept, None for no limit
+        :param spool_path: optional Path to a file where the whole output is written, gzip-compressed
+        """
+
+        limited = head is not None or tail is not None
+        self.head_max = head or 0 if limited else float("inf")
+        self.tail_max = tail or 0 if limited else float("inf")
+        self.max_bytes = max_bytes if max_bytes is not None else float("inf")
+
+        self.head, self.head_bytes, self.head_full = [], 0, False
+        self.tail, self.tail_bytes = deque(), 0
+        self.count, self.omitted = 0, 0
+
+        self.spool = None
+        if spool_path:
+            spool_path.parent.mkdir(parents=True, exist_ok=True)  # make sure the parent directory exists
+            self.spool = gzip.open(spool_path, "wt", encoding=ENCODING)
+
+    def append(self, line: str) -> None:
+        self.count += 1
+        if self.spool:
+            self.spool.write(line + "\n")
+
+        size = len(line.encode(ENCODING))
+        if not self.head_full and len(self.head) < self.head_max and self.head_bytes + size <= self.max_bytes:
+            self.head.append(line)
+            self.head_bytes += size
+            return
+
+        self.head_full = True  # from now on, lines can only go to the tail, to keep them in order
+        self.tail.append(line)
+        self.tail_bytes += size
+        while self.tail and (len(self.tail) > self.tail_max or self.head_bytes + self.tail_bytes > self.max_bytes):
+            self.tail_bytes -= len(self.tail.popleft().encode(ENCODING))
+            self.omitted += 1
+
+    def close(self) -> None:
+        if self.spool:
+            self.spool.close()
+
+    def lines(self) -> List[str]:
+        return self.head + ([f"[... {self.omitted} lines omitted ...]"] if self.omitted else []) + list(self.tail)
+
+
+def now() -> str:
+    return datetime.datetime.now().astimezone().isoformat(timespec="milliseconds")
+
+
+class OutputSink:
+    """
+    Receives the output of the commands live, line by line, tagged by task.
+    This default sink shows progress with dots: one per line, and a new line at the end if any dot has been printed.
+    """
+
+    def write(self, tag: str, line: str) -> None:
+        print(".", end="")
+
+    def close(self, tag: str, count: int) -> None:
+        if count:
+            print()
+
 
-import yaml
-import zebr0
+class PrefixSink(OutputSink):
+    """
+    Prints each line as it comes, prefixed with its tag, which is convenient to follow several commands executed at once.
+    """
 
-ATTEMPTS_DEFAULT = 4
-PAUSE_DEFAULT = 10
+    def write(self, tag: str, line: str) -> None:
+        print(f"[{tag}] {line}")
 
-INCLUDE = "include"
-KEY = "key"
-TARGET = "target"
-COMMAND = "command"
-STATUS = "status"
-OUTPUT = "output"
+    def close(self, tag: str, count: int) -> None:
+        pass
 
 
-class Status(str, enum.Enum):
-    PENDING = "pending"
-    SUCCESS = "success"
-    FAILURE = "failure"
+class NullSink(OutputSink):
+    """
+    Discards the output, e.g. of the commands checking guards.
+    """
 
+    def write(self, tag: str, line: str) -> None:
+        pass
 
-def recursive_fetch_script(client: zebr0.Client, key: str, reports_path: Path) -> Iterator[Tuple[Any, Status, Path]]:
+    def close(self, tag: str, count: int) -> None:
+        pass
+
+
+async def read_lines(stream: asyncio.StreamReader) -> AsyncIterator[str]:
+    """
+    :param stream: a stream of bytes, decoded with zebr0's encoding
+    :return: an iterator over its lines, stripped of their trailing whitespace (unlike StreamReader.readline, lines can have any length)
     """
-    Fetches a script from the key-value server and yields its tasks, their Status and report Path.
-    Included scripts are fetched recursively.
-    Malformed tasks are ignored.
 
-    :param client: zebr0 Client to the key-value server
-    :param key: the script's key
-    :param reports_path: Path to the reports' directory
-    :return: the script's tasks, their Status and report Path
+    decoder, pending = codecs.getincrementaldecoder(ENCODING)(errors="replace"), ""
+    while True:
+        chunk = await stream.read(CHUNK_SIZE)
+        *lines, pending = (pending + decoder.decode(chunk, final=not chunk)).split("\n")
+        for line in lines:
+            yield line.rstrip()
+        if not chunk:
+            break
+    if pending:
+        yield pending.rstrip()
+
+
+def kill_process_group(process: subprocess.Popen, sig: int) -> None:
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass  # already gone
+
+
+class RunningCommands:
+    """
+    The process groups of the commands being executed.
+    Commands are executed in their own sessions, by the threads of executors: neither the terminal's SIGINT nor the KeyboardInterrupt, which only the main thread gets, reach them.
+    On interruption, they are all killed, and no other command is started (or attempted again) until the interruption is over.
     """
 
-    value = client.get(key)
-    if not value:
-        print(f"key '{key}' not found on server {client.url}")
-        return
+    def __init__(self) -> None:
+        self.pgids = set()
+        self.lock = threading.Lock()
+        self.interrupted = False
 
-    tasks = yaml.load(value, Loader=yaml.BaseLoader)
-    if not isinstance(tasks, list):
-        print(f"key '{key}' on server {client.url} is not a proper yaml or json list")
-        return
+    def add(self, pgid: int) -> None:
+        with self.lock:
+            self.pgids.add(pgid)
+            if self.interrupted:
+                with suppress(ProcessLookupError):
+                    os.killpg(pgid, signal.SIGKILL)
 
-    for task in tasks:
-        if isinstance(task, dict) and task.keys() == {INCLUDE}:
-            yield from recursive_fetch_script(client, task.get(INCLUDE), reports_path)
-        elif isinstance(task, str) or isinstance(task, dict) and task.keys() == {KEY, TARGET}:
-            md5 = hashlib.md5(json.dumps(task).encode(zebr0.ENCODING)).hexdigest()
-            report_path = reports_path.joinpath(md5)
-            status = Status.PENDING if not report_path.exists() else json.loads(report_path.read_text(encoding=zebr0.ENCODING)).get(STATUS)
+    def discard(self, pgid: int) -> None:
+        with self.lock:
+            self.pgids.discard(pgid)
 
-            yield task, status, report_path
-        else:
-            print("malformed task, ignored:", json.dumps(task))
+    def interrupt(self) -> None:
+        with self.lock:
+            self.interrupted = True
+            for pgid in self.pgids:
+                with suppress(ProcessLookupError):
+                    os.killpg(pgid, signal.SIGKILL)
 
+    def resume(self) -> None:
+        with self.lock:
+            self.interrupted = False
 
-def show(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, key: str, **_) -> None:
+
+RUNNING_COMMANDS = RunningCommands()
+
+
+@contextmanager
+def interruptible(executor: futures.Executor) -> Iterator[None]:
     """
-    Fetches a script from the key-value server and displays its tasks along with their current status.
+    On KeyboardInterrupt, kills the commands being executed by the executor's threads and cancels the tasks not started yet, so that the executor is shut down at once instead of waiting for them.
+    To be used in the main thread, within the executor's context.
 
-    :param url: (zebr0) URL of the key-value server, defaults to https://hub.zebr0.io
-    :param levels: (zebr0) levels of specialization (e.g. ["mattermost", "production"] for a <project>/<environment>/<key> structure), defaults to []
-    :param cache: (zebr0) in seconds, the duration of the cache of http responses, defaults to 300 seconds
-    :param configuration_file: (zebr0) path to the configuration file, defaults to /etc/zebr0.conf for a system-wide configuration
-    :param reports_path: Path to the reports' directory
-    :param key: the script's key
+    :param executor: the Executor of the tasks
     """
 
-    client = zebr0.Client(url, levels, cache, configuration_file)
-    for task, status, _ in recursive_fetch_script(client, key, reports_path):
-        print(f"{status}: {json.dumps(task)}")
+    try:
+        yield
+    except KeyboardInterrupt:
+        RUNNING_COMMANDS.interrupt()
+        try:
+            executor.shutdown(cancel_futures=True)
+        finally:
+            RUNNING_COMMANDS.resume()
+        raise
+
+
+def parse_times(line: str) -> Tuple[float, float]:
+    """
+    :param line: a line of output of the "times" builtin (e.g. "0m1.250s 0m0.030s")
+    :return: the user and system cpu times, in seconds
+    """
+
+    user_time, system_time = (int(minutes) * 60 + float(seconds) for minutes, seconds in re.findall(r"(\d+)m([\d.]+)s", line))
+    return user_time, system_time
+
+
+class ShellWorker:
+    """
+    A long-lived shell executing commands one after the other, which saves the start of a new shell for each command.
+    Each command is executed in a subshell, so that it can't alter the state of the worker (working directory, variables, traps...), with no standard input.
+    Its end is marked in the output by a sentinel line holding its exit code, followed by the cpu times of the worker's children (as given by the "times" builtin).
+    """
+
+    def __init__(self) -> None:
+        self.process = subprocess.Popen(["/bin/sh"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+        self.sentinel = f"zebr0-script-{os.urandom(16).hex()}"
+        self.sentinel_pattern = re.compile(rf"(.*){self.sentinel} (\d+)$")
+        self.decoder, self.pending, self.lines = codecs.getincrementaldecoder(ENCODING)(errors="replace"), "", deque()
+        self.cpu_times = (0.0, 0.0)
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
 
+    def read_line(self) -> str:
+        while not self.lines:
+            chunk = os.read(self.process.stdout.fileno(), CHUNK_SIZE)
+            if not chunk:
+                raise OSError("the shell worker is gone")
+            *lines, self.pending = (self.pending + self.decoder.decode(chunk)).split("\n")
+            self.lines.extend(lines)
+        return self.lines.popleft()
 
-def execute(command: str, attempts: int = ATTEMPTS_DEFAULT, pause: float = PAUSE_DEFAULT) -> dict:
+    def run(self, command: str, write: Callable[[str], None]) -> Tuple[int, float, float]:
+        """
+        :param command: command to execute
+        :param write: called with each line of output, stripped of its trailing whitespace
+        :return: the exit code, and the user and system cpu times of the command in seconds
+        :raises OSError: if the command couldn't be sent to the worker, which is then closed
+        """
+
+        try:
+            self.process.stdin.write(f"( eval {shlex.quote(command)} ) </dev/null; printf '%s %d\\n' {self.sentinel} $?; times\n".encode(ENCODING))
+            self.process.stdin.flush()
+        except OSError:
+            self.close()
+            raise
+
+        RUNNING_COMMANDS.add(self.process.pid)
+        try:
+            while True:
+                line = self.read_line()
+                match = self.sentinel_pattern.match(line)
+                if not match:
+                    write(line.rstrip())
+                    continue
+
+                if match.group(1):
+                    write(match.group(1).rstrip())  # the last line of output, not terminated by a newline
+                self.read_line()  # the cpu times of the worker itself
+                exit_code, cpu_times = int(match.group(2)), parse_times(self.read_line())
+                break
+        except OSError:  # the worker died along with the command (e.g. killed by the command itself, or interrupted)
+            self.close()
+            return self.process.returncode or 1, 0.0, 0.0
+        finally:
+            RUNNING_COMMANDS.discard(self.process.pid)
+
+        previous, self.cpu_times = self.cpu_times, cpu_times
+        return exit_code, round(cpu_times[0] - previous[0], 3), round(cpu_times[1] - previous[1], 3)
+
+    def close(self) -> None:
+        with suppress(OSError):
+            self.process.stdin.close()
+        if self.process.poll() is None:
+            with suppress(ProcessLookupError):
+                os.killpg(self.process.pid, signal.SIGKILL)
+        self.process.wait()
+        self.process.stdout.close()
+
+
+class ShellWorkers:
+    """
+    A pool of ShellWorkers, with as many workers as commands executed at once.
+    After any failure of a worker, the pool is disabled and the commands are left to fresh processes.
+    """
+
+    def __init__(self) -> None:
+        self.idle = []
+        self.lock = threading.Lock()
+        self.disabled = False
+        atexit.register(self.close)
+
+    def run(self, command: str, write: Callable[[str], None]) -> Tuple[int, float, float]:
+        """
+        :param command: command to execute
+        :param write: called with each line of output
+        :return: the exit code, and the user and system cpu times of the command in seconds
+        :raises OSError: if the command couldn't be sent to a worker, and should be executed by a fresh process instead
+        """
+
+        with self.lock:
+            if self.disabled:
+                raise OSError("the shell workers are disabled")
+            worker = self.idle.pop() if self.idle else None
+
+        try:
+            worker = worker or ShellWorker()
+            result = worker.run(command, write)
+        except OSError:
+            self.disabled = True
+            raise
+
+        with self.lock:
+            if worker.is_alive():
+                self.idle.append(worker)
+            else:
+                self.disabled = True
+        return result
+
+    def close(self) -> None:
+        with self.lock:
+            while self.idle:
+                self.idle.pop().close()
+
+
+class RetryPolicy:
+    """
+    Tells whether and when a failed command should be attempted again.
+
+    The pause between two attempts grows exponentially with the backoff factor, up to max_pause, and is randomized by +/- jitter (a ratio) to avoid hosts retrying in lockstep.
+    No attempt is made past the deadline, counted from the start of the first attempt.
+    If exit codes or output patterns (regular expressions) are given, only the failures matching one of them are retried, the others being considered permanent.
+    """
+
+    def __init__(self, attempts: int = ATTEMPTS_DEFAULT, pause: float = PAUSE_DEFAULT, backoff: float = 1, max_pause: Optional[float] = None, jitter: float = 0, deadline: Optional[float] = None,
+                 retry_on_exit_codes: Optional[Iterable[int]] = None, retry_on_patterns: Optional[Iterable[str]] = None) -> None:
+        """
+        :param attempts: maximum number of attempts before reporting a failure
+        :param pause: delay in seconds between the first two attempts
+        :param backoff: factor applied to the delay after each attempt
+        :param max_pause: maximum delay in seconds between two attempts, None for no limit
+        :param jitter: ratio of random variation applied to each delay (e.g. 0.2 for +/- 20%)
+        :param deadline: maximum duration in seconds of all the attempts, None for no limit
+        :param retry_on_exit_codes: if set, only failures with one of these exit codes are retried
+        :param retry_on_patterns: if set, only failures whose output matches one of these regular expressions are retried
+        """
+
+        self.attempts = attempts
+        self.pause = pause
+        self.backoff = backoff
+        self.max_pause = max_pause
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retry_on_exit_codes = set(retry_on_exit_codes) if retry_on_exit_codes else None
+        self.retry_on_patterns = [re.compile(pattern) for pattern in retry_on_patterns] if retry_on_patterns else None
+
+    def override(self, task: dict) -> "RetryPolicy":
+        """
+        :param task: a command in its dictionary form, whose retry options override the policy's
+        :return: the resulting RetryPolicy
+        :raises ValueError: if an option is invalid
+        """
+
+        def as_list(value):
+            return value if isinstance(value, list) else str(value).split(",")
+
+        policy = RetryPolicy(self.attempts, self.pause, self.backoff, self.max_pause, self.jitter, self.deadline)
+        policy.retry_on_exit_codes, policy.retry_on_patterns = self.retry_on_exit_codes, self.retry_on_patterns
+
+        if ATTEMPTS in task:
+            policy.attempts = int(task.get(ATTEMPTS))
+        for option in (PAUSE, BACKOFF, MAX_PAUSE, JITTER, DEADLINE):
+            if option in task:
+                setattr(policy, option, float(task.get(option)))
+        if RETRY_ON_EXIT_CODES in task:
+            policy.retry_on_exit_codes = {int(exit_code) for exit_code in as_list(task.get(RETRY_ON_EXIT_CODES))}
+        if RETRY_ON_PATTERNS in task:
+            try:
+                policy.retry_on_patterns = [re.compile(pattern) for pattern in as_list(task.get(RETRY_ON_PATTERNS))]
+            except re.error as error:
+                raise ValueError(f"invalid pattern: {error}")
+        return policy
+
+    def is_retryable(self, exit_code: int, output: List[str]) -> bool:
+        """
+        :param exit_code: the failed attempt's exit code
+        :param output: the failed attempt's output
+        :return: whether the failure is worth another attempt
+        """
+
+        if self.retry_on_exit_codes is None and self.retry_on_patterns is None:
+            return True
+        return exit_code in (self.retry_on_exit_codes or ()) or any(pattern.search(line) for pattern in self.retry_on_patterns or () for line in output)
+
+    def get_pause(self, failures: int) -> float:
+        """
+        :param failures: the number of failed attempts so far
+        :return: the delay in seconds before the next attempt
+        """
+
+        if self.backoff == 1 and not self.jitter and self.max_pause is None:
+            return self.pause  # the plain old fixed pause
+
+        pause = self.pause * self.backoff ** (failures - 1)
+        if self.max_pause is not None:
+            pause = min(pause, self.max_pause)
+        return round(max(pause * random.uniform(1 - self.jitter, 1 + self.jitter), 0), 3)
+
+
+async def execute_async(command: str, attempts: int = ATTEMPTS_DEFAULT, pause: float = PAUSE_DEFAULT, output_head: Optional[int] = None, output_tail: Optional[int] = None, output_max_bytes: Optional[int] = None, spool_path: Optional[Path] = None,
+                        policy: Optional[RetryPolicy] = None, timeout: Optional[float] = None, grace_period: float = GRACE_PERIOD_DEFAULT, sink: Optional[OutputSink] = None, tag: Optional[str] = None, workers: Optional[ShellWorkers] = None) -> dict:
     """
-    Executes a command with the system's shell.
-    Several attempts will be made in case of failure, to cover for temporary mishaps such as network issues.
-    Progress is shown with dots, and standard output will be returned as a list of strings in an execution report.
+    Executes a command with the system's shell, without blocking the event loop, so that several commands can be executed at once.
+    Several attempts will be made in case of failure, to cover for temporary mishaps such as network issues, according to a RetryPolicy.
+    The output is streamed live to a sink, which shows progress with dots by default, and standard output will be returned as a list of strings in an execution report.
+    The retained output can be limited to its first and last lines, and to a number of bytes, in which case the whole output can be spooled into a side file.
+    An attempt running longer than the timeout is killed along with all its descendants, and counts as a failed attempt.
+    Given ShellWorkers, the attempts without a timeout are executed by a long-lived shell instead of a new one, unless the workers failed.
+
+    The resources used by an attempt are those of its own shell and descendants: reaped with os.wait4, a fresh process gives its peak rss and cpu times, while a long-lived shell only gives the cpu times of its command (with the "times" builtin).
 
     :param command: command to execute
     :param attempts: maximum number of attempts before reporting a failure
     :param pause: delay in seconds between two attempts
-    :return: an execution report
+    :param output_head: maximum number of lines kept at the beginning of the output
+    :param output_tail: maximum number of lines kept at the end of the output
+    :param output_max_bytes: maximum number of bytes of output kept
+    :param spool_path: optional Path to a file where the whole output of the last attempt is written, gzip-compressed
+    :param policy: optional RetryPolicy, overriding attempts and pause
+    :param timeout: in seconds, the maximum duration of each attempt, None for no limit
+    :param grace_period: in seconds, the delay given to a timed out attempt to terminate before it is killed for good
+    :param sink: optional OutputSink receiving the output live, defaults to a progress bar of dots
+    :param tag: the tag of the output lines sent to the sink, defaults to the command itself
+    :param workers: optional ShellWorkers executing the attempts without a timeout
+    :return: an execution report, including timings and the resources used by each attempt (exit code, peak rss in kilobytes unless executed by a long-lived shell, user and system cpu time in seconds, and reason of the failure if it timed out)
     """
 
+    policy = policy or RetryPolicy(attempts, pause)
+    attempts = policy.attempts
+    sink = sink or OutputSink()
+    tag = command if tag is None else tag
+
+    def write(output: OutputBuffer, line: str) -> None:
+        sink.write(tag, line)
+        output.append(line)
+
+    async def read(stream: asyncio.StreamReader, output: OutputBuffer) -> None:
+        async for line in read_lines(stream):
+            write(output, line)
+
+    async def spawn(output: OutputBuffer) -> Tuple[int, bool, resource.struct_rusage]:
+        """
+        The command is reaped by a thread of its own rather than by asyncio's child watcher, so that its own resource usage is known, and its end is told by its exit rather than by the end of its output.
+        With a timeout, the output is only waited for until then, as descendants left in the background may hold it open.
+        Once timed out, the command is killed and waited for at most for the grace period, and the output is not waited for anymore: a descendant that left the process group may hold it open forever.
+        """
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)  # in its own process group, to be killed as a whole
+        RUNNING_COMMANDS.add(process.pid)
+        stream, reader, waiter, transport, timed_out = asyncio.StreamReader(), None, None, None, False
+        try:
+            transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stream), process.stdout)
+            reader = asyncio.ensure_future(read(stream, output))
+            waiter = loop.run_in_executor(None, os.wait4, process.pid, 0)
+
+            done, _ = await asyncio.wait({waiter, reader}, timeout=None if deadline is None else max(deadline - loop.time(), 0))
+            if done != {waiter, reader}:
+                timed_out = True
+                kill_process_group(process, signal.SIGTERM)
+                done, _ = await asyncio.wait({waiter, reader}, timeout=grace_period)
+                if waiter not in done:
+                    kill_process_group(process, signal.SIGKILL)
+            _, status, usage = await waiter
+            process.returncode = os.waitstatus_to_exitcode(status)
+            if timed_out:
+                kill_process_group(process, signal.SIGKILL)  # the descendants that survived their parent (the group can't be reused while they live)
+                await asyncio.wait({reader}, timeout=0)  # the output already read
+            return process.returncode, timed_out, usage
+        except BaseException:  # e.g. cancellation or KeyboardInterrupt: no orphan left behind
+            kill_process_group(process, signal.SIGKILL)
+            raise
+        finally:
+            if reader:
+                reader.cancel()
+            if transport:
+                transport.close()
+            else:
+                process.stdout.close()
+            RUNNING_COMMANDS.discard(process.pid)
+            if timed_out:
+                output.append(f"[... timed out after {timeout} seconds ...]")
+
+    start, start_counter, history = now(), time.perf_counter(), []
     while True:
-        sp = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding=zebr0.ENCODING)
+        attempt_start = time.perf_counter()
         attempts = attempts - 1
 
-        output = []
-        for line in sp.stdout:
-            print(".", end="")  # progress bar: each line in stdout prints a dot
-            output.append(line.rstrip())
-        if output:
-            print()  # if at least one dot has been printed, we need a new line at the end
+        output, timed_out, usage = OutputBuffer(output_head, output_tail, output_max_bytes, spool_path), False, None
+        try:
+            if workers and timeout is None:  # a worker can't kill a command, hence the fresh processes for the commands with a timeout
+                with suppress(OSError):
+                    exit_code, user_time, system_time = await asyncio.get_running_loop().run_in_executor(None, workers.run, command, functools.partial(write, output))
+                    usage = {"user_time": user_time, "system_time": system_time}
+            if usage is None:
+                exit_code, timed_out, rusage = await spawn(output)
+                usage = {"max_rss": rusage.ru_maxrss, "user_time": round(rusage.ru_utime, 3), "system_time": round(rusage.ru_stime, 3)}
+        finally:
+            output.close()
+        sink.close(tag, output.count)
+
+        history.append({
+            DURATION: round(time.perf_counter() - attempt_start, 3),
+            EXIT_CODE: exit_code,
+            **usage,
+            **({REASON: TIMEOUT} if timed_out else {})
+        })
 
-        if sp.wait() == 0:  # if successful (i.e. the return code is 0)
+        if exit_code == 0:  # if successful (i.e. the return code is 0)
             status = Status.SUCCESS
             break
-        elif attempts > 0:
+
+        pause = policy.get_pause(len(history))
+        if attempts > 0 and not RUNNING_COMMANDS.interrupted and policy.is_retryable(exit_code, output.lines()) and (policy.deadline is None or time.perf_counter() - start_counter + pause < policy.deadline):
             print(f"error, {attempts} attempts remaining, will try again in {pause} seconds")
-            time.sleep(pause)
+            await asyncio.sleep(pause)
         else:
             status = Status.FAILURE
             break
 
-    return {COMMAND: command, STATUS: status, OUTPUT: output}  # last known output
+    report = {COMMAND: command, STATUS: status, OUTPUT: output.lines()}  # last known output
+    if status == Status.FAILURE and history[-1].get(REASON):
+        report[REASON] = history[-1].get(REASON)
+    if spool_path:
+        report[SPOOL] = str(spool_path)
+    report.update({START: start, END: now(), DURATION: round(time.perf_counter() - start_counter, 3), ATTEMPTS: history})
+    return report
+
+
+def execute(command: str, attempts: int = ATTEMPTS_DEFAULT, pause: float = PAUSE_DEFAULT, output_head: Optional[int] = None, output_tail: Optional[int] = None, output_max_bytes: Optional[int] = None, spool_path: Optional[Path] = None, policy: Optional[RetryPolicy] = None,
+            timeout: Optional[float] = None, grace_period: float = GRACE_PERIOD_DEFAULT, sink: Optional[OutputSink] = None, tag: Optional[str] = None, workers: Optional[ShellWorkers] = None) -> dict:
+    """
+    Blocking version of execute_async, with the same parameters, in its own event loop (hence not to be called from a running one).
+    """
+
+    return asyncio.run(execute_async(command, attempts, pause, output_head, output_tail, output_max_bytes, spool_path, policy, timeout, grace_period, sink, tag, workers))
+
+
+def file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with path.open("rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_digest(path: Path, sha256: str) -> dict:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": sha256}
 
 
-def fetch_to_disk(client: zebr0.Client, key: str, target: str) -> dict:
+def is_unchanged(path: Path, size: int, sha256: str, digest: Optional[dict] = None) -> bool:
+    """
+    Tells whether a file already has the given content: the sizes are compared first, then the hashes.
+    The file's hash is taken from the given digest if the file hasn't been modified since, otherwise the file is read.
+
+    :param path: Path to the file
+    :param size: the size of the content, in bytes
+    :param sha256: the hash of the content
+    :param digest: a previous digest of the file, as returned by get_digest
+    :return: True if the file exists and has the same content
+    """
+
+    try:
+        stat = path.stat()
+    except OSError:
+        return False
+
+    if not path.is_file() or stat.st_size != size:
+        return False
+    if digest and digest.get("size") == stat.st_size and digest.get("mtime") == stat.st_mtime_ns:
+        return digest.get("sha256") == sha256
+    return file_sha256(path) == sha256
+
+
+def fetch_to_disk(client: zebr0.Client, key: str, target: str, keep_digest: bool = False, digest: Optional[dict] = None, mode: Optional[str] = None, owner: Optional[str] = None) -> dict:
     """
     Fetches a key from the key-value server and writes its value into a target file.
+    The value is streamed into a temporary file which then atomically replaces the target, so that it is never left half-written.
+    The target file is left untouched if it already has the same content, which the report tells with its "changed" field.
     Errors will be returned as a list of strings in an execution report.
 
     :param client: zebr0 Client to the key-value server
     :param key: key to look for
     :param target: path to the target file
-    :return: an execution report
+    :param keep_digest: whether to keep the target's digest (size, mtime and hash) in the report
+    :param digest: the target's digest kept by a previous execution, to spare reading the target if it hasn't been modified since
+    :param mode: optional permissions of the target, in octal (e.g. "0644")
+    :param owner: optional owner of the target, either "user", "user:group" or ":group"
+    :return: an execution report, including timings
     """
 
-    value = client.get(key, strip=False)
+    start, start_counter = now(), time.perf_counter()
+    report = {KEY: key, TARGET: target}
+
+    try:
+        value, error = client.get(key, strip=False), f"key '{key}' not found on server {client.url}"
+    except OSError as exception:  # e.g. a network error, a failure of the task rather than of the whole execution
+        value, error = None, f"key-value server unreachable: {exception}"
+
     if not value:
-        status = Status.FAILURE
-        output = [f"key '{key}' not found on server {client.url}"]
+        report[STATUS] = Status.FAILURE
+        report[OUTPUT] = [error]
     else:
         try:
             target_path = Path(target)
-            target_path.parent.mkdir(parents=True, exist_ok=True)  # make sure the parent directory exists
-            target_path.write_text(value, encoding=zebr0.ENCODING)
+            if target_path.is_symlink():
+                target_path = Path(os.path.realpath(target_path))  # symlinks are followed, as a plain write would
+            elif target_path.is_dir():
+                raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), str(target_path))
+            size, sha256 = 0, hashlib.sha256()
+            for chunk in encode_chunks(value):
+                size += len(chunk)
+                sha256.update(chunk)
+            sha256 = sha256.hexdigest()
+            mode = int(mode, 8) if mode is not None else None
 
-            status = Status.SUCCESS
-            output = []
-        except OSError as error:
-            status = Status.FAILURE
-            output = str(error).splitlines()
+            changed = not is_unchanged(target_path, size, sha256, digest)
+            if changed:
+                write_atomically(target_path, encode_chunks(value), mode, owner)
+            else:
+                if mode is not None:
+                    os.chmod(target_path, mode)
+                if owner is not None:
+                    user, _, group = owner.partition(":")
+                    shutil.chown(target_path, user or None, group or None)
+
+            report[STATUS] = Status.SUCCESS
+            report[OUTPUT] = []
+            report[CHANGED] = changed
+            if keep_digest:
+                report[DIGEST] = get_digest(target_path, sha256)
+        except (OSError, ValueError, LookupError) as error:  # LookupError for unknown users or groups
+            report[STATUS] = Status.FAILURE
+            report[OUTPUT] = str(error).splitlines()
+
+    report.update({START: start, END: now(), DURATION: round(time.perf_counter() - start_counter, 3)})
+    return report
+
+
+async def fetch_to_disk_async(client: zebr0.Client, key: str, target: str, keep_digest: bool = False, digest: Optional[dict] = None, mode: Optional[str] = None, owner: Optional[str] = None) -> dict:
+    """
+    Non-blocking version of fetch_to_disk, with the same parameters.
+    As zebr0's Client and file writes are blocking, the fetch is delegated to the event loop's default executor.
+    """
+
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fetch_to_disk, client, key, target, keep_digest, digest, mode, owner))
+
+
+def check_guards(task: dict, workers: Optional[ShellWorkers] = None) -> Optional[str]:
+    """
+    Evaluates the guards of a command, from the cheapest to the most expensive, to tell whether its effect is already there:
+    - "creates", a path or a list of paths, is satisfied if they all exist
+    - "checksum", a line or a list of lines in the format of sha256sum ("<sha256>  <path>"), is satisfied if the files all exist with these hashes
+    - "onlyif", a command, is satisfied if it fails
+    - "unless", a command, is satisfied if it succeeds
+
+    :param task: a command in its dictionary form
+    :param workers: optional ShellWorkers executing the guards' commands
+    :return: the first satisfied guard, None if the command must be executed
+    :raises ValueError: if a guard is invalid
+    """
+
+    def as_list(option: str) -> List[str]:
+        value = task.get(option)
+        values = value if isinstance(value, list) else [value]
+        if not all(isinstance(item, str) for item in values):
+            raise ValueError(f"{option} must be a string or a list of strings")
+        return values
+
+    def check(option: str) -> bool:
+        if not isinstance(task.get(option), str):
+            raise ValueError(f"{option} must be a command")
+        return execute(task.get(option), attempts=1, sink=NullSink(), workers=workers).get(STATUS) == Status.SUCCESS
+
+    if CREATES in task and all(Path(path).exists() for path in as_list(CREATES)):
+        return CREATES
+    if CHECKSUM in task:
+        checksums = [line.split(maxsplit=1) for line in as_list(CHECKSUM)]
+        if not all(len(checksum) == 2 and re.fullmatch(r"[0-9a-f]{64}", checksum[0]) for checksum in checksums):
+            raise ValueError("checksum must be in the format '<sha256>  <path>'")
+        if all(Path(path.lstrip("*")).is_file() and file_sha256(Path(path.lstrip("*"))) == sha256 for sha256, path in checksums):  # "*" marks the binary mode in sha256sum's format
+            return CHECKSUM
+    if ONLYIF in task and not check(ONLYIF):
+        return ONLYIF
+    if UNLESS in task and check(UNLESS):
+        return UNLESS
+    return None
+
+
+def execute_task(client: zebr0.Client, task: Any, policy: Optional[RetryPolicy] = None, keep_digests: bool = False, report_path: Optional[Path] = None,
+                 output_head: Optional[int] = None, output_tail: Optional[int] = None, output_max_bytes: Optional[int] = None, spool_output: bool = False, timeout: Optional[float] = None, grace_period: float = GRACE_PERIOD_DEFAULT,
+                 sink: Optional[OutputSink] = None, workers: Optional[ShellWorkers] = None, previous_report: Optional[dict] = None) -> dict:
+    """
+    Executes a task, be it a command (in its string or dictionary form) or a fetch to disk.
+
+    :param client: zebr0 Client to the key-value server
+    :param task: the task to execute
+    :param policy: the run-wide RetryPolicy, that commands in their dictionary form can override
+    :param keep_digests: whether to keep the targets' digest in the reports, for fetches to disk
+    :param report_path: Path to the task's report, next to which the output is spooled if spool_output is True
+    :param output_head: maximum number of lines kept at the beginning of the output, for commands
+    :param output_tail: maximum number of lines kept at the end of the output, for commands
+    :param output_max_bytes: maximum number of bytes of output kept, for commands
+    :param spool_output: whether to spool the whole output into a gzip-compressed file next to the report, for commands
+    :param timeout: in seconds, the maximum duration of each attempt, that commands in their dictionary form can override, for commands
+    :param grace_period: in seconds, the delay given to a timed out attempt to terminate before it is killed for good, for commands
+    :param sink: optional OutputSink receiving the output live, for commands
+    :param workers: optional ShellWorkers executing the commands instead of new shells, for commands
+    :param previous_report: the task's current report if any, whose digest is reused if keep_digests is True, for fetches to disk
+    :return: an execution report, whose status is "satisfied" if the command's guards tell that its effect is already there (see check_guards)
+    """
+
+    if isinstance(task, str) or COMMAND in task:
+        command = task if isinstance(task, str) else task.get(COMMAND)
+        policy = policy or RetryPolicy()
+        if isinstance(task, dict):
+            start, start_counter = now(), time.perf_counter()
+            try:
+                policy = policy.override(task)
+                timeout = float(task.get(TIMEOUT)) if task.get(TIMEOUT) is not None else timeout
+                guard = check_guards(task, workers)
+            except ValueError as error:
+                return {COMMAND: command, STATUS: Status.FAILURE, OUTPUT: [f"invalid option: {error}"]}
+            if guard:
+                return {COMMAND: command, STATUS: Status.SATISFIED, OUTPUT: [], REASON: guard, START: start, END: now(), DURATION: round(time.perf_counter() - start_counter, 3)}
+
+        spool_path = get_spool_path(report_path) if spool_output and report_path else None
+        return execute(command, policy.attempts, policy.pause, output_head, output_tail, output_max_bytes, spool_path, policy, timeout, grace_period, sink, None, workers)
+    else:
+        options = {option: task.get(option) for option in (MODE, OWNER) if option in task}
+        if keep_digests:
+            options[DIGEST] = previous_report.get(DIGEST) if previous_report else None
+            options["keep_digest"] = True
+        return fetch_to_disk(client, task.get(KEY), task.get(TARGET), **options)
+
+
+def get_spool_path(report_path: Path) -> Path:
+    return report_path.parent.joinpath(SPOOL_DIRECTORY, f"{report_path.name}.gz")
+
+
+def group_tasks(tasks: Iterator[Tuple[Any, Status, Path]]) -> Iterator[List[Tuple[Any, Status, Path]]]:
+    """
+    Gathers consecutive tasks declaring the same group into batches that can be executed concurrently.
+    Consecutive fetches to disk without a group are batched together too, as long as their targets differ.
+    The other tasks form batches of their own.
 
-    return {KEY: key, TARGET: target, STATUS: status, OUTPUT: output}
+    :param tasks: the tasks, their Status and report Path, as yielded by recursive_fetch_script
+    :return: the batches of tasks, their Status and report Path
+    """
+
+    batch, batch_group, targets = [], None, set()
+    for item in tasks:
+        task = item[0]
+        group = task.get(GROUP, FETCH_TO_DISK_BATCH if is_fetch_to_disk(task) else None) if isinstance(task, dict) else None
+        if batch and (group is None or group != batch_group or group is FETCH_TO_DISK_BATCH and task.get(TARGET) in targets):
+            yield batch
+            batch, targets = [], set()
+
+        batch.append(item)
+        batch_group = group
+        if group is FETCH_TO_DISK_BATCH:
+            targets.add(task.get(TARGET))
+
+    if batch:
+        yield batch
 
 
-def run(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, key: str, attempts: int = ATTEMPTS_DEFAULT, pause: float = PAUSE_DEFAULT, **_) -> None:
+def run(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, key: Union[str, List[str]], attempts: int = ATTEMPTS_DEFAULT, pause: float = PAUSE_DEFAULT, prefetch: int = PREFETCH_DEFAULT, persistent_cache: int = PERSISTENT_CACHE_DEFAULT, persistent_cache_size: int = PERSISTENT_CACHE_SIZE_DEFAULT, offline: bool = False, max_stale: Optional[int] = None, jobs: int = JOBS_DEFAULT, keep_digests: bool = False, output_head: Optional[int] = None, output_tail: Optional[int] = None, output_max_bytes: Optional[int] = None, spool_output: bool = False, backoff: float = 1, max_pause: Optional[float] = None, jitter: float = 0, deadline: Optional[float] = None, retry_on_exit_codes: Optional[List[int]] = None, retry_on_patterns: Optional[List[str]] = None, timeout: Optional[float] = None, grace_period: float = GRACE_PERIOD_DEFAULT, live_output: bool = False, persistent_shell: bool = False, journal_fsync: Fsync = Fsync.ALWAYS, journal_commit_interval: float = COMMIT_INTERVAL_DEFAULT, compress_reports: Compression = Compression.NONE, **_) -> None:
     """
     Fetches a script from the key-value server and executes its tasks.
     Execution reports are written after each task.
     On failure, the output is displayed and the loop stops.
     Should you run the script again, successful tasks will be skipped.
+    Commands in their dictionary form can declare guards (see check_guards), in which case they are only executed if their effect isn't already there, otherwise they are reported as "satisfied" and skipped from then on.
+    Several processes can execute scripts with the same reports' directory at once: each task is executed under a lock, and a task being executed by another process is waited for, then skipped if it succeeded.
+    With jobs > 1, consecutive tasks declaring the same group, as well as consecutive fetches to disk, are executed concurrently with a shared client, and the loop stops after a batch with a failure.
+    Several scripts can be given, in which case they are executed concurrently (each with up to "jobs" tasks at once) with a shared client and reports, a task appearing in more than one being executed only once, and a summary of their outcomes is displayed at the end.
+    On KeyboardInterrupt (e.g. Ctrl-C), the commands being executed are killed and the execution stops.
 
     :param url: (zebr0) URL of the key-value server, defaults to https://hub.zebr0.io
     :param levels: (zebr0) levels of specialization (e.g. ["mattermost", "production"] for a <project>/<environment>/<key> structure), defaults to []
     :param cache: (zebr0) in seconds, the duration of the cache of http responses, defaults to 300 seconds
     :param configuration_file: (zebr0) path to the configuration file, defaults to /etc/zebr0.conf for a system-wide configuration
     :param reports_path: Path to the reports' directory
-    :param key: the script's key
+    :param key: the script's key, or a list of keys
     :param attempts: maximum number of attempts before reporting a failure
     :param pause: delay in seconds between two attempts
+    :param prefetch: maximum number of scripts fetched concurrently, 1 disables prefetching
+    :param persistent_cache: in seconds, the duration of the persistent cache of fetched values, 0 disables it
+    :param persistent_cache_size: in bytes, the maximum total size of the persistent cache
+    :param offline: if True, values are only ever served from the persistent cache
+    :param max_stale: in seconds, how long after its expiry a cached value can still be served when the server can't be reached, None for no limit
+    :param jobs: maximum number of tasks executed concurrently
+    :param keep_digests: whether to keep the targets' digest in the reports of the fetches to disk
+    :param output_head: maximum number of lines kept at the beginning of the commands' output, None for no limit
+    :param output_tail: maximum number of lines kept at the end of the commands' output, None for no limit
+    :param output_max_bytes: maximum number of bytes of the commands' output kept in the reports, None for no limit
+    :param spool_output: whether to spool the whole output of the commands into gzip-compressed files next to the reports
+    :param backoff: factor applied to the delay between two attempts after each failure
+    :param max_pause: maximum delay in seconds between two attempts, None for no limit
+    :param jitter: ratio of random variation applied to the delays between attempts (e.g. 0.2 for +/- 20%)
+    :param deadline: maximum duration in seconds of all the attempts of a command, None for no limit
+    :param retry_on_exit_codes: if set, only failures with one of these exit codes are retried
+    :param retry_on_patterns: if set, only failures whose output matches one of these regular expressions are retried
+    :param timeout: in seconds, the maximum duration of each attempt of a command, None for no limit
+    :param grace_period: in seconds, the delay given to a timed out command to terminate before it is killed for good
+    :param live_output: whether to print the commands' output as it comes, each line prefixed with its command, instead of a progress bar
+    :param persistent_shell: whether to execute the commands in long-lived shells instead of a new shell each, falling back to new shells if they fail
+    :param journal_fsync: the fsync policy of the writes to a journal of reports
+    :param journal_commit_interval: in seconds, the maximum delay between two fsyncs of a journal with the "interval" policy
+    :param compress_reports: the Compression of the reports written
     """
 
     reports_path.mkdir(parents=True, exist_ok=True)  # make sure the parent directory exists
 
-    client = zebr0.Client(url, levels, cache, configuration_file)
-    for task, status, report_path in recursive_fetch_script(client, key, reports_path):
-        if status == Status.SUCCESS:
-            print("skipping:", json.dumps(task))
-            continue
+    keys = [key] if isinstance(key, str) else key
+    store = open_store(reports_path, journal_fsync, journal_commit_interval, compress_reports)
+    client = build_client(url, levels, cache, configuration_file, reports_path, persistent_cache, persistent_cache_size, offline, max_stale)
+    execute = build_task_executor(attempts, pause, keep_digests, output_head, output_tail, output_max_bytes, spool_output, backoff, max_pause, jitter, deadline, retry_on_exit_codes, retry_on_patterns, timeout, grace_period, live_output, persistent_shell)
+
+    if len(keys) == 1:
+        with lock_reports(reports_path):
+            run_script(client, store, keys[0], reports_path, prefetch, jobs, execute, SharedTasks(), print)
+        return
+
+    shared = SharedTasks()
+    with lock_reports(reports_path), futures.ThreadPoolExecutor(max_workers=len(keys)) as executor, interruptible(executor):
+        pipelines = [executor.submit(run_script, client, store, key, reports_path, prefetch, jobs, execute, shared, functools.partial(print, f"[{key}]")) for key in keys]
+        outcomes = [pipeline.result() for pipeline in pipelines]
+
+    print("summary:")
+    for key, (status, executed, skipped, failed_task) in zip(keys, outcomes):
+        print(f"{key}: {status.value}, {executed} executed, {skipped} skipped" + (f", failed on {json.dumps(failed_task)}" if failed_task is not None else ""))
+
+
+def build_task_executor(attempts: int = ATTEMPTS_DEFAULT, pause: float = PAUSE_DEFAULT, keep_digests: bool = False, output_head: Optional[int] = None, output_tail: Optional[int] = None, output_max_bytes: Optional[int] = None, spool_output: bool = False, backoff: float = 1, max_pause: Optional[float] = None, jitter: float = 0, deadline: Optional[float] = None, retry_on_exit_codes: Optional[List[int]] = None, retry_on_patterns: Optional[List[str]] = None, timeout: Optional[float] = None, grace_period: float = GRACE_PERIOD_DEFAULT, live_output: bool = False, persistent_shell: bool = False, **_) -> Callable[..., dict]:
+    """
+    :return: execute_task with the given execution options (see run()), to be called with the client, the task and its report's path
+    """
+
+    sink = PrefixSink() if live_output else None
+    policy = RetryPolicy(attempts, pause, backoff, max_pause, jitter, deadline, retry_on_exit_codes, retry_on_patterns)
+    return functools.partial(execute_task, policy=policy, keep_digests=keep_digests, output_head=output_head, output_tail=output_tail, output_max_bytes=output_max_bytes, spool_output=spool_output, timeout=timeout, grace_period=grace_period, sink=sink, workers=ShellWorkers() if persistent_shell else None)
+
 
-        print("executing:", json.dumps(task))
-        report = execute(task, attempts, pause) if isinstance(task, str) else fetch_to_disk(client, **task)
-        report_path.write_text(json.dumps(report, indent=2), encoding=zebr0.ENCODING)
+class SharedTasks:
+    """
+    Makes sure that a task appearing in several scripts executed at once is executed only once, the other scripts waiting for its report.
+    """
 
-        if report.get(STATUS) == Status.SUCCESS:
-            print("success!")
-            continue
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.futures = {}
 
-        print("error:", json.dumps(report.get(OUTPUT), indent=2))
-        break
+    def claim(self, report_path: Path, submit: Callable[[], futures.Future]) -> Tuple[futures.Future, bool]:
+        """
+        :param report_path: Path to the task's report, which identifies it
+        :param submit: submits the task for execution, if it hasn't been yet
+        :return: the Future of the task's report (along with whether it was executed by this process), and whether the caller submitted it
+        """
 
+        with self.lock:
+            if report_path in self.futures:
+                return self.futures.get(report_path), False
+            future = self.futures[report_path] = submit()
+            return future, True
 
-def log(reports_path: Path, **_) -> None:
+
+def run_script(client: zebr0.Client, store: ReportStore, key: str, reports_path: Path, prefetch: int, jobs: int, execute: Callable[..., dict], shared: SharedTasks, say: Callable[..., None], stop: Optional[threading.Event] = None) -> Tuple[Status, int, int, Any]:
     """
-    Displays a time-ordered list of the report files and their content (minus the output).
+    Executes the tasks of a script, see run().
 
+    :param client: zebr0 Client to the key-value server
+    :param store: the ReportStore the reports are written into
+    :param key: the script's key
     :param reports_path: Path to the reports' directory
+    :param prefetch: maximum number of scripts fetched concurrently, 1 disables prefetching
+    :param jobs: maximum number of tasks executed concurrently
+    :param execute: executes a task, given the client, the task and its report's path (see execute_task)
+    :param shared: the tasks shared with the other scripts executed at once
+    :param say: the function used to print messages
+    :param stop: optional Event that, when set, stops the execution before the next batch of tasks
+    :return: the script's status (pending if stopped), its number of executed and skipped tasks, and the task that failed if any
     """
 
-    if not reports_path.exists():
-        return
+    def execute_locked(task: Any, report_path: Path) -> Tuple[dict, bool]:
+        """
+        Executes a task and writes its report under the task's lock, so that another process can't execute it at the same time.
+        If the lock is held by another process, it is waited for.
+        Either way, the task's status is read again once the lock is acquired, as it may have been executed by another process since the script was fetched, and it is only executed if it hasn't succeeded meanwhile.
+
+        :return: the task's report, and whether this process executed it
+        """
+
+        lock = FileLock(reports_path.joinpath(LOCKS_DIRECTORY, report_path.name))
+        if not lock.acquire(blocking=False):
+            say("waiting for another process executing:", json.dumps(task))
+            lock.acquire()
+
+        try:
+            report = store.read(report_path.name)
+            if report and report.get(STATUS) in DONE:
+                return report, False
+
+            report = execute(client, task, report_path=report_path, previous_report=report)
+            store.write(report_path, report, key)
+            return report, True
+        finally:
+            lock.release()
+
+    def submit(task: Any, report_path: Path) -> futures.Future:
+        say("executing:", json.dumps(task))  # before the task's own messages
+        return executor.submit(execute_locked, task, report_path)
+
+    tasks = recursive_fetch_script(client, key, reports_path, prefetch, None, True)
+    batches = group_tasks(tasks) if jobs > 1 else ([item] for item in tasks)
+    executed, skipped = 0, 0
+
+    with futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor, interruptible(executor):
+        for batch in batches:
+            if stop and stop.is_set():
+                return Status.PENDING, executed, skipped, None
+
+            submitted = []
+            for task, status, report_path in batch:
+                if status in DONE:
+                    say("skipping:", json.dumps(task))
+                    skipped += 1
+                    continue
+
+                future, owner = shared.claim(report_path, functools.partial(submit, task, report_path))
+                if not owner:
+                    say("already executing for another script:", json.dumps(task))
+                submitted.append((task, future, owner))
 
-    def get_mtime(path):
-        return path.stat().st_mtime
+            failed_task = None
+            for task, future, owner in submitted:  # the whole batch is waited for, even after a failure
+                report, executed_here = future.result()
+                if owner and executed_here:
+                    executed += 1
+                else:
+                    skipped += 1
 
-    for file in filter(lambda p: p.is_file(), sorted(reports_path.iterdir(), key=get_mtime)):
-        mtime = datetime.datetime.fromtimestamp(get_mtime(file)).strftime("%c")
+                if report.get(STATUS) in DONE:
+                    say(f"{Status(report.get(STATUS)).value}!" if len(submitted) == 1 else f"{Status(report.get(STATUS)).value}: {json.dumps(task)}")
+                else:
+                    if len(submitted) > 1:
+                        say("failure:", json.dumps(task))
+                    say("error:", json.dumps(report.get(OUTPUT), indent=2))
+                    failed_task = task if failed_task is None else failed_task
 
-        content = json.loads(file.read_text(encoding=zebr0.ENCODING))
-        content.pop(OUTPUT)
+            if failed_task is not None:
+                return Status.FAILURE, executed, skipped, failed_task
 
-        print(file.name, mtime, json.dumps(content))
+    return Status.SUCCESS, executed, skipped, None
 
 
-def debug(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, key: str, **_) -> None:
+def watch(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, key: str, interval: float = INTERVAL_DEFAULT, splay: float = 0, prefetch: int = PREFETCH_DEFAULT, persistent_cache: int = PERSISTENT_CACHE_DEFAULT, persistent_cache_size: int = PERSISTENT_CACHE_SIZE_DEFAULT, offline: bool = False, max_stale: Optional[int] = None, jobs: int = JOBS_DEFAULT, journal_fsync: Fsync = Fsync.ALWAYS, journal_commit_interval: float = COMMIT_INTERVAL_DEFAULT, compress_reports: Compression = Compression.NONE, **options) -> None:
+    """
+    Polls a script and its included scripts on the key-value server, and executes its tasks whenever they change, until SIGTERM or SIGINT.
+    The client and the parsed scripts are kept in memory between two polls, and the tasks are only walked if a script's content changed since the last successful execution, or if it failed.
+    On SIGTERM or SIGINT, the current task is completed before exiting.
+    Errors of the key-value server, be it while polling or executing, are displayed and the script is polled again at the next interval.
+
+    :param url: (zebr0) URL of the key-value server, defaults to https://hub.zebr0.io
+    :param levels: (zebr0) levels of specialization (e.g. ["mattermost", "production"] for a <project>/<environment>/<key> structure), defaults to []
+    :param cache: (zebr0) in seconds, the duration of the cache of http responses, defaults to 300 seconds
+    :param configuration_file: (zebr0) path to the configuration file, defaults to /etc/zebr0.conf for a system-wide configuration
+    :param reports_path: Path to the reports' directory
+    :param key: the script's key
+    :param interval: in seconds, the delay between two polls
+    :param splay: in seconds, the maximum random delay added to each interval, so that a fleet of hosts doesn't poll in lockstep
+    :param prefetch: maximum number of scripts fetched concurrently, 1 disables prefetching
+    :param persistent_cache: in seconds, the duration of the persistent cache of fetched values, 0 disables it
+    :param persistent_cache_size: in bytes, the maximum total size of the persistent cache
+    :param offline: if True, values are only ever served from the persistent cache
+    :param max_stale: in seconds, how long after its expiry a cached value can still be served when the server can't be reached, None for no limit
+    :param jobs: maximum number of tasks executed concurrently
+    :param journal_fsync: the fsync policy of the writes to a journal of reports
+    :param journal_commit_interval: in seconds, the maximum delay between two fsyncs of a journal with the "interval" policy
+    :param compress_reports: the Compression of the reports written
+    :param options: the execution options, see run()
+    """
+
+    reports_path.mkdir(parents=True, exist_ok=True)  # make sure the parent directory exists
+
+    store = open_store(reports_path, journal_fsync, journal_commit_interval, compress_reports)
+    client = build_client(url, levels, cache, configuration_file, reports_path, persistent_cache, persistent_cache_size, offline, max_stale)
+    parsed_scripts = ParsedScriptCache(reports_path.joinpath(CACHE_DIRECTORY, PARSED_DIRECTORY))
+    execute = build_task_executor(**options)
+
+    stop = threading.Event()
+    handlers = {sig: signal.signal(sig, lambda *_: stop.set()) for sig in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        applied = None  # the fingerprint of the scripts last executed successfully
+        while not stop.is_set():
+            try:
+                values = fetch_include_graph(client, key, prefetch, parsed_scripts)
+            except OSError as error:
+                print("error: key-value server unreachable:", error)
+            else:
+                fingerprint = hashlib.sha256(json.dumps(values, sort_keys=True).encode(ENCODING)).hexdigest()
+                if fingerprint != applied:
+                    print(now(), "executing script:", key)
+                    try:
+                        with lock_reports(reports_path):
+                            status, *_ = run_script(SnapshotClient(client, values), store, key, reports_path, prefetch, jobs, execute, SharedTasks(), print, stop)
+                        applied = fingerprint if status == Status.SUCCESS else None
+                    except OSError as error:  # executed again at the next poll
+                        print("error:", error)
+                        applied = None
+
+            stop.wait(interval + random.uniform(0, splay))
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+
+
+def parse_time(value: str) -> float:
+    """
+    Parses a point in time, either a duration before now (e.g. "90s", "30m", "1h", "2d") or an ISO 8601 date (e.g. "2021-01-09" or "2021-01-09T11:00").
+
+    :param value: the string to parse
+    :return: the corresponding timestamp
+    """
+
+    match = re.fullmatch(r"(\d+)([smhd])", value)
+    if match:
+        return time.time() - int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def log(reports_path: Path, since: Optional[float] = None, until: Optional[float] = None, status: Optional[Status] = None, limit: Optional[int] = None, key: Optional[str] = None, **_) -> None:
+    """
+    Displays a time-ordered list of the report files and their content (minus the output and the details of the attempts).
+    Reports are streamed from the store's index, without parsing their output.
+
+    :param reports_path: Path to the reports' directory
+    :param since: if set, only the reports written since this timestamp
+    :param until: if set, only the reports written until this timestamp
+    :param status: if set, only the reports with this status
+    :param limit: if set, only this number of the most recent reports
+    :param key: if set, only the reports written while executing the script with this key
+    """
+
+    for md5, timestamp, summary in open_store(reports_path).summaries(since, until, status, key, limit):
+        mtime = datetime.datetime.fromtimestamp(timestamp).strftime("%c")
+        print(md5, mtime, json.dumps(summary))
+
+
+def profile(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, key: str, prefetch: int = PREFETCH_DEFAULT, persistent_cache: int = PERSISTENT_CACHE_DEFAULT, persistent_cache_size: int = PERSISTENT_CACHE_SIZE_DEFAULT, offline: bool = False, max_stale: Optional[int] = None, limit: Optional[int] = None, **_) -> None:
+    """
+    Fetches a script from the key-value server and ranks its tasks from the slowest to the fastest, according to the durations of all their known executions.
+    With the sqlite backend, every execution is known, otherwise only the last one.
+
+    :param url: (zebr0) URL of the key-value server, defaults to https://hub.zebr0.io
+    :param levels: (zebr0) levels of specialization (e.g. ["mattermost", "production"] for a <project>/<environment>/<key> structure), defaults to []
+    :param cache: (zebr0) in seconds, the duration of the cache of http responses, defaults to 300 seconds
+    :param configuration_file: (zebr0) path to the configuration file, defaults to /etc/zebr0.conf for a system-wide configuration
+    :param reports_path: Path to the reports' directory
+    :param key: the script's key
+    :param prefetch: maximum number of scripts fetched concurrently, 1 disables prefetching
+    :param persistent_cache: in seconds, the duration of the persistent cache of fetched values, 0 disables it
+    :param persistent_cache_size: in bytes, the maximum total size of the persistent cache
+    :param offline: if True, values are only ever served from the persistent cache
+    :param max_stale: in seconds, how long after its expiry a cached value can still be served when the server can't be reached, None for no limit
+    :param limit: if set, only this number of the slowest tasks
+    """
+
+    store = open_store(reports_path)
+    client = build_client(url, levels, cache, configuration_file, reports_path, persistent_cache, persistent_cache_size, offline, max_stale)
+
+    ranking = []
+    for task, _, report_path in recursive_fetch_script(client, key, reports_path, prefetch):
+        durations = [report.get(DURATION) for _, _, report in store.history(report_path.name) if report.get(DURATION) is not None]
+        if durations:
+            ranking.append((sum(durations) / len(durations), max(durations), len(durations), task))
+
+    for mean, maximum, count, task in sorted(ranking, key=lambda r: r[0], reverse=True)[:limit]:
+        print(f"{mean:.3f}s mean, {maximum:.3f}s max, {count} executions: {json.dumps(task)}")
+
+
+def debug(url: str, levels: Optional[List[str]], cache: int, configuration_file: Path, reports_path: Path, key: str, prefetch: int = PREFETCH_DEFAULT, persistent_cache: int = PERSISTENT_CACHE_DEFAULT, persistent_cache_size: int = PERSISTENT_CACHE_SIZE_DEFAULT, offline: bool = False, max_stale: Optional[int] = None, keep_digests: bool = False, output_head: Optional[int] = None, output_tail: Optional[int] = None, output_max_bytes: Optional[int] = None, spool_output: bool = False, timeout: Optional[float] = None, grace_period: float = GRACE_PERIOD_DEFAULT, journal_fsync: Fsync = Fsync.ALWAYS, journal_commit_interval: float = COMMIT_INTERVAL_DEFAULT, compress_reports: Compression = Compression.NONE, **_) -> None:
     """
     Fetches a script from the key-value server and executes its tasks through user interaction.
     Useful for debugging scripts in a test environment.
@@ -216,44 +2564,107 @@ def debug(url: str, levels: Optional[List[str]], cache: int, configuration_file:
     :param configuration_file: (zebr0) path to the configuration file, defaults to /etc/zebr0.conf for a system-wide configuration
     :param reports_path: Path to the reports' directory
     :param key: the script's key
+    :param prefetch: maximum number of scripts fetched concurrently, 1 disables prefetching
+    :param persistent_cache: in seconds, the duration of the persistent cache of fetched values, 0 disables it
+    :param persistent_cache_size: in bytes, the maximum total size of the persistent cache
+    :param offline: if True, values are only ever served from the persistent cache
+    :param max_stale: in seconds, how long after its expiry a cached value can still be served when the server can't be reached, None for no limit
+    :param keep_digests: whether to keep the targets' digest in the reports of the fetches to disk
+    :param output_head: maximum number of lines kept at the beginning of the commands' output, None for no limit
+    :param output_tail: maximum number of lines kept at the end of the commands' output, None for no limit
+    :param output_max_bytes: maximum number of bytes of the commands' output kept in the reports, None for no limit
+    :param spool_output: whether to spool the whole output of the commands into gzip-compressed files next to the reports
+    :param timeout: in seconds, the maximum duration of a command, None for no limit
+    :param grace_period: in seconds, the delay given to a timed out command to terminate before it is killed for good
+    :param journal_fsync: the fsync policy of the writes to a journal of reports
+    :param journal_commit_interval: in seconds, the maximum delay between two fsyncs of a journal with the "interval" policy
+    :param compress_reports: the Compression of the reports written
     """
 
     reports_path.mkdir(parents=True, exist_ok=True)  # make sure the parent directory exists
 
-    client = zebr0.Client(url, levels, cache, configuration_file)
-    for task, status, report_path in recursive_fetch_script(client, key, reports_path):
-        if status == Status.SUCCESS:
-            print("already executed:", json.dumps(task))
-            print("(s)kip, (e)xecute anyway, or (q)uit?")
-        else:
-            print("next:", json.dumps(task))
-            print("(e)xecute, (s)kip, or (q)uit?")
-
-        choice = sys.stdin.readline().strip()
-        if choice == "e":
-            report = execute(task, 1) if isinstance(task, str) else fetch_to_disk(client, **task)
-            print("success!" if report.get(STATUS) == Status.SUCCESS else f"error: {json.dumps(report.get(OUTPUT), indent=2)}")
+    store = open_store(reports_path, journal_fsync, journal_commit_interval, compress_reports)
+    client = build_client(url, levels, cache, configuration_file, reports_path, persistent_cache, persistent_cache_size, offline, max_stale)
+    with lock_reports(reports_path):
+        for task, status, report_path in recursive_fetch_script(client, key, reports_path, prefetch, None, True):
+            if status in DONE:
+                print("already executed:", json.dumps(task))
+                print("(s)kip, (e)xecute anyway, or (q)uit?")
+            else:
+                print("next:", json.dumps(task))
+                print("(e)xecute, (s)kip, or (q)uit?")
 
-            print("write report? (y)es or (n)o")
             choice = sys.stdin.readline().strip()
-            if choice == "y":
-                report_path.write_text(json.dumps(report, indent=2), encoding=zebr0.ENCODING)
-        elif not choice == "s":
-            break
+            if choice == "e":
+                with FileLock(reports_path.joinpath(LOCKS_DIRECTORY, report_path.name)):
+                    report = execute_task(client, task, RetryPolicy(attempts=1), keep_digests, report_path, output_head, output_tail, output_max_bytes, spool_output, timeout, grace_period, previous_report=store.read(report_path.name) if keep_digests else None)
+                    print(f"{Status(report.get(STATUS)).value}!" if report.get(STATUS) in DONE else f"error: {json.dumps(report.get(OUTPUT), indent=2)}")
+
+                    print("write report? (y)es or (n)o")
+                    choice = sys.stdin.readline().strip()
+                    if choice == "y":
+                        store.write(report_path, report, key)
+            elif not choice == "s":
+                break
+
+
+def build_argument_parser(**kwargs) -> argparse.ArgumentParser:
+    """
+    Builds the same argument parser as zebr0.build_argument_parser, without importing zebr0 (and its http stack) at startup.
+
+    :param kwargs: the parameters of argparse.ArgumentParser
+    :return: the argument parser, with zebr0's arguments
+    """
+
+    argparser = argparse.ArgumentParser(**kwargs)
+    argparser.add_argument("-u", "--url", help="URL of the key-value server, defaults to https://hub.zebr0.io", metavar="<url>")
+    argparser.add_argument("-l", "--levels", nargs="*", help='levels of specialization (e.g. "mattermost production" for a <project>/<environment>/<key> structure), defaults to ""', metavar="<level>")
+    argparser.add_argument("-c", "--cache", type=int, help="in seconds, the duration of the cache of http responses, defaults to 300 seconds", metavar="<duration>")
+    argparser.add_argument("-f", "--configuration-file", type=Path, default=CONFIGURATION_FILE_DEFAULT, help=f"path to the configuration file, defaults to {CONFIGURATION_FILE_DEFAULT} for a system-wide configuration", metavar="<path>")
+    return argparser
+
+
+def add_execution_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the arguments of the tasks' execution, shared by the "run" and "watch" subcommands.
+    """
+
+    parser.add_argument("--attempts", type=int, default=ATTEMPTS_DEFAULT, help=f"maximum number of attempts before reporting a failure, defaults to {ATTEMPTS_DEFAULT}", metavar="<value>")
+    parser.add_argument("--pause", type=float, default=PAUSE_DEFAULT, help=f"delay in seconds between two attempts, defaults to {PAUSE_DEFAULT}", metavar="<value>")
+    parser.add_argument("--backoff", type=float, default=1, help="factor applied to the delay between two attempts after each failure, defaults to 1 (fixed delay)", metavar="<value>")
+    parser.add_argument("--max-pause", type=float, help="maximum delay in seconds between two attempts, defaults to no limit", metavar="<value>")
+    parser.add_argument("--jitter", type=float, default=0, help="ratio of random variation applied to the delays between attempts (e.g. 0.2 for +/- 20%%), defaults to 0", metavar="<value>")
+    parser.add_argument("--deadline", type=float, help="maximum duration in seconds of all the attempts of a command, defaults to no limit", metavar="<value>")
+    parser.add_argument("--retry-on-exit-codes", type=int, nargs="+", help="only retry the failures with one of these exit codes, defaults to retrying every failure", metavar="<code>")
+    parser.add_argument("--retry-on-patterns", nargs="+", help="only retry the failures whose output matches one of these regular expressions, defaults to retrying every failure", metavar="<pattern>")
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS_DEFAULT, help=f"maximum number of tasks of a same group, or consecutive fetches to disk, executed concurrently, defaults to {JOBS_DEFAULT}", metavar="<value>")
+    parser.add_argument("--keep-digests", action="store_true", help="keep the targets' digest in the reports of the fetches to disk, so that later executions can tell an unchanged target without reading it")
+    parser.add_argument("--output-head", type=int, help="maximum number of lines kept at the beginning of the commands' output, defaults to no limit", metavar="<lines>")
+    parser.add_argument("--output-tail", type=int, help="maximum number of lines kept at the end of the commands' output, defaults to no limit", metavar="<lines>")
+    parser.add_argument("--output-max-bytes", type=int, help="maximum number of bytes of the commands' output kept in the reports, defaults to no limit", metavar="<size>")
+    parser.add_argument("--spool-output", action="store_true", help="spool the whole output of the commands into gzip-compressed files next to the reports")
+    parser.add_argument("--timeout", type=float, help="maximum duration in seconds of each attempt of a command, after which it is killed along with its descendants, defaults to no limit", metavar="<duration>")
+    parser.add_argument("--grace-period", type=float, default=GRACE_PERIOD_DEFAULT, help=f"delay in seconds between the SIGTERM and the SIGKILL sent to a timed out command, defaults to {GRACE_PERIOD_DEFAULT}", metavar="<duration>")
+    parser.add_argument("--persistent-shell", action="store_true", help="execute the commands in long-lived shells instead of a new shell each, which is faster for many small commands (the commands with a timeout still get their own)")
+    parser.add_argument("--live-output", action="store_true", help="print the commands' output as it comes, each line prefixed with its command, instead of a progress bar")
 
 
 def main(args: Optional[List[str]] = None) -> None:
     """
-    usage: [-h] [-u <url>] [-l [<level> [<level> ...]]] [-c <duration>] [-f <path>] [-r <path>] {show,run,log,debug} ...
+    usage: [-h] [-u <url>] [-l [<level> [<level> ...]]] [-c <duration>] [-f <path>] [-r <path>] [-p <value>] [--persistent-cache <duration>] [--persistent-cache-size <size>] [--offline] [--max-stale <duration>] [--journal-fsync {always,interval,never}] [--journal-commit-interval <duration>] [--compress-reports {none,gzip,zstd}] {show,run,watch,log,debug,profile,migrate,gc} ...
 
     Minimalist local deployment based on zebr0 key-value system.
 
     positional arguments:
-      {show,run,log,debug}
+      {show,run,watch,log,debug,profile,migrate,gc}
         show                fetches a script from the key-value server and displays its tasks along with their current status
         run                 fetches a script from the key-value server and executes its tasks
-        log                 displays a time-ordered list of the report files and their content (minus the output)
+        watch               polls a script on the key-value server and executes its tasks whenever it changes
+        log                 displays a time-ordered list of the report files and their content (minus the output and the details of the attempts)
         debug               fetches a script from the key-value server and executes its tasks through user interaction
+        profile             fetches a script from the key-value server and ranks its tasks from the slowest to the fastest
+        migrate             moves the reports to another backend: a sqlite database, an append-only journal, or plain json files (the default)
+        gc                  removes the reports of the tasks that don't appear anymore in the given scripts
 
     optional arguments:
       -h, --help            show this help message and exit
@@ -267,10 +2678,33 @@ def main(args: Optional[List[str]] = None) -> None:
                             path to the configuration file, defaults to /etc/zebr0.conf for a system-wide configuration
       -r <path>, --reports-path <path>
                             path to the reports' directory, defaults to /var/zebr0/script/reports
+      -p <value>, --prefetch <value>
+                            maximum number of scripts fetched concurrently, defaults to 1 (no prefetching)
+      --persistent-cache <duration>
+                            in seconds, the duration of the persistent cache of fetched values in the reports' directory, defaults to 0 (disabled)
+      --persistent-cache-size <size>
+                            in bytes, the maximum total size of the persistent cache, defaults to 67108864
+      --offline             only use the values stored in the persistent cache, without any round-trip to the key-value server
+      --max-stale <duration>
+                            in seconds, how long after its expiry a cached value can still be used when the key-value server can't be reached, defaults to no limit
+      --journal-fsync {always,interval,never}
+                            when the writes to a journal of reports are synced to the disk: after each report, every "commit interval", or never, defaults to always
+      --journal-commit-interval <duration>
+                            in seconds, the maximum delay between two syncs of a journal of reports with the "interval" policy, defaults to 1
+      --compress-reports {none,gzip,zstd}
+                            compression of the reports written as plain json files or into a sqlite database, the reports being read whatever their compression, defaults to none (zstd requires the zstandard package)
     """
 
-    argparser = zebr0.build_argument_parser(description="Minimalist local deployment based on zebr0 key-value system.")
-    argparser.add_argument("-r", "--reports-path", type=Path, default=Path("/var/zebr0/script/reports"), help="path to the reports' directory, defaults to /var/zebr0/script/reports", metavar="<path>")
+    argparser = build_argument_parser(description="Minimalist local deployment based on zebr0 key-value system.")
+    argparser.add_argument("-r", "--reports-path", type=Path, default=REPORTS_PATH_DEFAULT, help=f"path to the reports' directory, defaults to {REPORTS_PATH_DEFAULT}", metavar="<path>")
+    argparser.add_argument("-p", "--prefetch", type=int, default=PREFETCH_DEFAULT, help=f"maximum number of scripts fetched concurrently, defaults to {PREFETCH_DEFAULT} (no prefetching)", metavar="<value>")
+    argparser.add_argument("--persistent-cache", type=int, default=PERSISTENT_CACHE_DEFAULT, help=f"in seconds, the duration of the persistent cache of fetched values in the reports' directory, defaults to {PERSISTENT_CACHE_DEFAULT} (disabled)", metavar="<duration>")
+    argparser.add_argument("--persistent-cache-size", type=int, default=PERSISTENT_CACHE_SIZE_DEFAULT, help=f"in bytes, the maximum total size of the persistent cache, defaults to {PERSISTENT_CACHE_SIZE_DEFAULT}", metavar="<size>")
+    argparser.add_argument("--offline", action="store_true", help="only use the values stored in the persistent cache, without any round-trip to the key-value server")
+    argparser.add_argument("--max-stale", type=int, help="in seconds, how long after its expiry a cached value can still be used when the key-value server can't be reached, defaults to no limit", metavar="<duration>")
+    argparser.add_argument("--journal-fsync", type=Fsync, choices=list(Fsync), default=Fsync.ALWAYS, help='when the writes to a journal of reports are synced to the disk: after each report, every "commit interval", or never, defaults to always', metavar="{" + ",".join(fsync.value for fsync in Fsync) + "}")
+    argparser.add_argument("--journal-commit-interval", type=float, default=COMMIT_INTERVAL_DEFAULT, help=f'in seconds, the maximum delay between two syncs of a journal of reports with the "interval" policy, defaults to {COMMIT_INTERVAL_DEFAULT}', metavar="<duration>")
+    argparser.add_argument("--compress-reports", type=Compression, choices=list(Compression), default=Compression.NONE, help="compression of the reports written as plain json files or into a sqlite database, the reports being read whatever their compression, defaults to none (zstd requires the zstandard package)", metavar="{" + ",".join(compression.value for compression in Compression) + "}")
     subparsers = argparser.add_subparsers()
 
     show_parser = subparsers.add_parser("show", description="Fetches a script from the key-value server and displays its tasks along with their current status.",
@@ -280,19 +2714,64 @@ def main(args: Optional[List[str]] = None) -> None:
 
     run_parser = subparsers.add_parser("run", description="Fetches a script from the key-value server and executes its tasks. Execution reports are written after each task. On failure, the output is displayed and the loop stops. Should you run the script again, successful tasks will be skipped.",
                                        help="fetches a script from the key-value server and executes its tasks")
-    run_parser.add_argument("key", nargs="?", default="script", help="the script's key, defaults to 'script'")
-    run_parser.add_argument("--attempts", type=int, default=ATTEMPTS_DEFAULT, help=f"maximum number of attempts before reporting a failure, defaults to {ATTEMPTS_DEFAULT}", metavar="<value>")
-    run_parser.add_argument("--pause", type=float, default=PAUSE_DEFAULT, help=f"delay in seconds between two attempts, defaults to {PAUSE_DEFAULT}", metavar="<value>")
+    run_parser.add_argument("key", nargs="*", default="script", help="the scripts' keys, executed concurrently if several, defaults to 'script'")
+    add_execution_arguments(run_parser)
     run_parser.set_defaults(command=run)
 
-    log_parser = subparsers.add_parser("log", description="Displays a time-ordered list of the report files and their content (minus the output).",
-                                       help="displays a time-ordered list of the report files and their content (minus the output)")
+    watch_parser = subparsers.add_parser("watch", description="Polls a script and its included scripts on the key-value server, and executes its tasks whenever they change, until SIGTERM or SIGINT. On SIGTERM or SIGINT, the current task is completed before exiting.",
+                                         help="polls a script on the key-value server and executes its tasks whenever it changes")
+    watch_parser.add_argument("key", nargs="?", default="script", help="the script's key, defaults to 'script'")
+    watch_parser.add_argument("--interval", type=float, default=INTERVAL_DEFAULT, help=f"delay in seconds between two polls, defaults to {INTERVAL_DEFAULT}", metavar="<duration>")
+    watch_parser.add_argument("--splay", type=float, default=0, help="maximum random delay in seconds added to each interval, so that a fleet of hosts doesn't poll in lockstep, defaults to 0", metavar="<duration>")
+    add_execution_arguments(watch_parser)
+    watch_parser.set_defaults(command=watch)
+
+    log_parser = subparsers.add_parser("log", description="Displays a time-ordered list of the report files and their content (minus the output and the details of the attempts).",
+                                       help="displays a time-ordered list of the report files and their content (minus the output and the details of the attempts)")
+    log_parser.add_argument("--since", type=parse_time, help='only the reports written since then, either a duration (e.g. "30m", "1h", "2d") or an ISO 8601 date', metavar="<time>")
+    log_parser.add_argument("--until", type=parse_time, help='only the reports written until then, either a duration (e.g. "30m", "1h", "2d") or an ISO 8601 date', metavar="<time>")
+    log_parser.add_argument("--status", choices=[status.value for status in Status], help="only the reports with this status")
+    log_parser.add_argument("--limit", type=int, help="only this number of the most recent reports", metavar="<value>")
+    log_parser.add_argument("--key", help="only the reports written while executing the script with this key", metavar="<key>")
     log_parser.set_defaults(command=log)
 
     debug_parser = subparsers.add_parser("debug", description="Fetches a script from the key-value server and executes its tasks through user interaction. Useful for debugging scripts in a test environment.",
                                          help="fetches a script from the key-value server and executes its tasks through user interaction")
     debug_parser.add_argument("key", nargs="?", default="script", help="the script's key, defaults to 'script'")
+    debug_parser.add_argument("--keep-digests", action="store_true", help="keep the targets' digest in the reports of the fetches to disk, so that later executions can tell an unchanged target without reading it")
+    debug_parser.add_argument("--output-head", type=int, help="maximum number of lines kept at the beginning of the commands' output, defaults to no limit", metavar="<lines>")
+    debug_parser.add_argument("--output-tail", type=int, help="maximum number of lines kept at the end of the commands' output, defaults to no limit", metavar="<lines>")
+    debug_parser.add_argument("--output-max-bytes", type=int, help="maximum number of bytes of the commands' output kept in the reports, defaults to no limit", metavar="<size>")
+    debug_parser.add_argument("--spool-output", action="store_true", help="spool the whole output of the commands into gzip-compressed files next to the reports")
+    debug_parser.add_argument("--timeout", type=float, help="maximum duration in seconds of each attempt of a command, after which it is killed along with its descendants, defaults to no limit", metavar="<duration>")
+    debug_parser.add_argument("--grace-period", type=float, default=GRACE_PERIOD_DEFAULT, help=f"delay in seconds between the SIGTERM and the SIGKILL sent to a timed out command, defaults to {GRACE_PERIOD_DEFAULT}", metavar="<duration>")
     debug_parser.set_defaults(command=debug)
 
+    profile_parser = subparsers.add_parser("profile", description="Fetches a script from the key-value server and ranks its tasks from the slowest to the fastest, according to the durations of all their known executions. With the sqlite backend, every execution is known, otherwise only the last one.",
+                                           help="fetches a script from the key-value server and ranks its tasks from the slowest to the fastest")
+    profile_parser.add_argument("key", nargs="?", default="script", help="the script's key, defaults to 'script'")
+    profile_parser.add_argument("--limit", type=int, help="only this number of the slowest tasks", metavar="<value>")
+    profile_parser.set_defaults(command=profile)
+
+    migrate_parser = subparsers.add_parser("migrate", description="Moves the reports to another backend: a sqlite database, an append-only journal, or plain json files (the default). Only the current report of each task is exported.",
+                                           help="moves the reports to another backend: a sqlite database, an append-only journal, or plain json files (the default)")
+    migrate_parser.add_argument("backend", type=Backend, choices=list(Backend), help="the target backend", metavar="{" + ",".join(backend.value for backend in Backend) + "}")
+    migrate_parser.set_defaults(command=migrate)
+
+    gc_parser = subparsers.add_parser("gc", description="Removes the reports of the tasks that don't appear anymore in the given scripts, nor in the scripts they include. Without limits, every unreferenced report is removed.",
+                                      help="removes the reports of the tasks that don't appear anymore in the given scripts")
+    gc_parser.add_argument("key", nargs="*", default="script", help="the keys of the scripts whose reports are kept, defaults to 'script'")
+    gc_parser.add_argument("--older-than", type=parse_time, help='only remove the reports written before then, either a duration (e.g. "30m", "1h", "2d") or an ISO 8601 date', metavar="<time>")
+    gc_parser.add_argument("--keep", type=int, help="keep this number of the most recent unreferenced reports", metavar="<value>")
+    gc_parser.add_argument("--max-size", type=int, help="keep the most recent unreferenced reports up to this total size in bytes (as json)", metavar="<size>")
+    gc_parser.add_argument("--archive", type=Path, help="path to a gzip-compressed file of json lines the removed reports are appended to", metavar="<path>")
+    gc_parser.add_argument("--dry-run", action="store_true", help="only display the reports that would be removed")
+    gc_parser.set_defaults(command=gc)
+
     args = argparser.parse_args(args)
+    if args.compress_reports == Compression.ZSTD:
+        try:
+            importlib.import_module("zstandard")
+        except ImportError:
+            argparser.error("zstd compression requires the zstandard package")
     args.command(**vars(args))